@@ -1,31 +1,86 @@
 # Import packages --------------------------------------------
 
+import numpy as np
 import pandas as pd
 import pickle
+from functools import lru_cache
 
-from dash import Dash, html, dcc, callback, Output, Input
+from dash import Dash, html, dcc, dash_table, callback, callback_context, Output, Input, State
+from dash.exceptions import PreventUpdate
 from plotly.graph_objs import *
 import dash_bootstrap_components as dbc
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 
+from search_index import TypeaheadIndex
+
 
 # Data -------------------------------------------------------------
 # Access data from pkl files from data_for_dashboard.ipynb
-
-with open('topic_track_uris.pkl', 'rb') as f:
-    topic_tracks_dict = pickle.load(f)
-
-with open('all_tracks_dict.pkl', 'rb') as f:
-    all_tracks_dict = pickle.load(f)
-    
-with open('track_to_playlist_dict.pkl', 'rb') as f:
-    track_to_playlist_dict = pickle.load(f)
-
-playlists_songs_df = pd.read_pickle('playlists_songs_df.pkl')
-
-with open('all_playlist_recs.pkl', 'rb') as f:
-    all_playlist_recs_dict = pickle.load(f)
+# Each file is read the first time a callback needs it, not at import
+
+@lru_cache(maxsize=None)
+def load_artifact(filename):
+    if filename.endswith('_df.pkl'):
+        return pd.read_pickle(filename)
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+def topic_tracks_dict():
+    return load_artifact('topic_track_uris.pkl')
+
+def all_tracks_dict():
+    return load_artifact('all_tracks_dict.pkl')
+
+def track_to_playlist_dict():
+    return load_artifact('track_to_playlist_dict.pkl')
+
+def playlists_songs_df():
+    return load_artifact('playlists_songs_df.pkl')
+
+def all_playlist_recs_dict():
+    return load_artifact('all_playlist_recs.pkl')
+
+# Server-side search over song names, so the page never carries the full song list
+@lru_cache(maxsize=None)
+def song_index():
+    return TypeaheadIndex(all_tracks_dict().keys())
+
+# Same for playlist names, all_playlist_recs.pkl may hold every scored playlist (util/scoring.py)
+@lru_cache(maxsize=None)
+def playlist_index():
+    return TypeaheadIndex(all_playlist_recs_dict().keys())
+
+# Number of songs or playlists offered per keystroke
+SONG_MATCHES = 20
+
+# Playlist table: columns shown and rows per page
+TABLE_COLUMNS = ['Track Name', 'Artist Name', 'Album Name']
+TABLE_PAGE_SIZE = 15
+
+# Playlist rows grouped by playlist name, and each playlist's (start, end) row range
+@lru_cache(maxsize=None)
+def playlist_rows():
+    songs_df = playlists_songs_df().sort_values('Playlist Name', kind='stable')
+    names = songs_df['Playlist Name'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+    ends = np.r_[starts[1:], len(names)]
+    ranges = {name: (start, end) for name, start, end in zip(names[starts], starts, ends)}
+    return songs_df[TABLE_COLUMNS].reset_index(drop=True), ranges
+
+# Every playlist containing a song, keyed like all_tracks_dict ("Track by Artist"),
+# with the playlist from track_to_playlist_dict first
+@lru_cache(maxsize=None)
+def track_to_playlists():
+    songs_df = playlists_songs_df()
+    pairs = pd.DataFrame({'song': songs_df['Track Name'] + ' by ' + songs_df['Artist Name'],
+                          'playlist': songs_df['Playlist Name']}).drop_duplicates()
+    index = {song: [name] for song, name in track_to_playlist_dict().items()}
+    for song, name in zip(pairs['song'], pairs['playlist']):
+        names = index.setdefault(song, [])
+        if name not in names:
+            names.append(name)
+    return index
 
 
 # List of topics (for dropdown menu)
@@ -36,17 +91,12 @@ list_of_topics = [
     "Nostalgic Reflection on Life",
 ]
 
-# List of songs (for dropdown menu)
-list_of_songs = list(all_tracks_dict.keys())
-
-# List of playlist names (for dropdown menu)
-list_of_playlists = list(all_playlist_recs_dict.keys())
-
 
 
 # Initialize the app -----------------------------------------------
 app = Dash(
     __name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}],
+    suppress_callback_exceptions=True,  # the playlist table only exists once a song is chosen
 )
 app.title = "ML Final Project"
 
@@ -192,9 +242,9 @@ app.layout = dbc.Container([
                                     children=[
                                         # Dropdown for topics
                                         dcc.Dropdown(
-                                            list_of_songs,
+                                            [],
                                             id="songs-dropdown",
-                                            placeholder="Select a song",
+                                            placeholder="Type to search for a song",
                                             style={"width":"500px",'text-align': 'left',}
                                         )
                                     ],
@@ -223,9 +273,9 @@ app.layout = dbc.Container([
                                                 children=[
                                                     # Dropdown for topics
                                                     dcc.Dropdown(
-                                                        list_of_playlists,
+                                                        [],
                                                         id="playlists-dropdown-recs",
-                                                        placeholder="Select a playlist",
+                                                        placeholder="Type to search for a playlist",
                                                         style={"width":"300px",'text-align': 'left','margin': 'auto','margin-right': ' 50px'}
                                                     )
                                                 ],
@@ -268,7 +318,7 @@ app.layout = dbc.Container([
 )
 def update_top5_songs(topic):
     if topic: 
-        tracks = ['https://open.spotify.com/embed/track/'+ uri[14:] for uri in topic_tracks_dict[topic]]
+        tracks = ['https://open.spotify.com/embed/track/'+ uri[14:] for uri in topic_tracks_dict()[topic]]
 
         return html.Div([
                         html.H3("These are the top tracks associated with each topic:"),
@@ -279,6 +329,22 @@ def update_top5_songs(topic):
 
 
 # For "Choose A Song" section
+# Offer the best matches for what has been typed so far
+@callback(
+    Output(component_id="songs-dropdown", component_property="options"),
+    Input(component_id="songs-dropdown", component_property="search_value"),
+    State(component_id="songs-dropdown", component_property="value")
+)
+def update_song_options(search_value, song):
+    if not search_value:
+        raise PreventUpdate
+    matches = song_index().search(search_value, SONG_MATCHES)
+    # Keep the selected song among the options, or the dropdown clears it
+    if song and song not in matches:
+        matches.append(song)
+    return matches
+
+
 # Show a selected song once dropdown is selected
 @callback(
     Output(component_id="choose-song", component_property="children"),
@@ -286,26 +352,41 @@ def update_top5_songs(topic):
 )
 def show_selected_song(song):
     if song:
-        playlist_name = track_to_playlist_dict.get(song, None)
-        if playlist_name:
-            playlist_df = playlists_songs_df[playlists_songs_df['Playlist Name'] == playlist_name]
-
-            # Create table
-            column_widths = {'Track Name': '50%', 'Artist Name': '25%', 'Album Name': '25%'}
-            headers = [html.Th(col, style={'width':column_widths.get(col, 'auto')}) for col in ['Track Name', 'Artist Name', 'Album Name']]
-            header_row = html.Tr(headers)
-
-            # Create table rows
-            rows = [html.Tr([html.Td(playlist_df.iloc[i][col]) for col in ['Track Name', 'Artist Name', 'Album Name']]) for i in range(len(playlist_df))]
-
-            # Combine headers and rows into a table
+        playlist_names = track_to_playlists().get(song)
+        if playlist_names:
+            if len(playlist_names) == 1:
+                header = "We found your chosen song in this playlist: " + playlist_names[0]
+            else:
+                header = "We found your chosen song in " + str(len(playlist_names)) + " playlists. Pick one:"
+
+            # Table is empty here, update_playlist_page fills in one page at a time
             table = html.Div(
-                    [html.H3("We found your chosen song in this playlist: "+ playlist_name),
-                     html.P("You can scroll through the playlist here."),
-                        html.Div(
-                                html.Table([header_row]+ [*rows], 
-                                    style={'border': 'none', 'textAlign':'left',})
-                        ,style={'height': '300px', 'overflowY': 'scroll', 'width':'60%'})
+                    [html.H3(header),
+                     dcc.Dropdown(
+                         playlist_names,
+                         playlist_names[0],
+                         id="song-playlists-dropdown",
+                         clearable=False,
+                         style={"width":"300px",'text-align': 'left', 'display': 'block' if len(playlist_names) > 1 else 'none'}
+                     ),
+                     html.P("You can page through the playlist here."),
+                     html.Div(
+                            dash_table.DataTable(
+                                id="playlist-table",
+                                columns=[{'name': col, 'id': col} for col in TABLE_COLUMNS],
+                                page_action='custom',
+                                page_current=0,
+                                page_size=TABLE_PAGE_SIZE,
+                                style_as_list_view=True,
+                                style_header={'backgroundColor': '#2a2a2a', 'color': 'white', 'fontWeight': 'bold', 'border': 'none'},
+                                style_cell={'backgroundColor': '#161616', 'color': '#e6e6e6', 'textAlign': 'left', 'border': 'none'},
+                                style_cell_conditional=[
+                                    {'if': {'column_id': 'Track Name'}, 'width': '50%'},
+                                    {'if': {'column_id': 'Artist Name'}, 'width': '25%'},
+                                    {'if': {'column_id': 'Album Name'}, 'width': '25%'},
+                                ],
+                            )
+                     ,style={'width':'60%'})
                      ])
 
             return table
@@ -315,7 +396,45 @@ def show_selected_song(song):
         return
 
 
+# Send only the visible page of the chosen playlist, sliced from its precomputed row range
+@callback(
+    Output(component_id="playlist-table", component_property="data"),
+    Output(component_id="playlist-table", component_property="page_count"),
+    Output(component_id="playlist-table", component_property="page_current"),
+    Input(component_id="song-playlists-dropdown", component_property="value"),
+    Input(component_id="playlist-table", component_property="page_current")
+)
+def update_playlist_page(playlist_name, page):
+    rows, ranges = playlist_rows()
+    if playlist_name not in ranges:
+        return [], 0, 0
+    # A different playlist starts back on its first page
+    if callback_context.triggered_id == "song-playlists-dropdown":
+        page = 0
+    start, end = ranges[playlist_name]
+    page_count = max(1, -(-(end - start) // TABLE_PAGE_SIZE))
+    page = min(page or 0, page_count - 1)
+    first = start + page * TABLE_PAGE_SIZE
+    page_rows = rows.iloc[first:min(first + TABLE_PAGE_SIZE, end)]
+    return page_rows.to_dict('records'), page_count, page
+
+
 # For "Song Recs For the Playlist"
+# Offer the best matching playlist names for what has been typed so far
+@callback(
+    Output(component_id="playlists-dropdown-recs", component_property="options"),
+    Input(component_id="playlists-dropdown-recs", component_property="search_value"),
+    State(component_id="playlists-dropdown-recs", component_property="value")
+)
+def update_playlist_options(search_value, playlist):
+    if not search_value:
+        raise PreventUpdate
+    matches = playlist_index().search(search_value, SONG_MATCHES)
+    if playlist and playlist not in matches:
+        matches.append(playlist)
+    return matches
+
+
 # Show recommended songs for the playlist once playlist is selected
 @callback(
     Output(component_id="song-recs", component_property='children'),
@@ -323,8 +442,8 @@ def show_selected_song(song):
     Input(component_id="slider-input", component_property="value")
 )
 def show_playlist_recs(playlist, value):
-    if playlist in list_of_playlists:
-        tracks = ['https://open.spotify.com/embed/track/'+ uri[14:] for uri in all_playlist_recs_dict[playlist]]
+    if playlist in all_playlist_recs_dict():
+        tracks = ['https://open.spotify.com/embed/track/'+ uri[14:] for uri in all_playlist_recs_dict()[playlist]]
         return html.Div([
                         html.H3("If you like this playlist, we think you'll like these " + str(value) + " songs:"),
                         html.Div([html.Iframe(src=tracks[i-1], width="225px",height="352px", allow="encrypted-media", style={'border':'none','paddingLeft': '0px', 'paddingRight': '10px'}) for i in range(value)])
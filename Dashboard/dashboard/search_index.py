@@ -0,0 +1,72 @@
+# Typeahead search index for the dashboard dropdowns -----------------
+#
+# Labels are split into lowercase word tokens. Tokens are kept sorted with
+# the ids of the labels containing them laid out in the same order, so all
+# labels having a token that starts with a given prefix form one contiguous
+# slice. A query matches a label when every query token prefixes one of the
+# label's tokens; labels starting with the whole query come first, then the
+# shortest other matches.
+
+import re
+
+import numpy as np
+
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+class TypeaheadIndex:
+    def __init__(self, labels):
+        self.labels = np.asarray(list(labels), dtype=object)
+        self.lengths = np.array([len(label) for label in self.labels], dtype=np.int64)
+
+        # Whole labels, sorted case-insensitively, for "starts with" matches
+        lowered = np.array([label.lower() for label in self.labels], dtype=object)
+        self.label_order = np.argsort(lowered, kind="stable")
+        self.sorted_labels = lowered[self.label_order]
+
+        # (token, label id) pairs sorted by token
+        pairs = sorted((token, i) for i, label in enumerate(self.labels) for token in set(tokenize(label)))
+        self.tokens = np.array([token for token, _ in pairs], dtype=object)
+        self.postings = np.array([i for _, i in pairs], dtype=np.int64)
+
+    def prefix_range(self, sorted_values, prefix):
+        start = np.searchsorted(sorted_values, prefix, side="left")
+        end = np.searchsorted(sorted_values, prefix + "\uffff", side="left")
+        return start, end
+
+    # Up to limit labels matching query, best first
+    def search(self, query, limit=20):
+        query = query.strip().lower()
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        # Labels starting with the whole query
+        start, end = self.prefix_range(self.sorted_labels, query)
+        results = list(self.label_order[start:min(end, start + limit)])
+        if len(results) == limit:
+            return [self.labels[i] for i in results]
+
+        # Labels matching every query token, narrowed from the rarest one
+        slices = [self.prefix_range(self.tokens, token) for token in query_tokens]
+        slices.sort(key=lambda bounds: bounds[1] - bounds[0])
+        candidates = np.unique(self.postings[slices[0][0]:slices[0][1]])
+        for start, end in slices[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = candidates[np.isin(candidates, self.postings[start:end])]
+        candidates = candidates[~np.isin(candidates, results)]
+
+        # Shortest first, ties by label id, also across the cut at wanted
+        wanted = limit - len(results)
+        order = self.lengths[candidates] * len(self.labels) + candidates
+        if len(candidates) > wanted:
+            keep = np.argpartition(order, wanted - 1)[:wanted]
+            candidates, order = candidates[keep], order[keep]
+        candidates = candidates[np.argsort(order)]
+        return [self.labels[i] for i in results + list(candidates)]
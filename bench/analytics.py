@@ -0,0 +1,79 @@
+"""
+Build time of the util.analytics dataset profile against the loops it
+replaces in util.vis.
+
+The old keyword count (keywords.count(word) for every distinct word) is
+quadratic and is only timed on the first --legacy-playlists titles; the
+artist and length loops are the row-wise Python passes over the playlist
+rows. The profile is built from the playlist matrix and catalog of the
+same synthetic data, then loaded back from its JSON cache.
+
+    python -m bench.analytics --playlists 200000 --legacy-playlists 5000
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from bench.synthetic import makeExplorerData
+from util import analytics
+from util.catalog import TrackCatalog
+
+
+def legacyKeywords(names):
+    keywords = [word for name in names for word in name.split() if word]
+    return {word: keywords.count(word) for word in set(keywords)}
+
+
+def legacyArtists(artists):
+    artistCounts = {}
+    for artist in artists:
+        artistCounts[artist] = artistCounts.get(artist, 0) + 1
+    return artistCounts
+
+
+def legacyLengths(playlists):
+    return [len(playlist) for _, playlist in playlists.groupby("Playlist ID")["Track URI"]]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, default=200000)
+    parser.add_argument("--legacy-playlists", type=int, default=5000, help="titles for the quadratic keyword count")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        playlists, songs, playlistSparse = makeExplorerData(args.playlists, seed=args.seed)
+    catalog = TrackCatalog.fromSongs(songs)
+    names = analytics.playlistNames(playlists)
+    print(f"{args.playlists} playlists, {len(catalog)} tracks, {playlistSparse.nnz} playlist entries")
+
+    _, seconds = timed(legacyKeywords, names[:args.legacy_playlists])
+    print(f"legacy keyword count, {args.legacy_playlists} titles: {seconds:8.2f}s")
+    artistNames = catalog.artists[catalog.toIds(playlists["Track URI"])]
+    _, seconds = timed(legacyArtists, artistNames)
+    print(f"legacy artist loop:                  {seconds:8.2f}s")
+    _, seconds = timed(legacyLengths, playlists)
+    print(f"legacy length list:                  {seconds:8.2f}s")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        profile, seconds = timed(analytics.buildProfile, playlistSparse, catalog, names)
+    print(f"profile build, all data:             {seconds:8.2f}s")
+    with tempfile.TemporaryDirectory() as workDir:
+        path = os.path.join(workDir, "profile.json")
+        analytics.saveProfile(path, profile, "bench")
+        _, seconds = timed(analytics.loadProfile, path, "bench")
+        print(f"profile load from cache ({os.path.getsize(path) // 1024} KiB):  {seconds:8.4f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Check that BaseClassifier's batched scorer ranks exactly like the
+per-track loop and compare their latency.
+
+    python -m bench.base_scoring --playlists 10 --k 10
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from models.BaseClassifier import BaseClassifier
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--playlists", type=int, default=10)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--neighbours", type=int, default=None)
+    args = parser.parse_args()
+
+    songs = pd.read_pickle(os.path.join(args.data, "tracks.pkl"))
+    playlists = pd.read_pickle(os.path.join(args.data, "playlists.pkl"))
+    model = BaseClassifier(songs, playlists, neighbours=args.neighbours)
+
+    loopTime = batchTime = 0
+    mismatches = 0
+    playlistIDs = playlists["Playlist ID"].unique()[:args.playlists]
+    for pid in playlistIDs:
+        start = time.perf_counter()
+        expected = model.get_recommendations(pid, args.k, batched=False)
+        loopTime += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = model.get_recommendations(pid, args.k)
+        batchTime += time.perf_counter() - start
+
+        if not expected.equals(actual):
+            mismatches += 1
+            print(f"Playlist {pid}: rankings differ")
+
+    n = len(playlistIDs)
+    print(f"{n} playlists, {mismatches} mismatches")
+    print(f"loop:    {loopTime / n * 1000:.1f} ms/playlist")
+    print(f"batched: {batchTime / n * 1000:.1f} ms/playlist ({loopTime / batchTime:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
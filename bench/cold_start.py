@@ -0,0 +1,96 @@
+"""
+Cold-start classifier against the NNC for playlists with few seed tracks.
+
+Synthetic topical playlists are named after their topic. Held-out playlists
+are left out of the training data entirely and queried with their name and
+their first s tracks for every s in --seeds; the rest of each playlist is
+what should be recommended. Reports recall@k and per-playlist latency for
+both classifiers, which is what the cold-start threshold trades off.
+
+    python -m bench.cold_start --playlists 10000 --queries 300 --seeds 0 1 2 3 5 10
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bench.synthetic import makePlaylistFrames
+from models.ColdStartClassifier import ColdStartClassifier
+from models.NNeighClassifier import NNeighClassifier
+from util.catalog import TrackCatalog
+from util.dataIn import processPlaylistForClustering
+from util.evaluation import hitMatrix, metricsAtK
+
+
+def seedQuery(playlist, numSeeds):
+    query = playlist.iloc[:numSeeds]
+    query.attrs["Playlist Name"] = playlist["Playlist Name"].iloc[0]
+    return query
+
+
+def run(classifier, queries, targets, k):
+    """
+    (recall@k, p50 latency in microseconds) over the queries
+    """
+    ranked, times = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for query in queries:
+            start = time.perf_counter()
+            ranked.append(classifier.predict(query, k))
+            times.append((time.perf_counter() - start) * 1e6)
+    recall = metricsAtK(hitMatrix(ranked, targets, k), [len(target) for target in targets])["recall"].iloc[-1]
+    return recall, np.percentile(times, 50)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, default=10000)
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2, 3, 5, 10])
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    playlists, tracks = makePlaylistFrames(args.playlists, seed=args.seed, topics=args.topics)
+    rng = np.random.default_rng(args.seed)
+    lengths = playlists.groupby("Playlist ID").size()
+    eligible = lengths.index[lengths > max(args.seeds)].to_numpy()
+    heldOut = rng.choice(eligible, min(args.queries, len(eligible)), replace=False)
+    train = ~playlists["Playlist ID"].isin(heldOut)
+    trainPlaylists, trainTracks = playlists[train], tracks[~tracks["Playlist ID"].isin(heldOut)].copy()
+
+    with tempfile.TemporaryDirectory() as workDir, contextlib.redirect_stdout(io.StringIO()):
+        playlistSparse, IDtoIDX = processPlaylistForClustering(trainPlaylists, trainTracks)
+        trainTracks["sparse_id"] = trainTracks["Track URI"].map(IDtoIDX)
+        catalog = TrackCatalog.fromSongs(trainTracks.set_index("Track URI"))
+        cwd = os.getcwd()
+        os.chdir(workDir)
+        try:
+            nnc = NNeighClassifier(None, playlistSparse, catalog, reTrain=True)
+        finally:
+            os.chdir(cwd)
+    names = trainPlaylists.drop_duplicates("Playlist ID").set_index("Playlist ID")["Playlist Name"]
+    start = time.perf_counter()
+    coldStart = ColdStartClassifier(playlistSparse, names, catalog)
+    coldStart.buildIndex()
+    buildSeconds = time.perf_counter() - start
+
+    groups = playlists[~train].groupby("Playlist ID")
+    print(f"{args.playlists} playlists, {args.topics} topics, {len(heldOut)} held-out playlists, "
+          f"cold-start index of {len(coldStart.tokens)} tokens built in {buildSeconds:.2f}s")
+    print(f"{'seeds':>5} {'NNC recall':>11} {'cold recall':>11} {'NNC p50 us':>11} {'cold p50 us':>11}")
+    for numSeeds in args.seeds:
+        queries = [seedQuery(group, numSeeds) for _, group in groups]
+        targets = [set(group["Track URI"].iloc[numSeeds:]) for _, group in groups]
+        nncRecall, nncLatency = run(nnc, queries, targets, args.k)
+        coldRecall, coldLatency = run(coldStart, queries, targets, args.k)
+        print(f"{numSeeds:5d} {nncRecall:11.4f} {coldRecall:11.4f} {nncLatency:11.1f} {coldLatency:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
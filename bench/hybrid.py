@@ -0,0 +1,112 @@
+"""
+Latency and accuracy of the hybrid recommender against its two parents.
+
+Synthetic playlists are drawn around topics and every track's lyrics
+embedding sits near its topic's centre, so both co-occurrence and content
+carry signal. A seeded held-out set has its obscured tracks removed from the
+training data before the NNC, the base classifier and the hybrid are built,
+then each is scored with util.evaluation and timed one playlist at a time.
+
+    python -m bench.hybrid --playlists 5000 --queries 200 --candidates 300
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bench.synthetic import makePlaylistFrames, topicEmbeddings, trackURIs
+from models.BaseClassifier import BaseClassifier
+from models.HybridClassifier import HybridClassifier
+from models.NNeighClassifier import NNeighClassifier
+from util.catalog import TrackCatalog
+from util.dataIn import processPlaylistForClustering
+from util.evaluation import buildHoldout, evaluate, splitHoldout
+from util.similarity import normalizeRows
+
+
+def trainingData(playlists, tracks, holdout):
+    """
+    Playlists and tracks without the held-out playlists' obscured tracks
+    """
+    hidden = holdout[holdout["Obscured"]]
+    hidden = pd.MultiIndex.from_arrays([hidden["Playlist ID"], hidden["Track URI"]])
+    keep = lambda frame: frame[~pd.MultiIndex.from_arrays([frame["Playlist ID"], frame["Track URI"]]).isin(hidden)]
+    return keep(playlists).reset_index(drop=True), keep(tracks).reset_index(drop=True)
+
+
+def latencies(classifier, queries, numPredictions):
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for playlist in queries:
+            start = time.perf_counter()
+            classifier.predict(playlist, numPredictions)
+            times.append((time.perf_counter() - start) * 1000)
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, default=5000)
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--base-queries", type=int, default=50, help="held-out playlists scored with the base classifier")
+    parser.add_argument("--obscure", type=float, default=0.25)
+    parser.add_argument("--max-k", type=int, default=100)
+    parser.add_argument("--candidates", type=int, default=300)
+    parser.add_argument("--vote-weight", type=float, default=0.8)
+    parser.add_argument("--content-weight", type=float, default=0.2)
+    parser.add_argument("--embedding-dim", type=int, default=32)
+    parser.add_argument("--noise", type=float, default=1.0, help="embedding noise relative to topic spread")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    numTracks = args.playlists * 20
+    playlists, tracks = makePlaylistFrames(args.playlists, numTracks, seed=args.seed, topics=args.topics)
+    holdout = buildHoldout(playlists, args.queries, args.obscure, seed=args.seed)
+    trainPlaylists, trainTracks = trainingData(playlists, tracks, holdout)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        playlistSparse, IDtoIDX = processPlaylistForClustering(trainPlaylists, trainTracks)
+    trainTracks["sparse_id"] = trainTracks["Track URI"].map(IDtoIDX)
+    catalog = TrackCatalog.fromSongs(trainTracks.set_index("Track URI"))
+
+    # Embeddings are drawn for every synthetic track, then aligned with the catalog
+    vectors = topicEmbeddings(numTracks, args.topics, args.embedding_dim, np.random.default_rng(args.seed), args.noise)
+    trackNumbers = pd.Index(trackURIs(numTracks)).get_indexer(np.asarray(catalog.uris, dtype=object))
+    embeddings = (normalizeRows(vectors[trackNumbers]), np.ones(len(catalog), dtype=bool))
+
+    with tempfile.TemporaryDirectory() as workDir, contextlib.redirect_stdout(io.StringIO()):
+        cwd = os.getcwd()
+        os.chdir(workDir)
+        try:
+            nnc = NNeighClassifier(trainPlaylists, playlistSparse, catalog, reTrain=True)
+        finally:
+            os.chdir(cwd)
+        base = BaseClassifier(None, trainPlaylists, catalog, embeddings=embeddings, neighbours=100)
+    hybrid = HybridClassifier(nnc, base, numCandidates=args.candidates, voteWeight=args.vote_weight,
+                              contentWeight=args.content_weight)
+
+    queries = [playlist for playlist, _ in splitHoldout(holdout)]
+    baseIDs = holdout["Playlist ID"].drop_duplicates().iloc[:args.base_queries]
+    print(f"{args.playlists} playlists, {args.topics} topics, {len(catalog)} tracks, "
+          f"{len(queries)} held-out playlists ({len(baseIDs)} for Base), {args.candidates} hybrid candidates")
+    print(f"{'':>8} {'recall@10':>10} {'recall@50':>10} {'recall@100':>10} {'ndcg@50':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for classifier in (nnc, base, hybrid):
+        scored = holdout[holdout["Playlist ID"].isin(baseIDs)] if classifier is base else holdout
+        timedQueries = queries[:len(baseIDs)] if classifier is base else queries
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics = evaluate(classifier, scored, args.max_k, workers=1,
+                               ks=[k for k in (10, 50, 100) if k <= args.max_k])
+        p50, p99 = latencies(classifier, timedQueries, args.max_k)
+        recall = metrics["recall"]
+        print(f"{classifier.name:>8} {recall.get(10, np.nan):10.4f} {recall.get(50, np.nan):10.4f} "
+              f"{recall.get(100, np.nan):10.4f} {metrics['ndcg'].get(50, np.nan):8.4f} {p50:8.2f} {p99:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
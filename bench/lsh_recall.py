@@ -0,0 +1,63 @@
+"""
+Recall@k and latency of the MinHash/LSH index against exact cosine
+neighbours for a grid of band/row/candidate-cap settings.
+
+    python -m bench.lsh_recall --playlists 20000 --queries 200
+"""
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+from bench.synthetic import makeExplorerData
+from models.InvertedIndexNeighbors import InvertedIndexNeighbors
+from models.MinHashLSH import MinHashLSH
+
+
+def recallAtK(exact, approx):
+    """
+    Share of exact neighbours with nonzero similarity that the approximate
+    index also returned
+    """
+    (exactDist, exactIdx), approxIdx = exact, approx
+    relevant = set(exactIdx[0][exactDist[0] < 1])
+    return len(relevant & set(approxIdx[0])) / len(relevant) if relevant else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=60)
+    parser.add_argument("--bands", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--caps", type=int, nargs="+", default=[500, 2000])
+    args = parser.parse_args()
+
+    _, _, playlistSparse = makeExplorerData(args.playlists)
+    rng = np.random.default_rng(1)
+    queries = playlistSparse[rng.choice(playlistSparse.shape[0], args.queries, replace=False)]
+
+    exactIndex = InvertedIndexNeighbors(n_neighbors=args.k).fit(playlistSparse)
+    exact = [exactIndex.kneighbors(queries[i], args.k) for i in range(args.queries)]
+
+    print(f"{args.playlists} playlists, {args.queries} queries, recall@{args.k}")
+    print(f"{'bands':>5} {'rows':>4} {'cap':>5} {'recall':>7} {'p50 ms':>7} {'p99 ms':>7} {'build s':>7}")
+    for bands, rows, cap in itertools.product(args.bands, args.rows, args.caps):
+        start = time.perf_counter()
+        index = MinHashLSH(n_neighbors=args.k, bands=bands, rows=rows, maxCandidates=cap).fit(playlistSparse)
+        buildTime = time.perf_counter() - start
+
+        recalls, times = [], []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            approx = index.kneighbors(queries[i], args.k, return_distance=False)
+            times.append((time.perf_counter() - start) * 1000)
+            recalls.append(recallAtK(exact[i], approx))
+        print(f"{bands:>5} {rows:>4} {cap:>5} {np.mean(recalls):>7.3f} "
+              f"{np.percentile(times, 50):>7.2f} {np.percentile(times, 99):>7.2f} {buildTime:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
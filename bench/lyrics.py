@@ -0,0 +1,104 @@
+"""
+util.lyrics against the notebook's row-at-a-time lyrics embedding.
+
+Synthetic lyrics draw Zipfian words (mixed case, with punctuation and
+stopwords) from a vocabulary that a GloVe-format text file in a temporary
+directory gives vectors to. The notebook path runs preprocess_text and
+get_mean_embedding row by row through iterrows over the first --legacy
+tracks; the pipeline embeds every track and its rows are checked against
+the notebook's.
+
+    python -m bench.lyrics --tracks 50000 --legacy 5000 --workers 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from util import lyrics
+
+
+def makeLyrics(numTracks, numWords, wordsPerTrack, rng):
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    vocabulary = np.array(["".join(rng.choice(letters, 7)) for _ in range(numWords)], dtype=object)
+    vocabulary = np.concatenate([vocabulary, np.array(lyrics.LYRICS_STOPWORDS, dtype=object)])
+    weights = 1 / np.arange(1, len(vocabulary) + 1) ** 1.05
+    weights /= weights.sum()
+    decorations = np.array(["", "", "", ",", ".", "!", "'s"], dtype=object)
+    texts = []
+    for length in rng.poisson(wordsPerTrack, numTracks):
+        tokens = vocabulary[rng.choice(len(vocabulary), length, p=weights)]
+        tokens = tokens + decorations[rng.integers(0, len(decorations), length)]
+        upper = rng.random(length) < 0.1
+        tokens[upper] = [token.capitalize() for token in tokens[upper]]
+        texts.append(" ".join(tokens))
+    return vocabulary[:numWords], texts
+
+
+def writeGlove(path, words, vectors):
+    with open(path, "w", encoding="utf-8") as f:
+        for word, vector in zip(words, vectors):
+            f.write(word + " " + " ".join(f"{value:.5f}" for value in vector) + "\n")
+
+
+def notebookEmbeddings(df, stopwordSet, lemmatize, embeddingsDict):
+    """
+    preprocess_text and get_mean_embedding as the notebook runs them
+    """
+    rows = []
+    for _, row in df.iterrows():
+        tokens = lyrics.preprocessText(row["Lyrics"], stopwordSet, lemmatize)
+        vectors = [embeddingsDict[w] for w in tokens if w in embeddingsDict]
+        rows.append(np.mean(vectors, axis=0) if vectors else None)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tracks", type=int, default=50000)
+    parser.add_argument("--legacy", type=int, default=5000, help="tracks embedded the notebook's way")
+    parser.add_argument("--words", type=int, default=20000)
+    parser.add_argument("--words-per-track", type=int, default=250)
+    parser.add_argument("--dim", type=int, default=50)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vocabulary, texts = makeLyrics(args.tracks, args.words, args.words_per_track, rng)
+    with tempfile.TemporaryDirectory() as workDir:
+        path = os.path.join(workDir, "vectors.txt")
+        writeGlove(path, vocabulary, rng.normal(size=(len(vocabulary), args.dim)))
+        start = time.perf_counter()
+        words, vectors = lyrics.loadWordVectors(path)
+        loadSeconds = time.perf_counter() - start
+    print(f"{args.tracks} tracks, ~{args.words_per_track} words each, {len(words)} word vectors "
+          f"loaded in {loadSeconds:.2f}s")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        stopwordSet, lemmatize = lyrics.loadStopwords(), lyrics.loadLemmatizer()
+        start = time.perf_counter()
+        matrix, valid = lyrics.lyricsEmbeddings(texts, words, vectors, workers=args.workers,
+                                                minDocs=1, minDocShare=0, maxDocShare=1)
+    seconds = time.perf_counter() - start
+    print(f"pipeline:          {seconds:8.2f}s {args.tracks / seconds:10.0f} tracks/s")
+
+    legacy = pd.DataFrame({"Lyrics": texts[:args.legacy]})
+    embeddingsDict = dict(zip(words, vectors))
+    start = time.perf_counter()
+    expected = notebookEmbeddings(legacy, stopwordSet, lemmatize, embeddingsDict)
+    seconds = time.perf_counter() - start
+    print(f"notebook loop:     {seconds:8.2f}s {args.legacy / seconds:10.0f} tracks/s")
+
+    agree = all((row is None and not valid[i]) or (valid[i] and np.allclose(row, matrix[i], atol=1e-4))
+                for i, row in enumerate(expected))
+    print(f"pipeline matches the notebook on {len(expected)} tracks: {agree}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Latency of the inverted-index neighbour engine against sklearn's
+brute-force cosine search, and whether they return the same top k.
+
+    python -m bench.neighbors --playlists 20000 --queries 200
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from bench.synthetic import makeExplorerData
+from models.InvertedIndexNeighbors import InvertedIndexNeighbors
+
+
+def latencies(model, queries, k):
+    times = []
+    results = []
+    for i in range(queries.shape[0]):
+        start = time.perf_counter()
+        results.append(model.kneighbors(queries[i], n_neighbors=k))
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000, results
+
+
+def sameTopK(expected, actual, tol=1e-5):
+    """
+    Same neighbours up to ties: equal distances at every rank, and the same
+    set of playlists strictly inside the k-th distance
+    """
+    (expDist, expIdx), (actDist, actIdx) = expected, actual
+    if not np.allclose(expDist, actDist, atol=tol):
+        return False
+    inside = expDist[0] < expDist[0, -1] - tol
+    return set(expIdx[0][inside]) == set(actIdx[0][actDist[0] < actDist[0, -1] - tol])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=60)
+    args = parser.parse_args()
+
+    _, _, playlistSparse = makeExplorerData(args.playlists)
+    rng = np.random.default_rng(1)
+    queries = playlistSparse[rng.choice(playlistSparse.shape[0], args.queries, replace=False)]
+
+    brute = NearestNeighbors(n_neighbors=args.k, metric="cosine").fit(playlistSparse)
+    inverted = InvertedIndexNeighbors(n_neighbors=args.k).fit(playlistSparse)
+    bruteMs, bruteResults = latencies(brute, queries, args.k)
+    invertedMs, invertedResults = latencies(inverted, queries, args.k)
+
+    matches = sum(sameTopK(e, a) for e, a in zip(bruteResults, invertedResults))
+    print(f"{args.playlists} playlists, {args.queries} queries, k={args.k}")
+    for name, ms in (("brute", bruteMs), ("inverted", invertedMs)):
+        print(f"{name:>8}: p50 {np.percentile(ms, 50):.2f} ms, p99 {np.percentile(ms, 99):.2f} ms")
+    print(f"same top-k: {matches}/{args.queries}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Throughput of NNeighClassifier.predictBatch against calling predict
+once per playlist.
+
+    python -m bench.nnc_batch --playlists 10000 --queries 500
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from bench.synthetic import makeExplorerData
+from models.NNeighClassifier import NNeighClassifier
+from util.catalog import TrackCatalog
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=250)
+    parser.add_argument("--predictions", type=int, default=50)
+    args = parser.parse_args()
+
+    playlists, songs, playlistSparse = makeExplorerData(args.playlists)
+    catalog = TrackCatalog.fromSongs(songs)
+    queries = [group for _, group in playlists.groupby("Playlist ID")][:args.queries]
+
+    with tempfile.TemporaryDirectory() as workDir:
+        cwd = os.getcwd()
+        os.chdir(workDir)
+        try:
+            model = NNeighClassifier(playlists, playlistSparse, catalog, reTrain=True)
+        finally:
+            os.chdir(cwd)
+
+    start = time.perf_counter()
+    single = [model.predict(X, args.predictions) for X in queries]
+    loopTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = []
+    for lo in range(0, len(queries), args.batch):
+        batched.extend(model.predictBatch(queries[lo:lo + args.batch], args.predictions))
+    batchTime = time.perf_counter() - start
+
+    print(f"{args.playlists} playlists, {len(queries)} queries, batch size {args.batch}")
+    print(f"per-row predict: {len(queries) / loopTime:.1f} playlists/s")
+    print(f"predictBatch:    {len(queries) / batchTime:.1f} playlists/s ({loopTime / batchTime:.1f}x)")
+    print(f"identical predictions: {single == batched}")
+
+
+if __name__ == "__main__":
+    main()
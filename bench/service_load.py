@@ -0,0 +1,113 @@
+"""
+Load test of the micro-batching recommendation service on one machine.
+
+Builds an explorer over synthetic data in a temporary directory, serves it
+on a local port and drives it with concurrent keep-alive clients, once per
+--max-batch setting, reporting throughput, p50/p99 latency and the batch
+sizes the service actually formed. The cache is off so every request is scored.
+
+    python -m bench.service_load --playlists 10000 --clients 64 --requests 2000 --max-batch 1 64
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bench.synthetic import makeExplorerData
+from util.helpers import pickleMatrix
+from util.service import RecommendationService
+
+
+async def post(reader, writer, path, payload):
+    body = json.dumps(payload).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(port, queries, numPredictions, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for tracks in queries:
+            start = time.perf_counter()
+            status, response = await post(reader, writer, "/recommend", {"tracks": tracks, "n": numPredictions})
+            if status != 200:
+                raise RuntimeError(response)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        writer.close()
+
+
+async def runLoad(explorer, queries, args, maxBatch):
+    service = RecommendationService(explorer, maxBatch, args.max_delay_ms / 1000)
+    port = await service.start("127.0.0.1", 0)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(port, queries[i::args.clients], args.predictions, latencies)
+                           for i in range(args.clients)])
+    elapsed = time.perf_counter() - start
+    stats = service.batcher.stats()
+    await service.stop()
+    return {"maxBatch": maxBatch, "requests": len(latencies), "seconds": elapsed,
+            "throughput": len(latencies) / elapsed, "p50ms": float(np.percentile(latencies, 50)),
+            "p99ms": float(np.percentile(latencies, 99)), "meanBatchSize": stats["meanBatchSize"],
+            "maxBatchSize": stats["maxBatchSize"]}
+
+
+def main():
+    from main import SpotifyExplorer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--predictions", type=int, default=50)
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[1, 64])
+    parser.add_argument("--max-delay-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    playlists, songs, playlistSparse = makeExplorerData(args.playlists, embeddingDim=16)
+    with tempfile.TemporaryDirectory() as workDir:
+        cwd = os.getcwd()
+        os.chdir(workDir)
+        try:
+            os.makedirs("data")
+            playlists.to_pickle(os.path.join("data", "playlists.pkl"))
+            songs.to_pickle(os.path.join("data", "tracks.pkl"))
+            pickleMatrix(os.path.join("data", "playlistSparse.pkl"), playlistSparse)
+            with contextlib.redirect_stdout(io.StringIO()):
+                explorer = SpotifyExplorer(0, retrainNNC=True, cacheSize=0)
+        finally:
+            os.chdir(cwd)
+
+    rng = np.random.default_rng(0)
+    groups = [group["Track URI"].astype(str).tolist() for _, group in playlists.groupby("Playlist ID")]
+    queries = [groups[i] for i in rng.integers(0, len(groups), args.requests)]
+
+    print(f"{args.playlists} playlists, {args.clients} clients, {args.requests} requests, "
+          f"{args.max_delay_ms} ms batch window")
+    for maxBatch in args.max_batch:
+        result = asyncio.run(runLoad(explorer, queries, args, maxBatch))
+        print(f"  max batch {maxBatch:4d}: {result['throughput']:8.1f} req/s, "
+              f"p50 {result['p50ms']:7.2f} ms, p99 {result['p99ms']:7.2f} ms, "
+              f"mean batch {result['meanBatchSize']:6.1f} (max {result['maxBatchSize']})")
+
+
+if __name__ == "__main__":
+    main()
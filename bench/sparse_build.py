@@ -0,0 +1,60 @@
+"""
+Compare the vectorized playlist x track CSR builder with the old
+per-playlist dok_matrix loop.
+
+    python -m bench.sparse_build --playlists 1000 10000
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.sparse import dok_matrix
+
+from bench.synthetic import makePlaylistFrames
+from util.dataIn import processPlaylistForClustering
+
+
+def processPlaylistForClusteringLoop(playlists, tracks):
+    """
+    Reference dok_matrix builder: one playlist lookup and one dict lookup
+    per track inside a Python loop, as dataIn used to do
+    """
+    trackIDs = list(dict.fromkeys(tracks["Track URI"]))
+    IDtoIDX = {k: v for k, v in zip(trackIDs, range(len(trackIDs)))}
+    byPlaylist = playlists.set_index("Playlist ID")
+    playlistIDs = list(playlists["Playlist ID"].unique())
+    numRows = max(playlistIDs) + 1
+    playlistSongSparse = dok_matrix((numRows, len(trackIDs)), dtype=np.float32)
+    for playlistID in playlistIDs:
+        trackID = byPlaylist.loc[[playlistID], "Track URI"]
+        trackIDX = [IDtoIDX.get(i) for i in trackID]
+        trackIDX = [idx for idx in trackIDX if idx is not None]
+        playlistSongSparse[playlistID, trackIDX] = 1
+    return playlistSongSparse.tocsr(), IDtoIDX
+
+
+def timeIt(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--skip-loop-above", type=int, default=20000)
+    args = parser.parse_args()
+
+    for numPlaylists in args.playlists:
+        playlists, tracks = makePlaylistFrames(numPlaylists)
+        (fast, fastMap), fastTime = timeIt(processPlaylistForClustering, playlists, tracks)
+        line = f"{numPlaylists:>8} playlists, {fast.nnz:>9} entries: vectorized {fastTime:.3f}s"
+        if numPlaylists <= args.skip_loop_above:
+            (slow, slowMap), slowTime = timeIt(processPlaylistForClusteringLoop, playlists, tracks)
+            same = slowMap == fastMap and (slow != fast).nnz == 0
+            line += f", loop {slowTime:.3f}s ({slowTime / fastTime:.0f}x), identical={same}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
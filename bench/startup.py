@@ -0,0 +1,96 @@
+"""
+Compare SpotifyExplorer startup from the pickles with opening the
+memory-mapped store: readData alone, and the full construction with every
+classifier built (the NNC loaded from its saved model, trained once up
+front). Each variant runs in a fresh interpreter, timed after imports, and
+the best of --repeat runs is reported, along with whether construction
+built the playlists DataFrame.
+
+    python -m bench.startup --playlists 20000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench.synthetic import makeExplorerData
+from util.helpers import pickleMatrix
+from util.store import convertPickles
+
+READ_SCRIPT = """
+import time
+from main import SpotifyExplorer
+start = time.perf_counter()
+explorer = SpotifyExplorer.__new__(SpotifyExplorer)
+explorer.mpdDir = None
+explorer.storeDir = {storeDir!r}
+explorer.readData(0)
+ready = time.perf_counter()
+explorer.catalog.toId(explorer.catalog.uris[0])
+print(ready - start, time.perf_counter() - start)
+"""
+
+BUILD_SCRIPT = """
+import time
+from main import SpotifyExplorer
+start = time.perf_counter()
+explorer = SpotifyExplorer(0, retrainNNC=False, storeDir={storeDir!r})
+ready = time.perf_counter()
+explorer.catalog.toId(explorer.catalog.uris[0])
+print(ready - start, time.perf_counter() - start, int(explorer._playlists is not None))
+"""
+
+
+def writePickles(dataDir, numPlaylists):
+    playlists, songs, playlistSparse = makeExplorerData(numPlaylists, embeddingDim=50)
+    os.makedirs(dataDir, exist_ok=True)
+    playlists.to_pickle(os.path.join(dataDir, "playlists.pkl"))
+    songs.to_pickle(os.path.join(dataDir, "tracks.pkl"))
+    pickleMatrix(os.path.join(dataDir, "playlistSparse.pkl"), playlistSparse)
+
+
+def runScript(workDir, script):
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    out = subprocess.run([sys.executable, "-c", script], cwd=workDir, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return [float(x) for x in out.strip().splitlines()[-1].split()]
+
+
+def timeRead(workDir, storeDir, repeat, script=READ_SCRIPT):
+    """
+    Best (ready, first lookup) seconds of repeat runs, plus the last field
+    of the script's output beyond those when it prints one
+    """
+    times = [runScript(workDir, script.format(storeDir=storeDir)) for _ in range(repeat)]
+    return (min(t[0] for t in times), min(t[1] for t in times)) + tuple(times[-1][2:])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--playlists", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workDir:
+        dataDir = os.path.join(workDir, "data")
+        storeDir = os.path.join(dataDir, "store")
+        writePickles(dataDir, args.playlists)
+        convertPickles(dataDir, storeDir)
+
+        # Train and save the NNC once, so construction loads it
+        runScript(workDir, BUILD_SCRIPT.replace("retrainNNC=False", "retrainNNC=True").format(storeDir=None))
+
+        pickleReady, pickleFirst = timeRead(workDir, None, args.repeat)
+        storeReady, storeFirst = timeRead(workDir, storeDir, args.repeat)
+        pickleBuild, _, pickleFrame = timeRead(workDir, None, args.repeat, BUILD_SCRIPT)
+        storeBuild, _, storeFrame = timeRead(workDir, storeDir, args.repeat, BUILD_SCRIPT)
+        print(f"{args.playlists} playlists")
+        print(f"pickles: readData {pickleReady:.3f}s, first lookup {pickleFirst:.3f}s, "
+              f"SpotifyExplorer() {pickleBuild:.3f}s")
+        print(f"store:   readData {storeReady:.3f}s, first lookup {storeFirst:.3f}s, "
+              f"SpotifyExplorer() {storeBuild:.3f}s, playlists DataFrame built: {bool(storeFrame)}")
+
+
+if __name__ == "__main__":
+    main()
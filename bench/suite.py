@@ -0,0 +1,168 @@
+"""
+End-to-end scaling benchmark over synthetic MPD-shaped data.
+
+For every scale one interpreter writes a synthetic
+playlist_with_embeddings_dataset.pkl and a fresh one then times dataIn.createDFs,
+SpotifyExplorer.readData, buildNNC and BaseClassifier.prepare_data, and the
+p50/p99 latency of single-playlist predict for both classifiers. Peak RSS is
+sampled after each stage, so each figure is the high-water mark up to and
+including that stage. Everything runs offline in a temporary directory.
+
+    python -m bench.suite --scales 1000 10000 100000 --queries 200
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench.synthetic import makeCombinedFrame
+
+DATASET = os.path.join("data", "playlist_with_embeddings_dataset.pkl")
+STAGES = ["createDFs", "readData", "buildNNC", "prepare_data"]
+
+
+def peakRSS():
+    """
+    Peak resident set size of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def timed(results, stage, fn):
+    """
+    Run fn with its output silenced and record its time and the peak RSS
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        value = fn()
+    results[stage] = {"seconds": time.perf_counter() - start, "peakMB": peakRSS()}
+    return value
+
+
+def predictLatencies(explorer, classifier, queries, numPredictions):
+    explorer.setClassifier(classifier)
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for playlist in queries:
+            start = time.perf_counter()
+            explorer.predictNeighbour(playlist, numPredictions)
+            times.append((time.perf_counter() - start) * 1000)
+    return {"p50ms": float(np.percentile(times, 50)), "p99ms": float(np.percentile(times, 99)),
+            "peakMB": peakRSS()}
+
+
+def generate(args):
+    """
+    Worker: write the synthetic combined dataset for one scale into args.work_dir
+    """
+    os.makedirs(os.path.join(args.work_dir, "data"), exist_ok=True)
+    frame = makeCombinedFrame(args.run_scale, args.run_scale * args.track_ratio, seed=args.seed,
+                              embeddingDim=args.embedding_dim, lyricsShare=args.lyrics_share)
+    frame.to_pickle(os.path.join(args.work_dir, DATASET))
+    with open(os.path.join(args.work_dir, "results.json"), "w") as f:
+        json.dump({"playlists": args.run_scale, "rows": len(frame)}, f)
+
+
+def runScale(args):
+    """
+    Worker: benchmark one generated scale inside args.work_dir and write results.json there
+    """
+    from main import SpotifyExplorer
+    from util import dataIn
+
+    os.chdir(args.work_dir)
+    with open("results.json") as f:
+        results = json.load(f)
+
+    timed(results, "createDFs", lambda: dataIn.createDFs(DATASET, idx=0, num_files=results["rows"]))
+
+    explorer = SpotifyExplorer.__new__(SpotifyExplorer)
+    explorer.mpdDir = explorer.storeDir = None
+    explorer.nncEngine, explorer.nncEngineParams = args.engine, None
+    timed(results, "readData", lambda: explorer.readData(0))
+    results["tracks"] = len(explorer.catalog)
+    timed(results, "buildNNC", lambda: explorer.buildNNC(True))
+    timed(results, "prepare_data", explorer.buildBaseClassifier)
+
+    rng = np.random.default_rng(args.seed)
+    groups = explorer.playlists.groupby("Playlist ID")
+    playlistIDs = rng.choice(list(groups.groups), min(args.queries, groups.ngroups), replace=False)
+    queries = [groups.get_group(playlistID) for playlistID in playlistIDs]
+    results["NNC predict"] = predictLatencies(explorer, "NNC", queries, args.predictions)
+    results["Base predict"] = predictLatencies(explorer, "Base", queries[:args.base_queries], args.predictions)
+
+    with open("results.json", "w") as f:
+        json.dump(results, f)
+
+
+def benchmarkScale(args, scale):
+    """
+    Generate one scale, then benchmark it in a fresh interpreter so peak
+    RSS covers neither data generation nor other scales
+    """
+    with tempfile.TemporaryDirectory() as workDir:
+        command = [sys.executable, "-m", "bench.suite", "--run-scale", str(scale), "--work-dir", workDir]
+        for name in ("queries", "base_queries", "predictions", "track_ratio", "embedding_dim",
+                     "lyrics_share", "engine", "seed"):
+            command += ["--" + name.replace("_", "-"), str(getattr(args, name))]
+        env = dict(os.environ, PYTHONPATH=os.getcwd())
+        subprocess.run(command + ["--generate"], env=env, check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(os.path.join(workDir, "results.json")) as f:
+            return json.load(f)
+
+
+def report(results):
+    print(f"{results['playlists']} playlists, {results['rows']} playlist tracks, {results['tracks']} unique tracks")
+    for stage in STAGES:
+        print(f"  {stage:>13}: {results[stage]['seconds']:8.2f}s   peak RSS {results[stage]['peakMB']:8.1f} MB")
+    for stage in ("NNC predict", "Base predict"):
+        latency = results[stage]
+        print(f"  {stage:>13}: p50 {latency['p50ms']:8.2f} ms, p99 {latency['p99ms']:8.2f} ms   "
+              f"peak RSS {latency['peakMB']:8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--base-queries", type=int, default=50)
+    parser.add_argument("--predictions", type=int, default=50)
+    parser.add_argument("--track-ratio", type=int, default=3, help="track universe size per playlist")
+    parser.add_argument("--embedding-dim", type=int, default=16)
+    parser.add_argument("--lyrics-share", type=float, default=0.2, help="share of tracks with an embedding")
+    parser.add_argument("--engine", default="brute")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write all results to this file")
+    parser.add_argument("--run-scale", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--generate", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scale is not None:
+        if args.generate:
+            generate(args)
+        else:
+            runScale(args)
+        return
+
+    allResults = []
+    for scale in args.scales:
+        allResults.append(benchmarkScale(args, scale))
+        report(allResults[-1])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(allResults, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
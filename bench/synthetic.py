@@ -0,0 +1,123 @@
+"""
+Synthetic MPD-shaped data for offline benchmarks.
+
+Track popularity is Zipfian and playlist lengths are log-normal, clipped
+to the MPD's 5-250 track range.
+"""
+import numpy as np
+import pandas as pd
+
+from util.dataIn import processPlaylistForClustering
+
+
+def trackURIs(numTracks):
+    return np.array([f"{i:022x}" for i in range(numTracks)], dtype=object)
+
+
+def playlistLengths(numPlaylists, rng, mean=66, minLength=5, maxLength=250):
+    lengths = rng.lognormal(mean=np.log(mean) - 0.5, sigma=1.0, size=numPlaylists)
+    return np.clip(lengths.astype(np.int64), minLength, maxLength)
+
+
+def makePlaylistFrames(numPlaylists, numTracks=None, seed=0, zipf=1.1, topics=0, topicShare=0.8):
+    """
+    Build (playlists, tracks) DataFrames in the parsed format produced by
+    dataIn.createDFs before pickling: one row per (playlist, track) pair,
+    with bare track ids as Track URI.
+
+    With topics > 0, track i belongs to topic i % topics, every playlist
+    gets a topic, named in its Playlist Name, and draws topicShare of its
+    tracks, Zipfian by rank within the topic, from that topic.
+    """
+    rng = np.random.default_rng(seed)
+    if numTracks is None:
+        numTracks = numPlaylists * 20
+    lengths = playlistLengths(numPlaylists, rng)
+
+    # Zipfian popularity: track rank r is drawn with probability ~ 1 / r^zipf
+    weights = 1 / np.arange(1, numTracks + 1) ** zipf
+    weights /= weights.sum()
+    trackIDX = rng.choice(numTracks, size=lengths.sum(), p=weights)
+    playlistIDX = np.repeat(np.arange(numPlaylists), lengths)
+    if topics > 0:
+        playlistTopics = np.arange(numPlaylists) % topics
+        topical = np.flatnonzero(rng.random(len(trackIDX)) < topicShare)
+        perTopic = numTracks // topics
+        topicWeights = 1 / np.arange(1, perTopic + 1) ** zipf
+        ranks = rng.choice(perTopic, size=len(topical), p=topicWeights / topicWeights.sum())
+        trackIDX[topical] = ranks * topics + playlistTopics[playlistIDX[topical]]
+
+    pairs = pd.DataFrame({"Playlist ID": playlistIDX, "track": trackIDX}).drop_duplicates()
+    uris = trackURIs(numTracks)[pairs["track"].to_numpy()]
+    artists = pairs["track"].to_numpy() % max(1, numTracks // 8)
+
+    # Topical playlists are named after their topic, e.g. "topic3 mix 42"
+    names = [f"topic{i % topics} mix {i}" if topics > 0 else f"playlist {i}" for i in range(numPlaylists)]
+    playlists = pd.DataFrame({
+        "Playlist Name": np.array(names, dtype=object)[pairs["Playlist ID"].to_numpy()],
+        "Playlist ID": pairs["Playlist ID"].to_numpy(),
+        "Track URI": uris,
+    })
+    tracks = pd.DataFrame({
+        "Track Name": np.char.add("track ", pairs["track"].to_numpy().astype(str)).astype(object),
+        "Track URI": uris,
+        "Artist Name": np.char.add("artist ", artists.astype(str)).astype(object),
+        "Playlist ID": pairs["Playlist ID"].to_numpy(),
+    })
+    return playlists, tracks
+
+
+def makeExplorerData(numPlaylists, numTracks=None, seed=0, embeddingDim=None):
+    """
+    Build (playlists, songs, playlistSparse) as SpotifyExplorer.readData
+    loads them: songs is indexed by Track URI with a sparse_id column and,
+    if embeddingDim is given, bracketed lyrics_embedding strings.
+    """
+    playlists, tracks = makePlaylistFrames(numPlaylists, numTracks, seed)
+    playlistSparse, IDtoIDX = processPlaylistForClustering(playlists, tracks)
+    tracks["sparse_id"] = tracks["Track URI"].map(IDtoIDX)
+    if embeddingDim is not None:
+        strings = embeddingStrings(len(IDtoIDX), embeddingDim, np.random.default_rng(seed))
+        tracks["lyrics_embedding"] = strings[tracks["sparse_id"].to_numpy()]
+    return playlists, tracks.set_index("Track URI"), playlistSparse
+
+
+def topicEmbeddings(numTracks, topics, embeddingDim, rng, noise=1.0):
+    """
+    Embeddings for the tracks of makePlaylistFrames(topics=topics): the
+    centre of the track's topic plus Gaussian noise
+    """
+    centres = rng.normal(size=(topics, embeddingDim))
+    vectors = centres[np.arange(numTracks) % topics] + noise * rng.normal(size=(numTracks, embeddingDim))
+    return vectors.astype(np.float32)
+
+
+def embeddingStrings(numTracks, embeddingDim, rng, lyricsShare=1.0):
+    """
+    Bracketed lyrics_embedding strings for numTracks tracks, NaN for the
+    (1 - lyricsShare) of them that have no lyrics
+    """
+    strings = np.full(numTracks, np.nan, dtype=object)
+    withLyrics = np.flatnonzero(rng.random(numTracks) < lyricsShare)
+    vectors = rng.normal(size=(len(withLyrics), embeddingDim)).astype(np.float32)
+    strings[withLyrics] = ["[" + " ".join(f"{x:.6e}" for x in row) + "]" for row in vectors]
+    return strings
+
+
+def makeCombinedFrame(numPlaylists, numTracks=None, seed=0, embeddingDim=16, lyricsShare=1.0):
+    """
+    Build the combined playlist/track DataFrame that dataIn.createDFs reads
+    from playlist_with_embeddings_dataset.pkl: one row per (playlist, track)
+    pair with full spotify:track: URIs and a lyrics_embedding column.
+    """
+    playlists, tracks = makePlaylistFrames(numPlaylists, numTracks, seed)
+    trackIDX, uniqueURIs = pd.factorize(tracks["Track URI"])
+    strings = embeddingStrings(len(uniqueURIs), embeddingDim, np.random.default_rng(seed), lyricsShare)
+    return pd.DataFrame({
+        "Playlist Name": playlists["Playlist Name"].to_numpy(),
+        "Playlist ID": playlists["Playlist ID"].to_numpy(),
+        "Track URI": ("spotify:track:" + tracks["Track URI"]).to_numpy(),
+        "Track Name": tracks["Track Name"].to_numpy(),
+        "Artist Name": tracks["Artist Name"].to_numpy(),
+        "lyrics_embedding": strings[trackIDX],
+    })
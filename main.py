@@ -1,14 +1,23 @@
 import os
 import random
 
+import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
 from tqdm import tqdm
 
 from models.BaseClassifier import BaseClassifier
+from models.ColdStartClassifier import ColdStartClassifier, ColdStartRouter
+from models.HybridClassifier import HybridClassifier
 from models.NNeighClassifier import NNeighClassifier
-from util import dataIn
-from util.helpers import getTrackandArtist, obscurePlaylist
+from util import analytics, dataIn, evaluation, ingest, instrument
+from util.cache import RecommendationCache, playlistKey
+from util.catalog import TrackCatalog
+from util.embeddings import hasEmbeddings, loadEmbeddings, matchesCatalog
+from scipy.sparse import coo_matrix
+from util.segments import SegmentedMatrix
+from util.store import DataStore, compactStore, convertPickles, writeSegment
+from util.helpers import getTrackandArtist, obscurePlaylist, pickledFingerprint, prefixLimit
 
 
 class SpotifyExplorer:
@@ -16,56 +25,133 @@ class SpotifyExplorer:
     Args:
         numFiles (int): CLI variable that determines how many MPD files to read
         retrainNNC (bool): determines whether to retrain NNC or read from file
+        mpdDir (str): directory of raw MPD slice files to stream numFiles slices from,
+            instead of slicing the combined embeddings pickle
+        storeDir (str): memory-mapped data store to read from instead of the pickles,
+            converted from the pickles when missing or after new files are read
+        nncEngine (str): neighbour search engine for the NNC, "brute", "inverted" or "lsh"
+        nncEngineParams (dict): extra arguments for the NNC's engine
+        cacheSize (int): recommendation lists kept by the predictNeighbour LRU cache, 0 to disable
+        hybridParams (dict): HybridClassifier arguments, e.g. numCandidates, voteWeight and contentWeight
+        coldStartThreshold (int): playlists with fewer catalog tracks than this are answered
+            from their name by the cold-start classifier, 0 to disable
 
     Attributes:
         NNC (NNeighClassifier): NNeighbor Classifier used for predictions
         baseClassifier (BaseClassifier): Baseline classifier for comparison
-        playlists (DataFrame): contains all playlists read into memory
-        songs (DataFrame): all songs read into memory
-        playlistSparse (scipy.CSR matrix) playlists formatted for predictions
+        hybridClassifier (HybridClassifier): NNC candidates reranked by lyrics similarity
+        coldStart (ColdStartClassifier): name-token and popularity recommendations for short playlists
+        playlists (DataFrame): contains all playlists read into memory, built on first access from a store
+        songs (DataFrame): all songs read into memory, built on first access from a store
+        catalog (TrackCatalog): deduplicated track catalog shared by the classifiers
+        embeddings (tuple): memory-mapped (matrix, valid) lyrics embeddings aligned
+            with the catalog, or None to parse them from songs
+        playlistSparse (scipy.CSR matrix) playlists formatted for predictions, a
+            SegmentedMatrix while appended playlists are not compacted
+        sparseFingerprint (str): matrixFingerprint of the base playlist matrix recorded
+            when it was written, None when it has to be hashed on load
+        cache (RecommendationCache): predictNeighbour cache with hit/miss/eviction counters
     """
 
-    def __init__(self, numFiles, retrainNNC=True):
+    store = None
+    _playlists = None
+    _songs = None
+    _pendingPlaylists = ()
+    sparseFingerprint = None
+    cache = None
+    hybridClassifier = None
+    coldStart = None
+    coldStartThreshold = 0
+
+    def __init__(self, numFiles, retrainNNC=True, mpdDir=None, storeDir=None, nncEngine="brute",
+                 nncEngineParams=None, cacheSize=1024, hybridParams=None, coldStartThreshold=2):
+        self.mpdDir = mpdDir
+        self.hybridParams = hybridParams
+        self.coldStartThreshold = coldStartThreshold
+        self.cache = RecommendationCache(cacheSize) if cacheSize else None
+        self.storeDir = storeDir
+        self.nncEngine = nncEngine
+        self.nncEngineParams = nncEngineParams
         self.readData(numFiles)
         self.buildClassifiers(retrainNNC)
 
+    @instrument.timed("buildClassifiers")
     def buildClassifiers(self, retrainNNC):
         """
         Init classifiers and set initial classifier as main
         """
         self.NNC = self.buildNNC(retrainNNC)
         self.baseClassifier = self.buildBaseClassifier()
-        self.classifier = self.NNC
+        self.hybridClassifier = self.buildHybridClassifier()
+        self.coldStart = self.buildColdStart()
+        self.setClassifier("NNC")
 
+    @instrument.timed("buildNNC")
     def buildNNC(self, shouldRetrain):
         """
         Init NNC classifier
         """
+        segmented = isinstance(self.playlistSparse, SegmentedMatrix)
         self.NNC = NNeighClassifier(
-            sparsePlaylists=self.playlistSparse,
-            songs=self.songs,
-            playlists=self.playlists,
-            reTrain=shouldRetrain)
+            sparsePlaylists=self.playlistSparse.base if segmented else self.playlistSparse,
+            catalog=self.catalog,
+            playlists=None,
+            reTrain=shouldRetrain,
+            engine=self.nncEngine,
+            engineParams=self.nncEngineParams,
+            fingerprint=self.sparseFingerprint)
+        # Appended playlists not compacted yet are searched as segments
+        for rows in self.playlistSparse.deltas if segmented else []:
+            self.NNC.addSegment(rows)
+        self.playlistSparse = self.NNC.playlistData
         return self.NNC
 
+    @instrument.timed("buildBaseClassifier")
     def buildBaseClassifier(self):
         """
-        Init base classifier
+        Init base classifier, reading playlists from the playlist matrix
         """
         self.baseClassifier = BaseClassifier(
-            songs=self.songs,
-            playlists=self.playlists)
+            songs=self.songs if self.embeddings is None else None,
+            playlists=None,
+            catalog=self.catalog,
+            embeddings=self.embeddings,
+            neighbours=100,
+            playlistSparse=self.playlistSparse)
         return self.baseClassifier
 
+    def buildHybridClassifier(self):
+        """
+        Init hybrid classifier over the NNC and the base classifier's embeddings
+        """
+        self.hybridClassifier = HybridClassifier(self.NNC, self.baseClassifier, **(self.hybridParams or {}))
+        return self.hybridClassifier
+
+    def buildColdStart(self):
+        """
+        Init cold-start classifier from the playlist matrix and names; its
+        index is built on the first cold request
+        """
+        self.coldStart = ColdStartClassifier(self.playlistSparse, self.playlistNames, self.catalog)
+        return self.coldStart
+
     def setClassifier(self, classifier="NNC"):
         """
-        Select classifier to set as main classifier
+        Select classifier to set as main classifier, behind the cold-start
+        router when there is a threshold
         """
         if classifier == "NNC":
             self.classifier = self.NNC
         elif classifier == "Base":
             self.classifier = self.baseClassifier
-
+        elif classifier == "Hybrid":
+            self.classifier = self.hybridClassifier
+        else:
+            return
+        if self.coldStart is not None and self.coldStartThreshold:
+            self.classifier = ColdStartRouter(self.classifier, self.coldStart, self.coldStartThreshold)
+
+    @instrument.timed("readData")
     def readData(self, numFilesToProcess):
         """
         Read song and playlist data
@@ -77,10 +163,26 @@ class SpotifyExplorer:
         # Construct the full file path
         file_path = os.path.join(current_directory, "playlist.pkl")
         # don't have to write every time
-        if numFilesToProcess > 0:
+        ingested = numFilesToProcess > 0 and self.mpdDir is not None
+        if ingested:
+            parts = ingest.ingestSlices(self.mpdDir, os.path.join(current_directory, "data", "ingest"),
+                                        numFiles=numFilesToProcess)
+            # With a store the parts are streamed into it instead of merged in memory
+            if self.storeDir is not None:
+                ingest.finalizeStore(parts, self.storeDir)
+            else:
+                ingest.finalize(parts, os.path.join(current_directory, "data"))
+        elif numFilesToProcess > 0:
             path = os.path.join(current_directory, "data", "playlist_with_embeddings_dataset.pkl")
             dataIn.createDFs(path, idx=0, num_files=numFilesToProcess)
 
+        if self.storeDir is not None:
+            if (numFilesToProcess > 0 and not ingested) or not DataStore.exists(self.storeDir):
+                print(f"Converting pickled data to store at {self.storeDir}")
+                convertPickles(os.path.join(current_directory, "data"), self.storeDir)
+            self.readStore()
+            return
+
         # Read data
         print("Reading data")
         # Ensure the directory exists, you may not need to create it manually if it's guaranteed to exist
@@ -88,8 +190,140 @@ class SpotifyExplorer:
         self.playlists = pd.read_pickle(os.path.join(current_directory, "data", "playlists.pkl"))
         self.songs = pd.read_pickle(os.path.join(current_directory, "data", "tracks.pkl"))
         self.songs = self.songs[self.songs != '1fnuyUQC4OLHLjapBWKeKv']
-        self.playlistSparse = pd.read_pickle(os.path.join(current_directory, "data", "playlistSparse.pkl"))
-        print(f"Working with {len(self.playlists)} playlists " + f"and {len(self.songs)} songs")
+        sparsePath = os.path.join(current_directory, "data", "playlistSparse.pkl")
+        self.playlistSparse = pd.read_pickle(sparsePath)
+        self.sparseFingerprint = pickledFingerprint(sparsePath)
+        self.catalog = TrackCatalog.fromSongs(self.songs)
+        self.embeddings = None
+        dataDir = os.path.join(current_directory, "data")
+        if hasEmbeddings(dataDir):
+            self.embeddings = loadEmbeddings(dataDir)
+            if len(self.embeddings[0]) != len(self.catalog) or \
+                    not matchesCatalog(dataDir, self.embeddings[0], self.catalog):
+                print("Stored embeddings do not match the track catalog, parsing from songs")
+                self.embeddings = None
+        print(f"Working with {len(self.playlists)} playlists " + f"and {len(self.catalog)} unique songs")
+
+    def readStore(self):
+        """
+        Memory-map the playlist matrix and catalog from the data store.
+        The playlists and songs DataFrames are only built when first used.
+        """
+        print("Reading data store")
+        self.store = DataStore(self.storeDir)
+        self.playlistSparse = self.store.playlistSparse()
+        self.sparseFingerprint = self.store.manifest["playlistSparse"].get("fingerprint")
+        deltas = self.store.deltas()
+        if deltas:
+            self.playlistSparse = SegmentedMatrix(self.playlistSparse, deltas)
+        self.catalog = self.store.catalog()
+        self.embeddings = self.store.embeddings(self.catalog)
+        self._playlists = self._songs = None
+        self._pendingPlaylists = ()
+        print(f"Working with {self.store.manifest['playlists']['rows']} playlist tracks " +
+              f"and {len(self.catalog)} unique songs")
+
+    @property
+    def playlists(self):
+        if self._playlists is None and self.store is not None:
+            self._playlists = self.store.playlistsFrame(self.catalog)
+        elif self._pendingPlaylists:
+            self._playlists = pd.concat([self._playlists, *self._pendingPlaylists], ignore_index=True)
+        self._pendingPlaylists = ()
+        return self._playlists
+
+    @playlists.setter
+    def playlists(self, playlists):
+        self._playlists = playlists
+
+    @property
+    def songs(self):
+        if self._songs is None and self.store is not None:
+            self._songs = self.store.songsFrame(self.catalog)
+        return self._songs
+
+    @songs.setter
+    def songs(self, songs):
+        self._songs = songs
+
+    def playlistNames(self):
+        """
+        Playlist Name per Playlist ID, read from the store without building
+        the playlists DataFrame when there is one
+        """
+        if self.store is not None:
+            # Appended playlists are in the store's segments
+            return self.store.playlistNames()
+        return self.playlists.drop_duplicates("Playlist ID").set_index("Playlist ID")["Playlist Name"]
+
+    def appendPlaylists(self, playlists, songs=None):
+        """
+        Add new playlists without rebuilding anything: their unseen tracks are
+        appended to the catalog and their rows become a delta segment of the
+        playlist matrix and neighbour index, searchable straight away and
+        written to the store as a segment when there is one.
+
+        Args:
+            playlists (DataFrame): Playlist Name/Playlist ID/Track URI rows with bare
+                track ids, all Playlist IDs after the current last matrix row
+            songs (DataFrame): Track Name and Artist Name indexed by Track URI for
+                tracks that are new to the catalog
+        """
+        rowOffset = self.playlistSparse.shape[0]
+        playlistIDs = playlists["Playlist ID"].to_numpy(dtype=np.int64)
+        if len(playlistIDs) == 0:
+            return
+        if playlistIDs.min() < rowOffset:
+            raise ValueError(f"Appended Playlist IDs must start at {rowOffset} or later")
+
+        uris = playlists["Track URI"].to_numpy(dtype=object)
+        if songs is not None:
+            metadata = songs[~songs.index.duplicated()].reindex(uris)
+            names, artists = metadata["Track Name"].values, metadata["Artist Name"].values
+        else:
+            names = artists = np.full(len(uris), None, dtype=object)
+        firstTrackID = len(self.catalog)
+        self.catalog.numColumns = max(self.catalog.numColumns, self.playlistSparse.shape[1])
+        trackIDs = self.catalog.append(uris, names, artists)
+
+        rows = coo_matrix((np.ones(len(uris), dtype=np.float32),
+                           (playlistIDs - rowOffset, self.catalog.sparseIds[trackIDs])),
+                          shape=(int(playlistIDs.max()) + 1 - rowOffset, self.catalog.numColumns)).tocsr()
+        rows.sum_duplicates()
+        rows.data[:] = 1
+        self.NNC.addSegment(rows)
+        self.playlistSparse = self.baseClassifier.playlistSparse = self.NNC.playlistData
+
+        if self.store is not None:
+            writeSegment(self.storeDir, rows, rowOffset, playlists, self.catalog, firstTrackID)
+            self._songs = None
+        if self._playlists is not None:
+            self._pendingPlaylists = list(self._pendingPlaylists) + [playlists]
+        if self.coldStart is not None:
+            self.coldStart.extend(self.playlistSparse,
+                                  playlists.drop_duplicates("Playlist ID").set_index("Playlist ID")["Playlist Name"])
+        print(f"Appended {len(np.unique(playlistIDs))} playlists and {len(self.catalog) - firstTrackID} new songs")
+
+    def compact(self):
+        """
+        Merge appended segments into the catalog, playlist matrix and
+        neighbour index, rewriting the store without segments if there is one
+        """
+        if not isinstance(self.playlistSparse, SegmentedMatrix):
+            return
+        self.catalog = self.catalog.compact()
+        self.NNC.catalog = self.baseClassifier.catalog = self.catalog
+        self.NNC.compact()
+        self.playlistSparse = self.baseClassifier.playlistSparse = self.NNC.playlistData
+        self.sparseFingerprint = self.NNC.fingerprint
+        if self.coldStart is not None:
+            # Compaction merges rows and tracks without changing them, so the index stays valid
+            self.coldStart.playlistSparse, self.coldStart.catalog = self.playlistSparse, self.catalog
+        if self.store is not None:
+            compactStore(self.storeDir, self.store, self.catalog, self.playlistSparse, self.embeddings,
+                         self.NNC.fingerprint)
+            self.store = DataStore(self.storeDir)
+            self.embeddings = self.store.embeddings(self.catalog)
 
     def getRandomPlaylist(self):
         playlist_id = self.playlists.sample().get("Playlist ID").iloc[0]
@@ -98,11 +332,41 @@ class SpotifyExplorer:
 
         # return self.playlists.iloc[random.randint(0, len(self.playlists) - 1)]
 
-    def predictNeighbour(self, playlist, numPredictions, songs):
+    @instrument.timed("predictNeighbour")
+    def predictNeighbour(self, playlist, numPredictions, songs=None):
+        """
+        Use currently selected predictor to predict neighborings songs,
+        answered from the cache when the same playlist was seen before.
+        songs is ignored, the classifiers read tracks from the catalog
         """
-        Use currently selected predictor to predict neighborings songs
+        if self.cache is None:
+            return self.classifier.predict(playlist, numPredictions)
+        self.cache.validate(self.modelFingerprint())
+        name, key, limit = self.classifier.name, playlistKey(playlist), prefixLimit(self.classifier)
+        predictions = self.cache.get(name, key, numPredictions, limit)
+        if predictions is None:
+            predictions = self.classifier.predict(playlist, numPredictions)
+            self.cache.put(name, key, numPredictions, predictions, limit)
+        return predictions
+
+    def modelFingerprint(self):
         """
-        return self.classifier.predict(playlist, numPredictions, songs)
+        Identifies the classifiers and the data they were built from, so
+        cached predictions are dropped after a rebuild, append or compaction
+        """
+        return (id(self.NNC), id(self.baseClassifier), id(self.hybridClassifier), id(self.coldStart),
+                self.NNC.fingerprint, self.playlistSparse.shape, len(self.NNC.segmentModels), len(self.catalog))
+
+    def datasetProfile(self, path=None, topK=1000):
+        """
+        Dataset analytics rendered by util.vis, built in one pass over the
+        playlist matrix and cached under data/ until the data changes
+        """
+        path = path or os.path.join(os.getcwd(), "data", "profile.json")
+        fingerprint = [self.NNC.fingerprint, list(self.playlistSparse.shape), len(self.NNC.segmentModels),
+                       len(self.catalog), topK]
+        return analytics.cachedProfile(path, fingerprint, lambda: analytics.buildProfile(
+            self.playlistSparse, self.catalog, self.playlistNames().to_numpy(), topK))
 
     def obscurePlaylist(self, playlist, obscurity):
         """
@@ -114,7 +378,7 @@ class SpotifyExplorer:
         tracks = [i for i in playlist['Track URI'] + obscured if i not in playlist['Track URI'] or i not in obscured]
         return tracks, obscured
 
-    def evalAccuracy(self, numPlaylists, percentToObscure=0.15):
+    def evalAccuracy(self, numPlaylists, percentToObscure=0.15, numPredictions=50):
         """
         Obscures a percentage of songs
         Iterates and sees how many reccomendations match the missing songs
@@ -130,9 +394,7 @@ class SpotifyExplorer:
             obscured = set(obscured)
             # playlistSub['Track URI'] = keptTracks
             playlistSub = playlistSub[playlistSub['Track URI'].isin(keptTracks)]
-            predictions = self.predictNeighbour(playlistSub,
-                                                k,
-                                                self.songs)
+            predictions = self.predictNeighbour(playlistSub, numPredictions)
 
             overlap = set(predictions) & set(obscured)
 
@@ -143,18 +405,26 @@ class SpotifyExplorer:
         print(f"We predicted {avgAcc}% of obscured songs")
         return avgAcc
 
+    def evalSweep(self, numPlaylists, maxK=100, percentToObscure=0.25, seed=0, workers=None, ks=None):
+        """
+        Precision, recall, R-precision, NDCG and clicks of the current classifier
+        for the cutoffs ks (every k up to maxK by default), on a seeded held-out
+        set saved under data/
+        """
+        path = os.path.join(os.getcwd(), "data", f"holdout_{numPlaylists}_{int(percentToObscure * 100)}_{seed}.pkl")
+        holdout = evaluation.buildHoldout(self.playlists, numPlaylists, percentToObscure, seed, path)
+        return evaluation.evaluate(self.classifier, holdout, maxK, workers, ks=ks)
+
     def displayRandomPrediction(self):
         playlist = self.getRandomPlaylist()
         while len(playlist["Track URI"]) < 10:
             playlist = self.getRandomPlaylist()
 
-        predictions = self.predictNeighbour(playlist,
-                                            50,
-                                            self.songs)
+        predictions = self.predictNeighbour(playlist, 50)
 
         playlistName = playlist["Playlist Name"]
-        playlist = [getTrackandArtist(trackURI, self.songs) for trackURI in playlist["Track URI"]]
-        predictions = [getTrackandArtist(trackURI, self.songs) for trackURI in predictions["Track URI"]]
+        playlist = [getTrackandArtist(trackURI, self.catalog) for trackURI in playlist["Track URI"]]
+        predictions = [getTrackandArtist(trackURI, self.catalog) for trackURI in predictions]
         return {
             "Playlist Name": playlistName,
             "Playlist": playlist,
@@ -181,24 +451,18 @@ if __name__ == "__main__":
     # Init class
     spotify_explorer = SpotifyExplorer(numToParse)
 
-    k_values = range(1, 101)
-    accuracies_NNC = []
-    accuracies_Base = []
-
-    for k in k_values:
-        print("NNC")
-        spotify_explorer.setClassifier("NNC")
-        accuracy_NNC = spotify_explorer.evalAccuracy(100, percentToObscure=0.25)
-        accuracies_NNC.append(accuracy_NNC)
-
-        print("Base")
-        spotify_explorer.setClassifier("Base")
-        accuracy_Base = spotify_explorer.evalAccuracy(30, percentToObscure=0.25)
-        accuracies_Base.append(accuracy_Base)
+    results = {}
+    for name, numPlaylists in (("NNC", 100), ("Base", 30)):
+        print(name)
+        spotify_explorer.setClassifier(name)
+        # Every k comes from one ranking pass for the NNC; the base classifier is ranked once per cutoff
+        ks = None if prefixLimit(spotify_explorer.classifier) >= 100 else range(5, 101, 5)
+        results[name] = spotify_explorer.evalSweep(numPlaylists, maxK=100, percentToObscure=0.25, ks=ks)
+        print(results[name].loc[[10, 50, 100]])
 
     # Plotting
-    plt.plot(k_values, accuracies_NNC, label='NNC')
-    plt.plot(k_values, accuracies_Base, label='Base')
+    for name, result in results.items():
+        plt.plot(result.index, result['recall'] * 100, label=name)
     plt.xlabel('k')
     plt.ylabel('Accuracy')
     plt.title('Accuracy for different values of k')
@@ -1,14 +1,47 @@
 import pandas as pd
 import numpy as np
 import ast
-from sklearn.metrics.pairwise import cosine_similarity
+from util import instrument
+from util.catalog import TrackCatalog
+from util.segments import matrixBlocks
+from util.similarity import normalizeRows, topkNeighbours
 
 
 class BaseClassifier:
-    def __init__(self, songs, playlists):
-        self.songs = songs
+    """
+    Args:
+        songs (DataFrame): tracks indexed by Track URI with lyrics embeddings,
+            only needed when embeddings is not given
+        playlists (DataFrame): playlist/track rows, only needed when playlistSparse is not given
+        catalog (TrackCatalog): shared track catalog, built from songs if omitted
+        embeddings (tuple): (matrix, valid) from util.embeddings.loadEmbeddings, aligned
+            with the catalog; used instead of parsing songs['lyrics_embedding']
+        neighbours (int): if set, build a top-k neighbour index with this many
+            neighbours per track instead of the dense NxN similarity matrix;
+            requests for more recommendations are rated over all of them
+        block_size (int): rows per block when building the top-k index
+        playlistSparse (CSR matrix or SegmentedMatrix): playlist matrix, rows indexed by
+            Playlist ID, read for playlist tracks and candidates instead of playlists
+    """
+    def __init__(self, songs, playlists, catalog=None, embeddings=None, neighbours=None, block_size=1024,
+                 playlistSparse=None):
+        self.name = "Base"
+        # topk is also the neighbour count, so lists for different counts are scored differently
+        self.prefixLimit = 0
+        self.catalog = catalog if catalog is not None else TrackCatalog.fromSongs(songs)
+        # One row per catalog track; duplicated occurrences carry the same embedding
+        self.songs = songs[~songs.index.duplicated()].copy() if embeddings is None else None
+        self.embeddings = embeddings
         self.playlists = playlists
+        self.playlistSparse = playlistSparse
+        self.candidates = None
+        self.vectors = None
+        self.neighbours = neighbours
+        self.block_size = block_size
         self.sim_matrix = None
+        self.nbr_index = None
+        self.nbr_sims = None
+        self.build_stats = None
         self.prepare_data()
 
     def convert_embedding(self, x):
@@ -25,11 +58,18 @@ class BaseClassifier:
             return np.array(x)
         return np.nan
 
+    @instrument.timed("Base.prepare_data")
     def prepare_data(self):
         """Prepare data by converting, cleaning, and calculating similarity matrix."""
-        self.convert_embeddings()
-        self.clean_data()
-        self.calculate_similarity_matrix()
+        if self.embeddings is not None:
+            self.load_embeddings()
+        else:
+            self.convert_embeddings()
+            self.clean_data()
+        if self.neighbours is None:
+            self.calculate_similarity_matrix()
+        else:
+            self.calculate_topk_neighbours()
 
     def convert_embeddings(self):
         """Apply conversion to all embeddings in the dataframe."""
@@ -38,30 +78,90 @@ class BaseClassifier:
     def clean_data(self):
         """Remove rows where 'lyrics_embedding' is NaN and update indices."""
         self.songs.dropna(subset=['lyrics_embedding'], inplace=True)
-        print("Valid embeddings count:", len(self.songs))
+        self.set_rows(self.catalog.toIds(self.songs.index))
+        if not self.songs.empty:
+            self.vectors = normalizeRows(np.stack(self.songs['lyrics_embedding'].values))
+
+    def load_embeddings(self):
+        """Use the rows of a binary, pre-normalized embedding matrix for valid tracks."""
+        matrix, valid = self.embeddings
+        self.set_rows(np.flatnonzero(valid))
+        # Avoid copying a memory-mapped matrix when every track has an embedding
+        self.vectors = matrix if valid.all() else matrix[self.ids]
+
+    def set_rows(self, ids):
+        """Map between similarity rows and catalog track ids."""
+        self.ids = ids
+        self.rows = np.full(len(self.catalog), -1, dtype=np.int64)
+        self.rows[self.ids] = np.arange(len(self.ids))
+        print("Valid embeddings count:", len(self.ids))
 
     def calculate_similarity_matrix(self):
-        """Calculate the cosine similarity matrix from the embeddings."""
-        if not self.songs.empty:
-            vectors = np.stack(self.songs['lyrics_embedding'].values)
-            self.sim_matrix = cosine_similarity(vectors)
+        """Calculate the cosine similarity matrix as a dot product of normalized embeddings."""
+        if len(self.ids):
+            self.sim_matrix = self.vectors @ self.vectors.T
             print("Similarity matrix calculated.")
         else:
             print("No valid embeddings available to calculate similarity.")
 
+    def calculate_topk_neighbours(self):
+        """Calculate the top-k neighbour index in bounded-memory row blocks."""
+        if len(self.ids):
+            self.nbr_index, self.nbr_sims, self.build_stats = topkNeighbours(
+                self.vectors, self.neighbours, blockSize=self.block_size, normalized=True)
+            print(f"Top-{self.build_stats['k']} neighbour index calculated for {self.build_stats['rows']} tracks "
+                  f"in {self.build_stats['seconds']:.2f}s ({self.build_stats['rowsPerSec']:.0f} rows/s)")
+        else:
+            print("No valid embeddings available to calculate similarity.")
+
     def index_to_uri(self, index):
-        return self.songs.index[index]
+        return self.catalog.uris[self.ids[index]]
 
     def uri_to_index(self, uri):
-        return np.where(self.songs.index == uri)[0][0]
+        track_id = self.catalog.toId(uri)
+        if track_id is None or track_id >= len(self.rows) or self.rows[track_id] < 0:
+            raise KeyError(f"No embedding for track {uri}")
+        return self.rows[track_id]
 
+    def uris_to_rows(self, uris):
+        """Similarity rows for many URIs at once, -1 where a track has no embedding."""
+        ids = self.catalog.toIds(uris)
+        # Tracks appended to the catalog after the rows were set have no embedding
+        ids[ids >= len(self.rows)] = -1
+        return np.where(ids >= 0, self.rows[ids], -1)
 
     def get_uris_in_playlist(self, playlist_id):
-        playlist = self.playlists[self.playlists['Playlist ID'] == playlist_id]
-        return set(playlist['Track URI'])
+        if self.playlistSparse is None:
+            playlist = self.playlists[self.playlists['Playlist ID'] == playlist_id]
+            return set(playlist['Track URI'])
+        if not 0 <= playlist_id < self.playlistSparse.shape[0]:
+            return set()
+        ids = self.catalog.columnIds(self.playlistSparse[[playlist_id]].indices)
+        return set(self.catalog.uris[ids[ids >= 0]])
+
+    def candidate_uris(self):
+        """
+        Unique Track URIs of all playlists. From the playlist matrix they are
+        in track id order and cached until the matrix changes shape.
+        """
+        if self.playlistSparse is None:
+            return self.playlists['Track URI'].unique()
+        key = (id(self.playlistSparse), self.playlistSparse.shape, self.playlistSparse.nnz)
+        if self.candidates is None or self.candidates[0] != key:
+            used = np.zeros(self.playlistSparse.shape[1], dtype=bool)
+            for _, block in matrixBlocks(self.playlistSparse):
+                used[block.indices] = True
+            ids = self.catalog.columnIds(np.flatnonzero(used))
+            ids = np.sort(ids[ids >= 0])
+            self.candidates = (key, np.asarray(self.catalog.uris[ids], dtype=object))
+        return self.candidates[1]
 
     def get_topk_index_sim(self, uri, k):
         index = self.uri_to_index(uri)
+        if self.nbr_index is not None:
+            if k > self.nbr_index.shape[1]:
+                raise ValueError(f"Neighbour index holds {self.nbr_index.shape[1]} neighbours, {k} requested")
+            return [[index, sim] for index, sim in zip(self.nbr_index[index, :k], self.nbr_sims[index, :k])]
         sims = self.sim_matrix[index]
         top_k_indices = np.argsort(sims)[::-1][:k + 1]  # Include k+1 to skip the first identical item
         top_k_sims = sims[top_k_indices]
@@ -79,53 +179,105 @@ class BaseClassifier:
                 num += sim
         return num / denom
 
-    def get_recommendations(self, playlist_id, topk=10):
+    def get_neighbour_arrays(self, rows, k):
+        """
+        Top-k neighbour rows and similarities for many song rows at once,
+        ordered exactly as get_topk_index_sim orders them.
+        """
+        if self.nbr_index is not None:
+            if k > self.nbr_index.shape[1]:
+                raise ValueError(f"Neighbour index holds {self.nbr_index.shape[1]} neighbours, {k} requested")
+            return self.nbr_index[rows, :k], self.nbr_sims[rows, :k]
+        nbr_rows = np.empty((len(rows), min(k, self.sim_matrix.shape[1] - 1)), dtype=np.intp)
+        nbr_sims = np.empty(nbr_rows.shape, dtype=self.sim_matrix.dtype)
+        # Work through the dense matrix in row blocks to avoid copying all of it
+        for lo in range(0, len(rows), self.block_size):
+            sims = self.sim_matrix[rows[lo:lo + self.block_size]]
+            top = np.argsort(sims, axis=1)[:, ::-1][:, 1:k + 1]
+            nbr_rows[lo:lo + len(top)] = top
+            nbr_sims[lo:lo + len(top)] = np.take_along_axis(sims, top, axis=1)
+        return nbr_rows, nbr_sims
+
+    def estimate_ratings(self, nbr_rows, nbr_sims, in_plist):
+        """
+        Vectorized estimate_rating for every candidate row at once.
+        in_plist is a boolean mask over song rows marking playlist members.
+        Columns are accumulated in order so results match the scalar loop exactly.
+        """
+        num = np.zeros(len(nbr_rows), dtype=nbr_sims.dtype)
+        denom = np.zeros(len(nbr_rows), dtype=nbr_sims.dtype)
+        for j in range(nbr_rows.shape[1]):
+            sims = nbr_sims[:, j]
+            denom += sims
+            num += np.where(in_plist[nbr_rows[:, j]], sims * 5, sims)
+        return num / denom
+
+    def neighbour_count(self, topk):
+        """Neighbours a rating is taken over: topk, at most as many as the top-k index holds."""
+        return topk if self.nbr_index is None else min(topk, self.nbr_index.shape[1])
+
+    @instrument.timed("Base.get_recommendations")
+    def get_recommendations(self, playlist_id, topk=10, batched=True):
+        if not batched:
+            return self.get_recommendations_loop(playlist_id, topk)
+        with instrument.stage("Base.candidates"):
+            uris_in_plist = self.get_uris_in_playlist(playlist_id)
+            unique_track_uris = self.candidate_uris()
+            candidates = unique_track_uris[~pd.Index(unique_track_uris).isin(uris_in_plist)]
+
+            song_rows = self.uris_to_rows(candidates)
+            candidates, song_rows = candidates[song_rows >= 0], song_rows[song_rows >= 0]
+
+        with instrument.stage("Base.neighbours"):
+            nbr_rows, nbr_sims = self.get_neighbour_arrays(song_rows, self.neighbour_count(topk))
+        with instrument.stage("Base.ratings"):
+            in_plist = np.zeros(len(self.ids), dtype=bool)
+            plist_rows = self.uris_to_rows(list(uris_in_plist))
+            in_plist[plist_rows[plist_rows >= 0]] = True
+            ratings_df = pd.DataFrame({'Track URI': candidates,
+                                       'estimated_rating': self.estimate_ratings(nbr_rows, nbr_sims, in_plist)})
+        with instrument.stage("Base.provide_recs"):
+            return self.provide_recs(ratings_df, topk)
+
+    def get_recommendations_loop(self, playlist_id, topk=10):
+        """Reference per-track implementation, kept to verify the batched scorer."""
         uris_in_plist = self.get_uris_in_playlist(playlist_id)
         rows = []
-        unique_track_uris = self.playlists['Track URI'].unique().tolist()
+        unique_track_uris = self.candidate_uris().tolist()
         for uri in unique_track_uris:
             if uri not in uris_in_plist:
                 try:
-                    topk_sim = self.get_topk_index_sim(uri, topk)
+                    topk_sim = self.get_topk_index_sim(uri, self.neighbour_count(topk))
                     est_rating = self.estimate_rating(topk_sim, uris_in_plist)
                 except Exception as e:
                     print(e)
+                    continue
                 rows.append({'Track URI': uri, 'estimated_rating': est_rating})
         ratings_df = pd.DataFrame(rows)
         return self.provide_recs(ratings_df, topk)
 
     def provide_recs(self, ratings_df, k):
-        ratings_df = ratings_df.sort_values(by='estimated_rating', ascending=False)
-        top_k_ratings_df = ratings_df.head(k)
-        rows = []
-        for i, row in top_k_ratings_df.iterrows():
-            uri = row['Track URI']
-            rating = row['estimated_rating']
-            match = self.songs[self.songs.index == uri]
-            # Extract fields
-            tr_name = match['Track Name'].values[0]
-            art_name = match['Artist Name'].values[0]
-            trk_uri = match.index.values[0]
-
-            # Create new row for official recommendation
-            new_row = {'Track URI': trk_uri, 'Track Name': tr_name, 'Artist Name': art_name,
-                       'Recommendation Score': rating}
+        if ratings_df.empty:
+            return self.catalog.decorate([], [])
+        # Stable, so tied ratings keep the candidate order
+        top_k_ratings_df = ratings_df.sort_values(by='estimated_rating', ascending=False, kind='stable').head(k)
+        return self.catalog.decorate(self.catalog.toIds(top_k_ratings_df['Track URI']),
+                                     top_k_ratings_df['estimated_rating'].values)
 
-            rows.append(new_row)
-
-        return pd.DataFrame(rows)
+    def validate(self, playlist):
+        """
+        Raise ValueError unless the playlist carries the playlist ID predict ranks from
+        """
+        if 'Playlist ID' not in playlist or (not isinstance(playlist, dict) and playlist.empty):
+            raise ValueError("the Base classifier needs a playlist ID")
 
-    def predict(self, playlist, num_predictions, songs):
+    def predict(self, playlist, num_predictions, songs=None):
         """
-        Adjusted to accept playlist object and song list; generates song recommendations based on playlist ID.
+        Adjusted to accept playlist object; generates song recommendations based on playlist ID.
+        songs is ignored, recommendations are already catalog Track URIs.
         """
+        self.validate(playlist)
         # Extract playlist_id from playlist object; adjust this depending on playlist structure
         playlist_id = playlist['Playlist ID'] if isinstance(playlist, dict) else playlist['Playlist ID'].iloc[0]
-        try:
-            recommendations = self.get_recommendations(playlist_id, num_predictions)
-            # Now, let's return recommendations in the expected format (like what predictNeighbour might expect)
-            recommended_songs = songs[songs.index.isin(recommendations['Track URI'])]
-            return recommended_songs.index.values
-        except Exception as e:
-            print(f"Error in prediction for BaseClassifier: {e}")
-            return pd.DataFrame()
+        recommendations = self.get_recommendations(playlist_id, num_predictions)
+        return recommendations['Track URI'].values
@@ -0,0 +1,261 @@
+import math
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, csr_matrix
+
+from models.NNeighClassifier import topOrder
+from util import instrument
+from util.helpers import nameTokens, playlistName, prefixLimit
+from util.segments import matrixBlocks
+
+
+class ColdStartClassifier:
+    """
+    Recommendations for playlists with few or no tracks, from the playlist name.
+
+    An inverted index maps every name token used by at least minPlaylists
+    playlists to the topK tracks most often found in playlists whose name
+    has that token, scored by the share of those playlists holding the
+    track. A request sums the scores of its tokens, drops its own tracks and
+    fills up from the global popularity ranking, so answering is a few
+    dictionary lookups over precomputed lists. The index is built on first
+    use, and appended playlists are added with extend(), which only reranks
+    the tokens in their names.
+
+    Args:
+        playlistSparse (CSR matrix or SegmentedMatrix): playlist matrix, rows indexed by Playlist ID
+        names (Series or callable): Playlist Name indexed by Playlist ID, or a function
+            returning it when the index is built
+        catalog (TrackCatalog): shared track catalog
+        topK (int): tracks kept per token and in the popularity ranking
+        minPlaylists (int): playlists a token needs to be indexed
+    """
+
+    def __init__(self, playlistSparse, names, catalog, topK=200, minPlaylists=2):
+        self.name = "ColdStart"
+        # Token rankings and the popularity fill-up are tie-broken, so any top N is a prefix
+        self.prefixLimit = math.inf
+        self.playlistSparse = playlistSparse
+        self.names = names
+        self.catalog = catalog
+        self.topK = topK
+        self.minPlaylists = minPlaylists
+        self._tokens = None
+        self._popular = None
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self.buildIndex()
+        return self._tokens
+
+    @property
+    def popular(self):
+        if self._popular is None:
+            self.buildIndex()
+        return self._popular
+
+    @instrument.timed("ColdStart.buildIndex")
+    def buildIndex(self):
+        """
+        Count track occurrences per name token with one sparse product of
+        (tokens x playlists) and (playlists x tracks) per block of matrix
+        rows. Rows without tracks are not counted as playlists.
+        """
+        names = self.names() if callable(self.names) else self.names
+        self.numRows = self.numPlaylists = 0
+        self.trackCounts = np.zeros(0)
+        # Playlist rows of every name token, indexed or not
+        self.postings = {}
+        self._tokens = {}
+        self.addRows(names)
+
+    def extend(self, playlistSparse, names):
+        """
+        Count the playlists of playlistSparse past the rows already indexed,
+        named by names (Playlist Name indexed by Playlist ID): track counts
+        and popularity are updated and only the tokens of their names are
+        reranked, giving the same index as a rebuild
+        """
+        self.playlistSparse = playlistSparse
+        if self._tokens is not None:
+            self.addRows(names)
+        elif not callable(self.names):
+            self.names = pd.concat([self.names, names])
+
+    def rowBlocks(self, lo):
+        """
+        (first row, CSR block) of the matrix rows from lo on, every block
+        widened to the full column count
+        """
+        numColumns = self.playlistSparse.shape[1]
+        blocks = []
+        for first, block in matrixBlocks(self.playlistSparse):
+            if first + block.shape[0] <= lo:
+                continue
+            block = csr_matrix((block.data, block.indices, block.indptr), shape=(block.shape[0], numColumns))
+            blocks.append((lo, block[lo - first:]) if first < lo else (first, block))
+        return blocks
+
+    def addRows(self, names):
+        """
+        Add the matrix rows past the indexed ones to the track counts and
+        postings, and rank every token they changed
+        """
+        numRows, numColumns = self.playlistSparse.shape
+        blocks = self.rowBlocks(self.numRows)
+        nonEmpty = np.concatenate([np.diff(block.indptr) > 0 for _, block in blocks]) if blocks else np.zeros(0, bool)
+        self.numPlaylists += int(nonEmpty.sum())
+        columnIds = self.catalog.columnIds(np.arange(numColumns))
+        used = columnIds >= 0
+
+        # Matrix entries are 0/1, so a column's entry count is its playlist count
+        columnCounts = np.zeros(numColumns, dtype=np.int64)
+        for _, block in blocks:
+            columnCounts += np.bincount(block.indices, minlength=numColumns)
+        counts = np.bincount(columnIds[used], weights=columnCounts[used], minlength=len(self.catalog))
+        counts[:len(self.trackCounts)] += self.trackCounts
+        self.trackCounts = counts
+        self._popular = self.topTracks(np.arange(len(counts)), counts / max(self.numPlaylists, 1))[0]
+
+        playlistIDs = names.index.to_numpy(dtype=np.int64)
+        keep = (playlistIDs >= self.numRows) & (playlistIDs < numRows)
+        keep[keep] = nonEmpty[playlistIDs[keep] - self.numRows]
+        changed = set()
+        for row, name in zip(playlistIDs[keep], names.to_numpy()[keep]):
+            for token in nameTokens(name):
+                self.postings.setdefault(token, []).append(row)
+                changed.add(token)
+        self.numRows = numRows
+        self.rankTokens([token for token in changed if len(self.postings[token]) >= self.minPlaylists])
+
+    def rankTokens(self, tokens):
+        """
+        Rank the tracks of the playlists of every token from its postings.
+        Only the matrix rows in those postings are read, so reranking a few
+        tokens after extend() costs time proportional to their playlists.
+        """
+        if not tokens:
+            return
+        rows = [self.postings[token] for token in tokens]
+        lengths = np.array([len(tokenRows) for tokenRows in rows])
+        needed = np.unique(np.concatenate(rows))
+        tokenPlaylists = coo_matrix((np.ones(lengths.sum(), dtype=np.float32),
+                                     (np.repeat(np.arange(len(tokens)), lengths),
+                                      np.searchsorted(needed, np.concatenate(rows)))),
+                                    shape=(len(tokens), len(needed))).tocsc()
+        cooccurrence = csr_matrix((len(tokens), self.playlistSparse.shape[1]), dtype=np.float32)
+        for first, block in self.rowBlocks(0):
+            lo, hi = np.searchsorted(needed, [first, first + block.shape[0]])
+            if lo == hi:
+                continue
+            # Blocks whose every row is needed are multiplied as they are
+            part = block if hi - lo == block.shape[0] else block[needed[lo:hi] - first]
+            cooccurrence = cooccurrence + tokenPlaylists[:, lo:hi] @ part
+        cooccurrence = cooccurrence.tocsr()
+        columnIds = self.catalog.columnIds(np.arange(cooccurrence.shape[1]))
+        used = columnIds >= 0
+        for i, token in enumerate(tokens):
+            lo, hi = cooccurrence.indptr[i], cooccurrence.indptr[i + 1]
+            columns = cooccurrence.indices[lo:hi]
+            found = used[columns]
+            self._tokens[token] = self.topTracks(columnIds[columns[found]],
+                                                 cooccurrence.data[lo:hi][found] / lengths[i])
+
+    def topTracks(self, ids, scores):
+        """
+        (Track URIs, track ids, scores) of the topK highest scores, ties broken by track id
+        """
+        order = topOrder(ids, scores, self.topK)
+        return list(self.catalog.uris[ids[order]]), ids[order], scores[order]
+
+    def predict(self, X, numPredictions, songs=None):
+        """
+        x=playlist, scored from its name and never returning its own tracks;
+        songs is ignored, tracks come from the catalog
+        """
+        seen = set(X["Track URI"]) if "Track URI" in X else set()
+        tokens = [token for token in nameTokens(playlistName(X)) if token in self.tokens]
+        if len(tokens) == 1:
+            ranked = self.tokens[tokens[0]][0]
+        elif tokens:
+            ids = np.concatenate([self.tokens[token][1] for token in tokens])
+            ids, inverse = np.unique(ids, return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([self.tokens[token][2] for token in tokens]))
+            ranked = self.catalog.uris[ids[topOrder(ids, scores, numPredictions + len(seen))]]
+        else:
+            ranked = []
+
+        predictions = []
+        for uri in ranked:
+            if uri not in seen:
+                predictions.append(uri)
+                if len(predictions) == numPredictions:
+                    return predictions
+        # Fill up from the global ranking
+        chosen = seen.union(predictions)
+        for uri in self.popular:
+            if uri not in chosen:
+                predictions.append(uri)
+                if len(predictions) == numPredictions:
+                    break
+        return predictions
+
+    def predictBatch(self, playlists, numPredictions):
+        return [self.predict(X, numPredictions) for X in playlists]
+
+
+class ColdStartRouter:
+    """
+    Send playlists with fewer than threshold catalog tracks to the cold-start
+    classifier and everything else to classifier, which it stands in for
+
+    Args:
+        classifier: the classifier selected for playlists with enough tracks
+        coldStart (ColdStartClassifier): classifier for short playlists
+        threshold (int): catalog tracks a playlist needs to skip the cold-start path
+    """
+
+    def __init__(self, classifier, coldStart, threshold):
+        self.classifier = classifier
+        self.coldStart = coldStart
+        self.threshold = threshold
+        self.name = classifier.name
+
+    @property
+    def prefixLimit(self):
+        return min(prefixLimit(self.classifier), prefixLimit(self.coldStart))
+
+    def isCold(self, X):
+        uris = X["Track URI"] if "Track URI" in X else []
+        if len(uris) < self.threshold:
+            return True
+        ids = self.coldStart.catalog.toIds(np.asarray(uris, dtype=object))
+        return len(np.unique(ids[ids >= 0])) < self.threshold
+
+    def validate(self, X):
+        """
+        Warm playlists have to suit the wrapped classifier
+        """
+        validate = getattr(self.classifier, "validate", None)
+        if validate is not None and not self.isCold(X):
+            validate(X)
+
+    def predict(self, X, numPredictions, songs=None):
+        if self.isCold(X):
+            return self.coldStart.predict(X, numPredictions)
+        return self.classifier.predict(X, numPredictions)
+
+    def predictBatch(self, playlists, numPredictions):
+        """
+        Cold playlists one by one, the rest in one batch of the wrapped classifier
+        """
+        cold = [self.isCold(X) for X in playlists]
+        warm = [X for X, isCold in zip(playlists, cold) if not isCold]
+        if hasattr(self.classifier, "predictBatch"):
+            warm = iter(self.classifier.predictBatch(warm, numPredictions) if warm else [])
+        else:
+            warm = iter([self.classifier.predict(X, numPredictions) for X in warm])
+        return [self.coldStart.predict(X, numPredictions) if isCold else next(warm)
+                for X, isCold in zip(playlists, cold)]
@@ -0,0 +1,112 @@
+import numpy as np
+
+from models.NNeighClassifier import topOrder
+from util import instrument
+from util.helpers import playlistsToSparseMatrix, getPlaylistIDs
+
+
+class HybridClassifier:
+    """
+    Two-stage recommender: the NNC's neighbour votes pick a bounded set of
+    candidate tracks and only those are reranked by lyrics similarity to
+    the playlist, so content-aware scores cost about as much as the NNC.
+
+    A candidate's score blends its vote, scaled to [0, 1] by the best vote
+    of the playlist, with the cosine similarity of its lyrics embedding to
+    the mean embedding of the playlist's tracks. Candidates or playlists
+    without embeddings get a content similarity of 0.
+
+    Args:
+        nnc (NNeighClassifier): source of the neighbour search and candidate votes
+        base (BaseClassifier): source of the normalized lyrics embeddings
+        numCandidates (int): candidates taken from the votes per playlist
+        voteWeight (float): weight of the scaled neighbour vote
+        contentWeight (float): weight of the lyrics similarity
+        numNeighbours (int): neighbours searched per playlist
+    """
+
+    def __init__(self, nnc, base, numCandidates=300, voteWeight=0.8, contentWeight=0.2, numNeighbours=60):
+        self.name = "Hybrid"
+        self.nnc = nnc
+        self.base = base
+        self.numCandidates = numCandidates
+        self.voteWeight = voteWeight
+        self.contentWeight = contentWeight
+        self.numNeighbours = numNeighbours
+
+    @property
+    def catalog(self):
+        # Follows the NNC when compaction swaps in a new catalog
+        return self.nnc.catalog
+
+    @property
+    def prefixLimit(self):
+        # Up to numCandidates predictions rerank the same candidate set
+        return self.numCandidates
+
+    @instrument.timed("Hybrid.predict")
+    def predict(self, X, numPredictions, songs=None):
+        """
+        x=playlist, songs is ignored: tracks come from the catalog
+        """
+        return self.predictBatch([X], numPredictions)[0]
+
+    @instrument.timed("Hybrid.predictBatch")
+    def predictBatch(self, playlists, numPredictions):
+        """
+        Predict for a list of playlists with one query matrix and one
+        neighbour search, returning one prediction list per playlist
+        """
+        with instrument.stage("Hybrid.queryMatrix"):
+            sparseX = playlistsToSparseMatrix(playlists, self.catalog, self.nnc.playlistData.shape[1])
+        neighbors = self.nnc.getNeighborsBatch(sparseX, self.numNeighbours)
+        return [self.predictFromNeighbors(neighbors[i],
+                                          sparseX.indices[sparseX.indptr[i]:sparseX.indptr[i + 1]],
+                                          getPlaylistIDs(X),
+                                          numPredictions)
+                for i, X in enumerate(playlists)]
+
+    def predictFromNeighbors(self, neighbors, queryColumns, playlistIDs, numPredictions):
+        """
+        Top numPredictions Track URIs among the best voted candidates after
+        blending in lyrics similarity, ties broken by matrix column
+        """
+        columns, ids, votes = self.nnc.candidateScores(neighbors, queryColumns, playlistIDs)
+        with instrument.stage("Hybrid.candidates"):
+            keep = topOrder(columns, votes, max(self.numCandidates, numPredictions))
+            columns, ids, votes = columns[keep], ids[keep], votes[keep]
+        with instrument.stage("Hybrid.rerank"):
+            scores = self.voteWeight * votes / votes.max() if len(votes) else votes
+            scores = scores + self.contentWeight * self.contentSimilarity(ids, self.catalog.columnIds(queryColumns))
+            order = topOrder(columns, scores, numPredictions)
+            return list(self.catalog.uris[ids[order]])
+
+    def contentSimilarity(self, ids, playlistIds):
+        """
+        Cosine similarity of each candidate's lyrics embedding to the mean
+        embedding of the playlist tracks, 0 where either is missing
+        """
+        similarity = np.zeros(len(ids))
+        playlistRows = self.embeddingRows(playlistIds)
+        playlistRows = playlistRows[playlistRows >= 0]
+        if not len(playlistRows) or not len(ids):
+            return similarity
+        centroid = np.asarray(self.base.vectors[np.sort(playlistRows)], dtype=np.float64).mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        if norm == 0:
+            return similarity
+        rows = self.embeddingRows(ids)
+        found = rows >= 0
+        similarity[found] = np.asarray(self.base.vectors[rows[found]], dtype=np.float64) @ (centroid / norm)
+        return similarity
+
+    def embeddingRows(self, ids):
+        """
+        Rows of the base classifier's embedding matrix for track ids, -1 without an embedding
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        # Tracks appended to the catalog after the embeddings were loaded have none
+        known = (ids >= 0) & (ids < len(self.base.rows))
+        rows[known] = self.base.rows[ids[known]]
+        return rows
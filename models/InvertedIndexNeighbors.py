@@ -0,0 +1,73 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+
+class InvertedIndexNeighbors:
+    """
+    Exact cosine nearest neighbours over sparse playlist rows, scored
+    through an inverted index (track -> playlists).
+
+    The fitted rows are L2-normalized once and transposed, so a query only
+    touches the posting lists of its own tracks and only playlists sharing
+    at least one track with it are scored. Playlists with no overlap all sit
+    at cosine distance 1; when a query has fewer than n_neighbors
+    overlapping playlists the rest are filled from them in row order.
+
+    Drop-in for the parts of sklearn's NearestNeighbors(metric="cosine")
+    that NNeighClassifier uses.
+    """
+
+    def __init__(self, n_neighbors=5):
+        self.n_neighbors = n_neighbors
+
+    def fit(self, X):
+        rows = normalize(csr_matrix(X, dtype=np.float32), norm="l2", axis=1)
+        self.n_samples_fit_ = rows.shape[0]
+        self.n_features_in_ = rows.shape[1]
+        # Posting lists: for each track, the playlists that contain it
+        self.postings_ = rows.T.tocsr()
+        return self
+
+    def kneighbors(self, X=None, n_neighbors=None, return_distance=True):
+        k = self.n_neighbors if n_neighbors is None else n_neighbors
+        if k > self.n_samples_fit_:
+            raise ValueError(f"Expected n_neighbors <= n_samples_fit, but n_neighbors = {k}, "
+                             f"n_samples_fit = {self.n_samples_fit_}")
+        queries = normalize(csr_matrix(X, dtype=np.float32), norm="l2", axis=1)
+        scores = (queries @ self.postings_).tocsr()
+
+        neighbours = np.empty((queries.shape[0], k), dtype=np.int64)
+        distances = np.empty((queries.shape[0], k), dtype=np.float64)
+        for i in range(queries.shape[0]):
+            neighbours[i], distances[i] = self.topk(scores, i, k)
+        return (distances, neighbours) if return_distance else neighbours
+
+    def topk(self, scores, i, k):
+        """
+        Top k playlists for one row of the query x playlist score matrix
+        """
+        lo, hi = scores.indptr[i], scores.indptr[i + 1]
+        return topkCandidates(scores.indices[lo:hi], scores.data[lo:hi], k, self.n_samples_fit_)
+
+
+def topkCandidates(candidates, sims, k, numSamples):
+    """
+    Rank scored candidate rows by similarity (ties by row) and keep k,
+    filling up with unscored rows at distance 1 in row order.
+    Returns (neighbours, cosine distances).
+    """
+    if len(candidates) > k:
+        # Keep every candidate tied with the k-th similarity so ties resolve by row
+        top = sims >= -np.partition(-sims, k - 1)[k - 1]
+        candidates, sims = candidates[top], sims[top]
+    order = np.lexsort((candidates, -sims))[:k]
+    candidates, sims = candidates[order], sims[order]
+
+    if len(candidates) < k:
+        # Fall back to non-overlapping rows, all at distance 1
+        rest = np.setdiff1d(np.arange(min(numSamples, k + len(candidates))), candidates)
+        fill = k - len(candidates)
+        candidates = np.concatenate([candidates, rest[:fill]])
+        sims = np.concatenate([sims, np.zeros(fill, dtype=sims.dtype)])
+    return candidates, 1 - sims.astype(np.float64)
@@ -0,0 +1,134 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from models.InvertedIndexNeighbors import topkCandidates
+
+PRIME = (1 << 31) - 1
+EMPTY = np.iinfo(np.int64).max
+
+
+class MinHashLSH:
+    """
+    Approximate cosine nearest neighbours over sparse playlist rows.
+
+    Each playlist's track set gets a MinHash signature of bands * rows
+    hashes. Signatures are split into bands and every band is bucketed, so
+    playlists that agree on a whole band become candidates for each other.
+    Candidates (capped at maxCandidates, most band collisions first) are
+    reranked by exact cosine similarity. More bands raise recall, more rows
+    per band make buckets stricter and queries faster.
+
+    Drop-in for the parts of sklearn's NearestNeighbors(metric="cosine")
+    that NNeighClassifier uses. The fitted matrix itself is not saved by
+    save(); load() takes it back from the caller.
+    """
+
+    def __init__(self, n_neighbors=5, bands=32, rows=1, maxCandidates=2000, seed=0):
+        self.n_neighbors = n_neighbors
+        self.bands = bands
+        self.rows = rows
+        self.maxCandidates = maxCandidates
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.hashA = rng.integers(1, PRIME, size=bands * rows, dtype=np.int64)
+        self.hashB = rng.integers(0, PRIME, size=bands * rows, dtype=np.int64)
+        self.bandMultipliers = rng.integers(1, 1 << 62, size=rows, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+
+    def signatures(self, X):
+        """
+        MinHash signatures (n x bands*rows) of the nonzero columns of each row
+        """
+        X = csr_matrix(X)
+        nonEmpty = np.diff(X.indptr) > 0
+        starts = X.indptr[:-1][nonEmpty]
+        signatures = np.full((X.shape[0], len(self.hashA)), EMPTY, dtype=np.int64)
+        columns = X.indices.astype(np.int64)
+        for i, (a, b) in enumerate(zip(self.hashA, self.hashB)):
+            if len(columns):
+                signatures[nonEmpty, i] = np.minimum.reduceat((a * columns + b) % PRIME, starts)
+        return signatures
+
+    def bandKeys(self, signatures):
+        """
+        One 64-bit key per (row, band), combining the band's hashes
+        """
+        bands = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            return (bands * self.bandMultipliers).sum(axis=2)
+
+    def fit(self, X):
+        self.attach(X)
+        signatures = self.signatures(X)
+        keys = self.bandKeys(signatures)
+        # Empty playlists would all collide, keep them out of the buckets
+        members = np.flatnonzero(signatures[:, 0] != EMPTY)
+        self.bucketKeys, self.bucketMembers = [], []
+        for band in range(self.bands):
+            order = np.argsort(keys[members, band], kind="stable")
+            self.bucketKeys.append(keys[members[order], band])
+            self.bucketMembers.append(members[order])
+        return self
+
+    def attach(self, X):
+        """
+        Set the fitted matrix used for exact reranking
+        """
+        self.matrix_ = normalize(csr_matrix(X, dtype=np.float32), norm="l2", axis=1)
+        self.n_samples_fit_ = self.matrix_.shape[0]
+        self.n_features_in_ = self.matrix_.shape[1]
+
+    def candidates(self, keys):
+        """
+        Playlists sharing a bucket with a query in any band, most collisions first
+        """
+        found = []
+        for band in range(self.bands):
+            lo = np.searchsorted(self.bucketKeys[band], keys[band], side="left")
+            hi = np.searchsorted(self.bucketKeys[band], keys[band], side="right")
+            found.append(self.bucketMembers[band][lo:hi])
+        found = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        candidates, counts = np.unique(found, return_counts=True)
+        if len(candidates) > self.maxCandidates:
+            candidates = candidates[np.argsort(-counts, kind="stable")[:self.maxCandidates]]
+        return candidates
+
+    def kneighbors(self, X=None, n_neighbors=None, return_distance=True):
+        k = self.n_neighbors if n_neighbors is None else n_neighbors
+        if k > self.n_samples_fit_:
+            raise ValueError(f"Expected n_neighbors <= n_samples_fit, but n_neighbors = {k}, "
+                             f"n_samples_fit = {self.n_samples_fit_}")
+        queries = normalize(csr_matrix(X, dtype=np.float32), norm="l2", axis=1)
+        signatures = self.signatures(queries)
+        keys = self.bandKeys(signatures)
+
+        neighbours = np.empty((queries.shape[0], k), dtype=np.int64)
+        distances = np.empty((queries.shape[0], k), dtype=np.float64)
+        for i in range(queries.shape[0]):
+            candidates = self.candidates(keys[i]) if signatures[i, 0] != EMPTY else np.empty(0, dtype=np.int64)
+            sims = (self.matrix_[candidates] @ queries[i].T).toarray().ravel()
+            neighbours[i], distances[i] = topkCandidates(candidates, sims, k, self.n_samples_fit_)
+        return (distances, neighbours) if return_distance else neighbours
+
+    def save(self, path):
+        """
+        Save hash parameters and bucket tables, without the fitted matrix
+        """
+        arrays = {"config": np.array([self.n_neighbors, self.bands, self.rows, self.maxCandidates, self.seed])}
+        for band in range(self.bands):
+            arrays[f"keys{band}"] = self.bucketKeys[band]
+            arrays[f"members{band}"] = self.bucketMembers[band]
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, X):
+        """
+        Load an index saved with save() and attach the matrix it was fitted on
+        """
+        with np.load(path) as arrays:
+            n_neighbors, bands, rows, maxCandidates, seed = arrays["config"].tolist()
+            index = cls(n_neighbors, bands, rows, maxCandidates, seed)
+            index.bucketKeys = [arrays[f"keys{band}"] for band in range(bands)]
+            index.bucketMembers = [arrays[f"members{band}"] for band in range(bands)]
+        index.attach(X)
+        return index
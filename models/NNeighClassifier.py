@@ -1,6 +1,9 @@
-import os, pickle
+import json
+import math
+import os
 import numpy as np
 import pandas
+from scipy.sparse import csr_matrix
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.cluster import AgglomerativeClustering
@@ -8,24 +11,54 @@ from sklearn.neighbors import NearestNeighbors
 from sklearn.metrics import accuracy_score, r2_score
 import matplotlib
 import matplotlib.pyplot as plt
-from collections import defaultdict
-import heapq
-from util.helpers import playlistToSparseMatrixEntry, getPlaylistTracks
+from models.InvertedIndexNeighbors import InvertedIndexNeighbors
+from models.MinHashLSH import MinHashLSH
+from util import instrument
+from util.helpers import playlistsToSparseMatrix, getPlaylistIDs, matrixFingerprint
+from util.segments import SegmentedMatrix
+
+ARTIFACT_VERSION = 1
+# Votes are rounded to this many decimals, so that equal sums of different
+# rank weights (1/10 and 1/15 + 1/30) tie and resolve by column
+VOTE_DECIMALS = 12
 
 
 class NNeighClassifier():
-    def __init__(self, playlists, sparsePlaylists, songs, reTrain=False, name="NNClassifier.pkl"):
+    """
+    Args:
+        engine (str): neighbour search used by getNeighbors, "brute" for sklearn's
+            brute-force cosine search, "inverted" for the exact inverted-index engine
+            or "lsh" for the approximate MinHash/LSH index
+        engineParams (dict): extra engine arguments, e.g. bands, rows and
+            maxCandidates for "lsh"
+        strict (bool): raise instead of retraining when the saved model was built
+            from a different playlist matrix
+        fingerprint (str): matrixFingerprint of sparsePlaylists recorded when it was
+            written, hashed from the matrix when None
+    """
+    def __init__(self, playlists, sparsePlaylists, catalog, reTrain=False, name="NNClassifier.pkl", engine="brute",
+                 engineParams=None, strict=False, fingerprint=None):
         self.pathName = name
+        self.strict = strict
         self.name = "NNC"
+        # A fixed neighbour count and tie-broken ranking: any top N is a prefix of a longer list
+        self.prefixLimit = math.inf
+        self.engine = engine
+        self.engineParams = engineParams or {}
         self.playlistData = sparsePlaylists
         self.playlists = playlists
-        self.songs = songs
+        self.catalog = catalog
+        # (first row, model) for every block of rows added with addSegment
+        self.segmentModels = []
+        self.fingerprint = fingerprint
         self.initModel(reTrain)
 
 
     def initModel(self, reTrain):
         """
         Initialize or load the Nearest Neighbors model.
+        A saved model is only reused when its manifest matches the engine,
+        its parameters and the fingerprint of the current playlist matrix.
         """
         # Specify the full path to the trained directory on your Windows system
         current_directory = os.getcwd()
@@ -35,21 +68,75 @@ class NNeighClassifier():
         if not os.path.exists(trained_dir):
             # If the directory does not exist, create it
             os.makedirs(trained_dir)
-            libContents = []
-        else:
-            # If the directory exists, list its contents
-            libContents = os.listdir(trained_dir)
 
-        # Check if the model file exists in the directory or if retraining is required
-        if self.pathName not in libContents or reTrain:
-            # If the model file does not exist or retraining is requested, initialize and train a new model
-            self.model = NearestNeighbors(n_neighbors=60, metric="cosine")
-            self.trainModel(self.playlistData)
+        if self.fingerprint is None:
+            self.fingerprint = matrixFingerprint(self.playlistData)
+        manifest = None if reTrain else self.readManifest(trained_dir)
+        if manifest is not None and self.manifestMatches(manifest):
+            # Attach the saved model to the shared playlist matrix
+            self.model = self.loadModel(trained_dir)
         else:
-            # If the model file exists and no retraining is needed, load the model from the file
-            model_path = os.path.join(trained_dir, self.pathName)
-            with open(model_path, "rb") as model_file:
-                self.model = pickle.load(model_file)
+            # If there is no usable model or retraining is requested, initialize and train a new model
+            self.model = self.newModel()
+            self.trainModel(self.playlistData)
+
+    def manifestName(self):
+        """
+        File name of the model manifest: engine, parameters and data fingerprint
+        """
+        return os.path.splitext(self.pathName)[0] + ".json"
+
+    def artifactName(self):
+        """
+        File name of the LSH tables saved next to the manifest
+        """
+        return os.path.splitext(self.pathName)[0] + ".lsh.npz"
+
+    def readManifest(self, trained_dir):
+        path = os.path.join(trained_dir, self.manifestName())
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def manifestMatches(self, manifest):
+        """
+        Whether a saved model can be reused; a model built from other data
+        raises when strict is set and is rebuilt otherwise
+        """
+        if manifest.get("version") != ARTIFACT_VERSION or manifest.get("engine") != self.engine or \
+                manifest.get("engineParams") != self.engineParams:
+            print("Saved Nearest Neighbors model uses another engine or parameters, retraining")
+            return False
+        if manifest.get("fingerprint") != self.fingerprint:
+            if self.strict:
+                raise ValueError(f"Saved Nearest Neighbors model was built from other data "
+                                 f"({manifest.get('fingerprint')}, playlist matrix is {self.fingerprint})")
+            print("Saved Nearest Neighbors model was built from other data, retraining")
+            return False
+        return True
+
+    def loadModel(self, trained_dir):
+        """
+        Rebuild the saved model around the shared playlist matrix. Brute force
+        and inverted index engines only hold the matrix (or its transpose),
+        so they are refitted; the LSH index loads its saved tables.
+        """
+        if self.engine == "lsh":
+            return MinHashLSH.load(os.path.join(trained_dir, self.artifactName()), self.playlistData)
+        return self.newModel().fit(self.playlistData)
+
+    def newModel(self):
+        """
+        Untrained neighbour search for the configured engine
+        """
+        if self.engine == "brute":
+            return NearestNeighbors(n_neighbors=60, metric="cosine", **self.engineParams)
+        elif self.engine == "inverted":
+            return InvertedIndexNeighbors(n_neighbors=60, **self.engineParams)
+        elif self.engine == "lsh":
+            return MinHashLSH(n_neighbors=60, **self.engineParams)
+        raise ValueError(f"Unknown neighbour engine {self.engine}")
 
     def trainModel(self, data):
         """
@@ -61,55 +148,118 @@ class NNeighClassifier():
     def getNeighbors(self, X, k):
         """
         """
-        return self.model.kneighbors(X=X, return_distance=False, n_neighbors=k)[0]
+        return self.getNeighborsBatch(X, k)[0]
 
-    def getPlaylistsFromNeighbors(self, neighbours, pid):
+    def getNeighborsBatch(self, X, k):
         """
+        Neighbour rows for every row of a query matrix in one search
         """
-        neighbours = list(filter(lambda x: x not in pid.index, neighbours))
-        return [self.playlists.loc[x] for x in neighbours]
+        with instrument.stage("NNC.kneighbors"):
+            if self.segmentModels:
+                return self.searchSegments(X, k)
+            return self.model.kneighbors(X=X, return_distance=False, n_neighbors=k)
 
-    def getPredictionsFromTracks(self, tracks, numPredictions, pTracks):
+    def addSegment(self, rows):
         """
+        Make a block of new playlist rows, directly after the current last
+        row, searchable at once: the block gets its own model of the
+        configured engine, fitted in time proportional to the block
         """
-        pTracks = set(pTracks)
-        songs = defaultdict(int)
-        for i, playlist in enumerate(tracks):
-            if isinstance(playlist, pandas.Series):
+        if not isinstance(self.playlistData, SegmentedMatrix):
+            self.playlistData = SegmentedMatrix(self.playlistData)
+        rowOffset = self.playlistData.shape[0]
+        self.playlistData.append(rows)
+        self.segmentModels.append((rowOffset, self.newModel().fit(rows)))
 
-                if playlist['Track URI'] not in pTracks:
-                    songs[playlist['Track URI']] += (1 / (i + 1))
-            else:
-                for song in playlist.iterrows():
-                    if song[1]['Track URI'] not in pTracks:
-                        songs[song[1]['Track URI']] += (1 / (i + 1))
+    def searchSegments(self, X, k):
+        """
+        Top k over the base model and every segment model. Each model only
+        sees the query columns it was fitted on, so its cosine similarities
+        are rescaled by the share of the query norm inside those columns
+        before the results are merged, ties broken by row.
+        """
+        X = csr_matrix(X, dtype=np.float64)
+        norms = np.sqrt(X.multiply(X).sum(axis=1)).A1
+        neighbours, sims = [], []
+        for rowOffset, model in [(0, self.model)] + self.segmentModels:
+            width = model.n_features_in_
+            part = X[:, :width] if X.shape[1] >= width else \
+                csr_matrix((X.data, X.indices, X.indptr), shape=(X.shape[0], width))
+            distances, rows = model.kneighbors(X=part, n_neighbors=min(k, model.n_samples_fit_))
+            partNorms = np.sqrt(part.multiply(part).sum(axis=1)).A1
+            scale = np.divide(partNorms, norms, out=np.zeros_like(norms), where=norms > 0)
+            sims.append((1 - distances) * scale[:, None])
+            neighbours.append(rows + rowOffset)
+        neighbours, sims = np.hstack(neighbours), np.hstack(sims)
+        order = np.lexsort((neighbours, -sims))[:, :k]
+        return np.take_along_axis(neighbours, order, axis=1)
 
+    def compact(self):
+        """
+        Merge the segments into one playlist matrix and retrain a single model on it
+        """
+        if not self.segmentModels:
+            return
+        self.playlistData = self.playlistData.compact()
+        self.segmentModels = []
+        self.fingerprint = matrixFingerprint(self.playlistData)
+        self.model = self.newModel()
+        self.trainModel(self.playlistData)
 
+    @instrument.timed("NNC.predict")
+    def predict(self, X, numPredictions, songs=None, numNeighbours=60):
+        """
+        x=playlist, songs is ignored: tracks come from the catalog
+        """
+        return self.predictBatch([X], numPredictions, numNeighbours)[0]
 
-        scores = heapq.nlargest(numPredictions, songs, key=songs.get)
-        return scores
+    @instrument.timed("NNC.predictBatch")
+    def predictBatch(self, playlists, numPredictions, numNeighbours=60):
+        """
+        Predict for a list of playlists with a single query matrix and
+        one neighbour search, returning one prediction list per playlist
+        """
+        with instrument.stage("NNC.queryMatrix"):
+            sparseX = playlistsToSparseMatrix(playlists, self.catalog, self.playlistData.shape[1])
+        neighbors = self.getNeighborsBatch(sparseX, numNeighbours)  # PlaylistIDs
+        return [self.predictFromNeighbors(neighbors[i],
+                                          sparseX.indices[sparseX.indptr[i]:sparseX.indptr[i + 1]],
+                                          getPlaylistIDs(X),
+                                          numPredictions)
+                for i, X in enumerate(playlists)]
 
-    def predict(self, X, numPredictions, songs, numNeighbours=60):
+    def predictFromNeighbors(self, neighbors, queryColumns, playlistIDs, numPredictions):
         """
-        x=playlist
+        Rank-weighted vote over the neighbours' CSR rows: each neighbour's
+        tracks score 1/(rank+1), the query playlist itself and its own
+        tracks (queryColumns) are masked out and the top numPredictions
+        Track URIs are returned, ties broken by matrix column
         """
-        pid, pTracks = X["Playlist ID"], X["Track URI"]
-        sparseX = playlistToSparseMatrixEntry(X, self.songs)
-        neighbors = self.getNeighbors(sparseX, numNeighbours)  # PlaylistIDs
-        playlists = self.getPlaylistsFromNeighbors(neighbors, pid)
-        # Extract all Playlist IDs from the list of Series
-        playlist_ids = set([playlist['Playlist ID'] for playlist in playlists])
-        tracks = []
-        for id in playlist_ids:
-            filtered_playlist = [playlist for playlist in playlists if playlist['Playlist ID'] == id]
-            tracks.extend(getPlaylistTracks(filtered_playlist, self.songs))
+        columns, ids, scores = self.candidateScores(neighbors, queryColumns, playlistIDs)
+        with instrument.stage("NNC.select"):
+            order = topOrder(columns, scores, numPredictions)
+            return list(self.catalog.uris[ids[order]])
 
-        predictions = self.getPredictionsFromTracks(tracks, numPredictions, pTracks)
-        return predictions
+    def candidateScores(self, neighbors, queryColumns, playlistIDs):
+        """
+        (matrix columns, track ids, vote scores) of every track the
+        neighbours hold that is in the catalog and not in the query
+        """
+        with instrument.stage("NNC.neighbourRows"):
+            neighbors = neighbors[~np.isin(neighbors, playlistIDs)]
+            rows = self.playlistData[neighbors]
+        with instrument.stage("NNC.aggregate"):
+            weights = rows.data * np.repeat(1 / (np.arange(len(neighbors)) + 1), np.diff(rows.indptr))
+            columns, inverse = np.unique(rows.indices, return_inverse=True)
+            scores = np.round(np.bincount(inverse, weights=weights, minlength=len(columns)), VOTE_DECIMALS)
+            ids = self.catalog.columnIds(columns)
+            unseen = (ids >= 0) & ~np.isin(columns, queryColumns)
+            return columns[unseen], ids[unseen], scores[unseen]
 
     def saveModel(self):
         """
-        Saves the Nearest Neighbors model to a file.
+        Saves the Nearest Neighbors model manifest, plus the LSH tables for
+        the lsh engine. The playlist matrix itself is never copied into it.
         """
         # Define the directory where the model should be saved
         current_directory = os.getcwd()
@@ -119,9 +269,25 @@ class NNeighClassifier():
         if not os.path.exists(trained_dir):
             os.makedirs(trained_dir)
 
-        # Define the full path for the model file
-        model_path = os.path.join(trained_dir, self.pathName)
+        # The LSH index saves its own tables, without the playlist matrix
+        if self.engine == "lsh":
+            self.model.save(os.path.join(trained_dir, self.artifactName()))
+
+        manifest = {"version": ARTIFACT_VERSION, "engine": self.engine, "engineParams": self.engineParams,
+                    "fingerprint": self.fingerprint, "shape": list(self.playlistData.shape)}
+        manifest_path = os.path.join(trained_dir, self.manifestName())
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
 
-        # Save the model using a context manager to handle the file operation safely
-        with open(model_path, "wb") as model_file:
-            pickle.dump(self.model, model_file)
+def topOrder(columns, scores, n):
+    """
+    Positions of the n highest scores, best first, ties broken by matrix column
+    """
+    if len(columns) > n:
+        # Keep everything tied with the n-th score so ties resolve by column
+        cutoff = -np.partition(-scores, n - 1)[n - 1]
+        top = np.flatnonzero(scores >= cutoff)
+        return top[np.lexsort((columns[top], -scores[top]))[:n]]
+    return np.lexsort((columns, -scores))[:n]
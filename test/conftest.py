@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+# The packages are imported from the repository root, as the scripts run them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.synthetic import makeExplorerData, makePlaylistFrames  # noqa: E402
+from util.helpers import pickleMatrix  # noqa: E402
+
+NUM_PLAYLISTS = 120
+
+
+def writePickles(dataDir, playlists, songs, playlistSparse):
+    """
+    The pickles readData loads from data/
+    """
+    os.makedirs(dataDir, exist_ok=True)
+    playlists.to_pickle(os.path.join(dataDir, "playlists.pkl"))
+    songs.to_pickle(os.path.join(dataDir, "tracks.pkl"))
+    pickleMatrix(os.path.join(dataDir, "playlistSparse.pkl"), playlistSparse)
+
+
+@pytest.fixture(scope="session")
+def explorerData():
+    """
+    (playlists, songs, playlistSparse) of a small synthetic dataset with lyrics embeddings
+    """
+    return makeExplorerData(NUM_PLAYLISTS, embeddingDim=8)
+
+
+@pytest.fixture
+def workDir(tmp_path, monkeypatch, explorerData):
+    """
+    Working directory with the synthetic data pickled under data/; the NNC
+    saves its model under trained/ of the working directory
+    """
+    writePickles(str(tmp_path / "data"), *explorerData)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def explorer(workDir):
+    from main import SpotifyExplorer
+    return SpotifyExplorer(0, retrainNNC=True, cacheSize=64, hybridParams={"numCandidates": 10})
+
+
+def playlistRows(explorer, playlistID):
+    playlists = explorer.playlists
+    return playlists[playlists["Playlist ID"] == playlistID]
+
+
+def newPlaylists(firstID, numPlaylists=15, seed=1):
+    """
+    (playlists, songs) of synthetic playlists to append from Playlist ID
+    firstID on, sharing some tracks with explorerData and bringing new ones
+    """
+    playlists, tracks = makePlaylistFrames(numPlaylists, numTracks=NUM_PLAYLISTS * 40, seed=seed)
+    playlists["Playlist ID"] += firstID
+    playlists["Playlist Name"] = [f"appended {i}" for i in playlists["Playlist ID"]]
+    return playlists, tracks.set_index("Track URI")
@@ -0,0 +1,75 @@
+import os
+from collections import Counter
+
+import matplotlib
+import numpy as np
+import pytest
+
+from util import analytics, vis
+from util.catalog import TrackCatalog
+from util.helpers import nameTokens
+from util.segments import SegmentedMatrix
+
+matplotlib.use("Agg")
+
+
+@pytest.fixture(scope="module")
+def profileData(explorerData):
+    playlists, songs, playlistSparse = explorerData
+    return playlists, TrackCatalog.fromSongs(songs), playlistSparse, analytics.playlistNames(playlists)
+
+
+def assertTopCounts(section, keys, expected, topK):
+    """
+    A profile section holds the topK largest of the expected counts, best first
+    """
+    assert section["counts"] == sorted(expected.values(), reverse=True)[:topK]
+    assert all(expected[key] == count for key, count in zip(section[keys], section["counts"]))
+
+
+def testProfileMatchesCountsOverThePlaylistRows(profileData):
+    playlists, catalog, playlistSparse, names = profileData
+    profile = analytics.buildProfile(playlistSparse, catalog, names, topK=25)
+    entries = playlists.drop_duplicates(["Playlist ID", "Track URI"])
+
+    assert profile["numPlaylists"] == playlists["Playlist ID"].nunique()
+    assert profile["numEntries"] == len(entries) == playlistSparse.nnz
+    assert profile["numTracks"] == entries["Track URI"].nunique()
+    assert profile["lengthCounts"] == np.bincount(entries.groupby("Playlist ID").size()).tolist()
+
+    assertTopCounts(profile["tracks"], "uris", entries["Track URI"].value_counts().to_dict(), 25)
+    artists = catalog.artists[catalog.toIds(entries["Track URI"])]
+    assertTopCounts(profile["artists"], "names", Counter(artists), 25)
+    keywords = Counter(token for name in names for token in nameTokens(name))
+    assertTopCounts(profile["keywords"], "words", keywords, 25)
+
+
+def testSegmentsAndChunksGiveTheSameProfile(profileData):
+    _, catalog, playlistSparse, names = profileData
+    expected = analytics.buildProfile(playlistSparse, catalog, names)
+    segmented = SegmentedMatrix(playlistSparse[:50], [playlistSparse[50:90], playlistSparse[90:]])
+    assert analytics.buildProfile(segmented, catalog, names, chunkRows=7) == expected
+
+
+def testCachedProfileIsRebuiltForOtherData(profileData, tmp_path):
+    _, catalog, playlistSparse, names = profileData
+    path = str(tmp_path / "profile.json")
+    builds = []
+
+    def build():
+        builds.append(1)
+        return analytics.buildProfile(playlistSparse, catalog, names, topK=10)
+
+    profile = analytics.cachedProfile(path, ["data", 1], build)
+    assert analytics.cachedProfile(path, ("data", 1), build) == profile
+    assert len(builds) == 1
+    assert analytics.loadProfile(path, ["data", 2]) is None
+    analytics.cachedProfile(path, ["data", 2], build)
+    assert len(builds) == 2
+
+
+def testVisRendersAProfile(profileData, tmp_path):
+    _, catalog, playlistSparse, names = profileData
+    profile = analytics.buildProfile(playlistSparse, catalog, names, topK=10)
+    vis.displayAll(profile, str(tmp_path))
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".png")]) == 4
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from models.BaseClassifier import BaseClassifier
+
+NUM_TRACKS = 40
+
+
+def tiedData(seed=0):
+    """
+    (songs, playlists) whose embeddings repeat, so neighbour similarities
+    and estimated ratings tie
+    """
+    rng = np.random.default_rng(seed)
+    distinct = rng.integers(-2, 3, size=(8, 4)).astype(float)
+    distinct[distinct.sum(axis=1) == 0, 0] = 1
+    vectors = distinct[rng.integers(0, len(distinct), NUM_TRACKS)]
+    uris = [f"t{i:02d}" for i in range(NUM_TRACKS)]
+    songs = pd.DataFrame({"Track Name": uris, "Artist Name": "a",
+                          "lyrics_embedding": ["[" + " ".join(map(str, v)) + "]" for v in vectors]},
+                         index=pd.Index(uris, name="Track URI"))
+    playlists = pd.DataFrame([(pid, uri) for pid in range(6)
+                              for uri in rng.choice(uris, 6, replace=False)],
+                             columns=["Playlist ID", "Track URI"])
+    playlists["Playlist Name"] = "p"
+    return songs, playlists
+
+
+@pytest.mark.parametrize("neighbours", [None, 12])
+def testBatchedScoringRanksLikeTheLoop(neighbours):
+    songs, playlists = tiedData()
+    base = BaseClassifier(songs, playlists, neighbours=neighbours)
+    for playlistID in range(6):
+        for k in (1, 5, 12):
+            expected = base.get_recommendations(playlistID, k, batched=False)
+            actual = base.get_recommendations(playlistID, k)
+            pd.testing.assert_frame_equal(actual, expected)
+    # The fixture does produce tied ratings
+    ratings = base.get_recommendations(0, 12)["Recommendation Score"]
+    assert ratings.duplicated().any()
+
+
+def testPredictionsPastTheNeighbourIndexAreRatedOverAllOfIt():
+    songs, playlists = tiedData()
+    base = BaseClassifier(songs, playlists, neighbours=5)
+    playlist = playlists[playlists["Playlist ID"] == 2]
+    predictions = base.predict(playlist, 15)
+    assert len(predictions) == 15 and not set(predictions) & set(playlist["Track URI"])
+    expected = base.get_recommendations(2, 15, batched=False)
+    assert list(predictions) == list(expected["Track URI"])
+
+
+def testPredictRaisesInsteadOfReturningNothing(monkeypatch):
+    songs, playlists = tiedData()
+    base = BaseClassifier(songs, playlists, neighbours=5)
+
+    def fail(playlist_id, topk):
+        raise RuntimeError("scoring failed")
+    monkeypatch.setattr(base, "get_recommendations", fail)
+    with pytest.raises(RuntimeError):
+        base.predict(playlists[playlists["Playlist ID"] == 2], 5)
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import playlistRows
+from util.cache import RecommendationCache, playlistKey
+
+
+def testPlaylistKeyIgnoresOrderAndRepeats():
+    playlist = pd.DataFrame({"Playlist Name": "mix", "Playlist ID": 3, "Track URI": ["a", "b", "c"]})
+    shuffled = pd.DataFrame({"Playlist Name": "mix", "Playlist ID": 3, "Track URI": ["c", "a", "b", "a"]})
+    renamed = playlist.assign(**{"Playlist Name": "other"})
+    assert playlistKey(playlist) == playlistKey(shuffled)
+    assert playlistKey(playlist) != playlistKey(renamed)
+    assert playlistKey(playlist) != playlistKey(playlist.assign(**{"Playlist ID": 4}))
+
+
+def testPrefixEntriesAnswerShorterRequestsUpToTheLimit():
+    cache = RecommendationCache()
+    cache.put("NNC", "k", 10, list("abcdefghij"), prefixLimit=float("inf"))
+    assert cache.get("NNC", "k", 3, prefixLimit=float("inf")) == list("abc")
+    assert cache.get("NNC", "k", 20, prefixLimit=float("inf")) is None
+
+
+def testShortListAnswersLargerRequestsWithinTheLimit():
+    cache = RecommendationCache()
+    cache.put("Hybrid", "k", 10, list("abc"), prefixLimit=50)
+    assert cache.get("Hybrid", "k", 40, prefixLimit=50) == list("abc")
+    # Beyond the limit the classifier scores another candidate set
+    assert cache.get("Hybrid", "k", 60, prefixLimit=50) is None
+
+
+def testEveryCountIsCachedOnItsOwnWithoutAPrefixLimit():
+    cache = RecommendationCache()
+    cache.put("Base", "k", 10, list("abcdefghij"))
+    assert cache.get("Base", "k", 5) is None
+    cache.put("Base", "k", 5, list("vwxyz"))
+    assert cache.get("Base", "k", 5) == list("vwxyz")
+    assert cache.get("Base", "k", 10) == list("abcdefghij")
+
+
+def testEvictionAndInvalidation():
+    cache = RecommendationCache(maxEntries=2)
+    cache.validate("v1")
+    for key in "abc":
+        cache.put("NNC", key, 5, [key], prefixLimit=5)
+    assert cache.get("NNC", "a", 5, prefixLimit=5) is None
+    assert cache.get("NNC", "c", 5, prefixLimit=5) == ["c"]
+    cache.validate("v2")
+    assert cache.get("NNC", "c", 5, prefixLimit=5) is None
+    assert cache.stats()["evictions"] == 1 and cache.stats()["invalidations"] == 1
+
+
+@pytest.mark.parametrize("classifier", ["NNC", "Base", "Hybrid"])
+def testCachedPredictionsMatchAFreshPredict(explorer, classifier):
+    """
+    Whatever the cache answered from, the result is what predict returns
+    for the same count, below and beyond the Hybrid's 10 candidates
+    """
+    explorer.setClassifier(classifier)
+    playlist = playlistRows(explorer, 7)
+    for numPredictions in [30, 5, 20, 8, 30]:
+        cached = explorer.predictNeighbour(playlist, numPredictions)
+        fresh = explorer.classifier.predict(playlist, numPredictions)
+        assert list(cached) == list(fresh)
+    assert explorer.cache.hits > 0
+
+
+def testCachedColdStartPredictionsMatchAFreshPredict(explorer):
+    playlist = playlistRows(explorer, 7).head(1)
+    assert explorer.classifier.isCold(playlist)
+    for numPredictions in [30, 5, 20]:
+        cached = explorer.predictNeighbour(playlist, numPredictions)
+        assert list(cached) == list(explorer.coldStart.predict(playlist, numPredictions))
+    assert explorer.cache.hits == 2
+
+
+def testCallersCannotChangeACachedEntry():
+    cache = RecommendationCache()
+    predictions = np.array(["a", "b", "c"], dtype=object)
+    cache.put("Base", "k", 3, predictions)
+    predictions[0] = "changed"
+    first = cache.get("Base", "k", 3)
+    first[1] = "changed"
+    assert list(cache.get("Base", "k", 3)) == ["a", "b", "c"]
+
+    cache.put("NNC", "k", 3, ["a", "b", "c"], prefixLimit=5)
+    cache.get("NNC", "k", 3, prefixLimit=5).append("d")
+    assert cache.get("NNC", "k", 3, prefixLimit=5) == ["a", "b", "c"]
+
+
+def testEmptyPredictionsAreNotCached():
+    cache = RecommendationCache()
+    cache.put("Hybrid", "k", 10, [], prefixLimit=50)
+    cache.put("Base", "k", 10, np.array([], dtype=object))
+    assert cache.get("Hybrid", "k", 10, prefixLimit=50) is None
+    assert cache.get("Base", "k", 10) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from util.catalog import TrackCatalog
+
+
+def songs():
+    return pd.DataFrame({"Track Name": ["a", "b", "a again", "c"], "Artist Name": ["x", "y", "x", "z"],
+                         "sparse_id": [2, 0, 2, 5]},
+                        index=pd.Index(["u1", "u2", "u1", "u3"], name="Track URI"))
+
+
+def testFromSongsKeepsTheFirstRowOfEveryUri():
+    catalog = TrackCatalog.fromSongs(songs())
+    assert len(catalog) == 3
+    assert list(catalog.uris) == ["u1", "u2", "u3"]
+    assert catalog.trackAndArtist("u1") == ("a", "x")
+    assert catalog.numColumns == 6
+    assert "u3" in catalog and "missing" not in catalog
+
+
+def testLookups():
+    catalog = TrackCatalog.fromSongs(songs())
+    assert catalog.toId("u2") == 1 and catalog.toId("missing") is None
+    assert list(catalog.toIds(["u3", "missing", "u1"])) == [2, -1, 0]
+    assert list(catalog.columnIds([0, 1, 2, 5, 9])) == [1, -1, 0, 2, -1]
+    decorated = catalog.decorate([2, 0], scores=[0.5, 0.25])
+    assert list(decorated["Track URI"]) == ["u3", "u1"]
+    assert list(decorated["Recommendation Score"]) == [0.5, 0.25]
+
+
+def testDuplicateUrisAreRejected():
+    catalog = TrackCatalog(["u1", "u1"], ["a", "b"], ["x", "y"])
+    with pytest.raises(ValueError):
+        catalog.toId("u1")
+
+
+def testAppendAndCompact():
+    catalog = TrackCatalog.fromSongs(songs())
+    fingerprint = catalog.fingerprint()
+    ids = catalog.append(["u2", "u4", "u5", "u4"], ["b", "d", "e", "d"], ["y", "w", "v", "w"])
+    assert list(ids) == [1, 3, 4, 3]
+    assert len(catalog) == 5 and catalog.numColumns == 8
+    assert list(catalog.toIds(["u5", "u1"])) == [4, 0]
+    assert list(catalog.columnIds([6, 7, 5])) == [3, 4, 2]
+    assert catalog.trackAndArtist("u5") == ("e", "v")
+    # Appending keeps the fingerprint of the tracks that were already there
+    assert catalog.fingerprint(3) == fingerprint != catalog.fingerprint()
+
+    compacted = catalog.compact()
+    assert list(compacted.uris) == ["u1", "u2", "u3", "u4", "u5"]
+    assert list(compacted.columnIds(np.arange(8))) == list(catalog.columnIds(np.arange(8)))
+    assert compacted.fingerprint() == catalog.fingerprint()
@@ -0,0 +1,136 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from bench.synthetic import makePlaylistFrames
+from conftest import NUM_PLAYLISTS, newPlaylists
+from models.ColdStartClassifier import ColdStartClassifier
+from util.catalog import TrackCatalog
+from util.dataIn import processPlaylistForClustering
+from util.helpers import nameTokens
+from util.segments import SegmentedMatrix
+
+
+def topicData(numPlaylists=200, seed=0):
+    playlists, tracks = makePlaylistFrames(numPlaylists, seed=seed, topics=5)
+    playlistSparse, IDtoIDX = processPlaylistForClustering(playlists, tracks)
+    tracks["sparse_id"] = tracks["Track URI"].map(IDtoIDX)
+    catalog = TrackCatalog.fromSongs(tracks.set_index("Track URI"))
+    names = playlists.drop_duplicates("Playlist ID").set_index("Playlist ID")["Playlist Name"]
+    return playlists, playlistSparse, catalog, names
+
+
+def referenceRanking(playlists, catalog, token, topK):
+    """
+    Share of the playlists named with token that hold each track, best
+    first, ties broken by track id
+    """
+    named = playlists[[token in nameTokens(name) for name in playlists["Playlist Name"]]]
+    numPlaylists = named["Playlist ID"].nunique()
+    counts = Counter(catalog.toIds(named.drop_duplicates(["Playlist ID", "Track URI"])["Track URI"]))
+    ranked = sorted(counts.items(), key=lambda item: (-item[1] / numPlaylists, item[0]))[:topK]
+    return [catalog.uris[trackID] for trackID, _ in ranked]
+
+
+def query(name, uris=()):
+    playlist = pd.DataFrame({"Track URI": pd.Series(list(uris), dtype=object)})
+    playlist.attrs["Playlist Name"] = name
+    return playlist
+
+
+def testIndexMatchesAReferenceCount():
+    playlists, playlistSparse, catalog, names = topicData()
+    coldStart = ColdStartClassifier(playlistSparse, names, catalog, topK=30)
+    assert set(coldStart.tokens) == {"topic0", "topic1", "topic2", "topic3", "topic4", "mix"}
+    for token in ("topic0", "topic3", "mix"):
+        assert coldStart.tokens[token][0] == referenceRanking(playlists, catalog, token, 30)
+    popularity = playlists.drop_duplicates(["Playlist ID", "Track URI"])["Track URI"].value_counts()
+    assert coldStart.popular[0] == popularity.index[0]
+
+
+def testPredictSkipsOwnTracksAndFillsFromPopularity():
+    playlists, playlistSparse, catalog, names = topicData()
+    coldStart = ColdStartClassifier(playlistSparse, names, catalog, topK=30)
+    ranking = coldStart.tokens["topic2"][0]
+    assert coldStart.predict(query("Topic2 road trip"), 10) == ranking[:10]
+
+    own = ranking[:3]
+    predictions = coldStart.predict(query("topic2", own), 40)
+    assert len(predictions) == 40 and not set(own) & set(predictions)
+    assert predictions[:27] == ranking[3:]
+    assert predictions[27:] == [uri for uri in coldStart.popular if uri not in set(ranking)][:13]
+
+    assert coldStart.predict(query("no known words"), 5) == list(coldStart.popular[:5])
+
+
+def testLongerListsExtendShorterOnes():
+    _, playlistSparse, catalog, names = topicData()
+    coldStart = ColdStartClassifier(playlistSparse, names, catalog, topK=10)
+    for name in ("topic1 mix", "topic4", "unknown"):
+        longest = coldStart.predict(query(name), 40)
+        for n in (1, 5, 10, 25):
+            assert coldStart.predict(query(name), n) == longest[:n]
+
+
+def assertSameIndex(coldStart, rebuilt):
+    assert coldStart.tokens.keys() == rebuilt.tokens.keys()
+    for token, (uris, ids, scores) in rebuilt.tokens.items():
+        assert coldStart.tokens[token][0] == uris
+        assert list(coldStart.tokens[token][1]) == list(ids)
+        np.testing.assert_allclose(coldStart.tokens[token][2], scores)
+    assert coldStart.popular == rebuilt.popular
+
+
+def testIndexIsBuiltOnFirstUse():
+    _, playlistSparse, catalog, names = topicData()
+    calls = []
+    coldStart = ColdStartClassifier(playlistSparse, lambda: calls.append(1) or names, catalog)
+    assert coldStart._tokens is None and not calls
+    coldStart.predict(query("topic1"), 5)
+    coldStart.predict(query("topic2"), 5)
+    assert calls == [1]
+
+
+def testExtendMatchesARebuild():
+    playlists, playlistSparse, catalog, names = topicData()
+    # A token below minPlaylists in the first rows that reaches it in the appended ones
+    names = names.copy()
+    names[10] = names[199] = "solo"
+    for numBase in (150, 199):
+        coldStart = ColdStartClassifier(playlistSparse[:numBase], names[names.index < numBase], catalog, topK=30)
+        assert "solo" not in coldStart.tokens
+        coldStart.extend(SegmentedMatrix(playlistSparse[:numBase], [playlistSparse[numBase:]]),
+                         names[names.index >= numBase])
+        rebuilt = ColdStartClassifier(playlistSparse, names, catalog, topK=30)
+        assertSameIndex(coldStart, rebuilt)
+        for name in ("solo", "topic3 mix", "topic1", "unknown words"):
+            assert coldStart.predict(query(name), 40) == rebuilt.predict(query(name), 40)
+    assert "solo" in coldStart.tokens
+
+
+def testExtendBeforeFirstUseKeepsTheNewNames():
+    _, playlistSparse, catalog, names = topicData()
+    coldStart = ColdStartClassifier(playlistSparse[:150], names[names.index < 150], catalog)
+    coldStart.extend(SegmentedMatrix(playlistSparse[:150], [playlistSparse[150:]]), names[names.index >= 150])
+    assert coldStart._tokens is None
+    assertSameIndex(coldStart, ColdStartClassifier(playlistSparse, names, catalog))
+
+
+def testExplorerColdStartSeesAppendedPlaylists(explorer):
+    explorer.setClassifier("NNC")
+    assert explorer.coldStart._tokens is None
+    explorer.predictNeighbour(query("anything"), 5)
+    assert explorer.coldStart._tokens is not None
+    first, _ = newPlaylists(NUM_PLAYLISTS)
+    explorer.appendPlaylists(*newPlaylists(NUM_PLAYLISTS))
+    explorer.appendPlaylists(*newPlaylists(NUM_PLAYLISTS + 15, seed=2))
+    assert "appended" in explorer.coldStart.tokens
+    rebuilt = ColdStartClassifier(explorer.playlistSparse, explorer.playlistNames(), explorer.catalog)
+    assertSameIndex(explorer.coldStart, rebuilt)
+
+    predictions = explorer.predictNeighbour(query("appended"), 10)
+    assert predictions == rebuilt.predict(query("appended"), 10)
+    assert set(predictions) & set(first["Track URI"])
+    explorer.compact()
+    assert explorer.predictNeighbour(query("appended"), 10) == predictions
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from util.catalog import TrackCatalog
+from util.dataIn import processPlaylistForClustering
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def testRowsArePlaylistIDsAndColumnsUniqueTracks():
+    tracks = pd.DataFrame({"Track URI": ["t1", "t2", "t1", "t3"]})
+    playlists = pd.DataFrame({"Playlist ID": [4, 4, 4, 1, 1, 4],
+                              "Track URI": ["t3", "t1", "t3", "t2", "unknown", "t1"]})
+    matrix, IDtoIDX = processPlaylistForClustering(playlists, tracks)
+
+    # One row per Playlist ID up to the largest, one column per unique track in first-seen order
+    assert matrix.shape == (5, 3)
+    assert IDtoIDX == {"t1": 0, "t2": 1, "t3": 2}
+    # Repeated tracks count once, tracks missing from the track table are dropped
+    np.testing.assert_array_equal(matrix.toarray(), [[0, 0, 0], [0, 1, 0], [0, 0, 0], [0, 0, 0], [1, 0, 1]])
+    assert matrix.dtype == np.float32 and matrix.has_canonical_format
+
+
+def testNoPlaylistsGiveAnEmptyMatrix():
+    tracks = pd.DataFrame({"Track URI": ["t1", "t2"]})
+    matrix, _ = processPlaylistForClustering(pd.DataFrame({"Playlist ID": [], "Track URI": []}), tracks)
+    assert matrix.shape == (0, 2)
+
+
+def testCommittedDataMatchesItsPlaylists():
+    playlists = pd.read_pickle(os.path.join(DATA_DIR, "playlists.pkl"))
+    songs = pd.read_pickle(os.path.join(DATA_DIR, "tracks.pkl"))
+    playlistSparse = pd.read_pickle(os.path.join(DATA_DIR, "playlistSparse.pkl"))
+    expected, IDtoIDX = processPlaylistForClustering(playlists, songs.reset_index())
+    assert playlistSparse.shape == (playlists["Playlist ID"].max() + 1, songs.index.nunique())
+    assert (playlistSparse != expected).nnz == 0
+    assert list(songs["sparse_id"]) == [IDtoIDX[uri] for uri in songs.index]
+    assert TrackCatalog.fromSongs(songs).numColumns == playlistSparse.shape[1]
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pytest
+
+from main import SpotifyExplorer
+from util.catalog import TrackCatalog, uriFingerprint
+from util.embeddings import (MANIFEST_FILE, embeddingsFingerprint, loadEmbeddings, parseEmbeddings, writeEmbeddings,
+                             writeSongEmbeddings)
+from util.store import DataStore, StringColumn, convertPickles
+
+
+def testParseEmbeddings():
+    matrix, valid = parseEmbeddings(["[1 2 3]", np.nan, "[ 4 5 6 ]\n", "[1 2]", [7, 8, 9]])
+    assert matrix.shape == (5, 3) and matrix.dtype == np.float32
+    assert list(valid) == [True, False, True, False, True]
+    assert list(matrix[4]) == [7, 8, 9] and not matrix[1].any()
+
+
+def testWriteAndLoadNormalizedEmbeddings(tmp_path):
+    matrix = np.array([[3, 4], [0, 0], [1, 0]], dtype=np.float32)
+    writeEmbeddings(str(tmp_path), matrix, np.array([True, False, True]), "abc")
+    loaded, valid = loadEmbeddings(str(tmp_path))
+    assert np.allclose(loaded, [[0.6, 0.8], [0, 0], [1, 0]])
+    assert list(valid) == [True, False, True]
+    assert embeddingsFingerprint(str(tmp_path)) == "abc"
+
+
+def testUriFingerprintIsTheSameForEveryColumnType():
+    uris = np.array(["a", "bb", "ünï", "", "cccc"], dtype=object)
+    expected = uriFingerprint(uris)
+    assert uriFingerprint(StringColumn.fromValues(uris)) == expected
+    assert uriFingerprint(uris, chunkSize=2) == expected
+    assert uriFingerprint(uris, 3) == uriFingerprint(uris[:3])
+    # Moving a byte between neighbouring URIs changes the hash
+    assert uriFingerprint(np.array(["ab", "b", "ünï", "", "cccc"], dtype=object)) != expected
+
+    catalog = TrackCatalog(StringColumn.fromValues(uris[:3]), uris[:3], uris[:3])
+    catalog.append(uris[3:], uris[3:], uris[3:])
+    assert catalog.fingerprint() == expected
+    assert catalog.fingerprint(2) == uriFingerprint(uris[:2])
+
+
+def testStaleEmbeddingsAreParsedAgainFromSongs(workDir, explorerData):
+    songs = explorerData[1]
+    dataDir = str(workDir / "data")
+    catalog = TrackCatalog.fromSongs(songs)
+    writeSongEmbeddings(dataDir, songs, catalog)
+    assert SpotifyExplorer(0, retrainNNC=True, cacheSize=0).embeddings is not None
+
+    # Same length, written for the tracks in another order
+    matrix, valid = loadEmbeddings(dataDir)
+    reordered = TrackCatalog(catalog.uris[::-1], catalog.names[::-1], catalog.artists[::-1])
+    writeEmbeddings(dataDir, np.array(matrix), valid, reordered.fingerprint())
+    explorer = SpotifyExplorer(0, retrainNNC=True, cacheSize=0)
+    assert explorer.embeddings is None
+    assert explorer.baseClassifier.vectors is not None
+
+
+def testStoreRefusesEmbeddingsWrittenForAnotherCatalog(workDir):
+    storeDir = str(workDir / "store")
+    convertPickles(str(workDir / "data"), storeDir)
+    store = DataStore(storeDir)
+    assert store.manifest["tracks"]["fingerprint"] == embeddingsFingerprint(storeDir)
+    matrix, valid = store.embeddings()
+
+    writeEmbeddings(storeDir, np.array(matrix), valid, "another catalog")
+    with pytest.raises(ValueError):
+        SpotifyExplorer(0, retrainNNC=True, storeDir=storeDir, cacheSize=0)
+
+    # Embeddings written before fingerprints were recorded are only checked by length
+    os.remove(os.path.join(storeDir, MANIFEST_FILE))
+    assert len(DataStore(storeDir).embeddings()[0]) == len(matrix)
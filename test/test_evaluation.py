@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from util.evaluation import buildHoldout, evaluate, metricsAtK, rankingPasses, splitHoldout
+
+
+class CountingClassifier:
+    """
+    Classifier wrapper recording the count of every ranking call
+    """
+
+    def __init__(self, classifier):
+        self.classifier = classifier
+        self.name = classifier.name
+        self.prefixLimit = getattr(classifier, "prefixLimit", 0)
+        self.counts = []
+
+    def predict(self, playlist, numPredictions):
+        self.counts.append(numPredictions)
+        return self.classifier.predict(playlist, numPredictions)
+
+
+def testMetricsAtK():
+    hits = np.array([[True, False, True, False], [False, False, False, False]])
+    metrics = metricsAtK(hits, [2, 1])
+    assert list(metrics.index) == [1, 2, 3, 4]
+    assert metrics.loc[1, "precision"] == pytest.approx(0.5)
+    assert metrics.loc[3, "recall"] == pytest.approx(0.5)
+    assert metrics.loc[2, "r_precision"] == pytest.approx(0.25)
+    # First playlist hits on the first page, the second never does
+    assert metrics.loc[4, "clicks"] == pytest.approx(0.5)
+
+
+def testHoldoutIsSeededAndCached(explorer, tmp_path):
+    path = str(tmp_path / "holdout.pkl")
+    holdout = buildHoldout(explorer.playlists, 20, 0.25, seed=3, path=path)
+    assert holdout["Playlist ID"].nunique() == 20
+    pd.testing.assert_frame_equal(buildHoldout(explorer.playlists, 20, 0.25, seed=3), holdout)
+    pd.testing.assert_frame_equal(buildHoldout(None, 20, path=path), holdout)
+    for kept, obscured in splitHoldout(holdout):
+        assert obscured and not set(kept["Track URI"]) & obscured
+
+
+def testRankingPasses(explorer):
+    ks = [1, 5, 10, 20]
+    assert rankingPasses(explorer.NNC, ks) == [(20, ks)]
+    assert rankingPasses(explorer.baseClassifier, ks) == [(k, [k]) for k in ks]
+    assert rankingPasses(explorer.hybridClassifier, ks) == [(10, [1, 5, 10]), (20, [20])]
+
+
+def testBaseIsScoredOnItsListForEveryK(explorer):
+    holdout = buildHoldout(explorer.playlists, 8, 0.25, seed=0)
+    metrics = evaluate(explorer.baseClassifier, holdout, workers=1, ks=[3, 12])
+    assert list(metrics.index) == [3, 12]
+    split = splitHoldout(holdout)
+    for k in (3, 12):
+        found = [len(set(explorer.baseClassifier.predict(kept, k)) & obscured) for kept, obscured in split]
+        assert metrics.loc[k, "precision"] == pytest.approx(np.mean(found) / k)
+        assert metrics.loc[k, "recall"] == pytest.approx(np.mean([n / len(obscured) for n, (_, obscured)
+                                                                  in zip(found, split)]))
+
+
+def testPrefixConsistentClassifiersAreRankedOnce(explorer):
+    holdout = buildHoldout(explorer.playlists, 8, 0.25, seed=0)
+    counting = CountingClassifier(explorer.NNC)
+    metrics = evaluate(counting, holdout, workers=1, ks=[5, 20])
+    assert counting.counts == [20] * 8
+    pd.testing.assert_frame_equal(metrics, evaluate(explorer.NNC, holdout, maxK=20, workers=1).loc[[5, 20]])
+
+
+def testInvalidCutoffs(explorer):
+    holdout = buildHoldout(explorer.playlists, 2, 0.25, seed=0)
+    with pytest.raises(ValueError):
+        evaluate(explorer.NNC, holdout, workers=1, ks=[0, 5])
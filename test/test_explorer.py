@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from conftest import NUM_PLAYLISTS, newPlaylists, playlistRows
+from main import SpotifyExplorer
+from models.BaseClassifier import BaseClassifier
+from util import analytics
+
+
+def testStoreStartupLeavesThePlaylistRowsUnbuilt(workDir, explorerData):
+    playlists = explorerData[0]
+    explorer = SpotifyExplorer(0, retrainNNC=True, storeDir=str(workDir / "store"), cacheSize=0)
+    explorer.setClassifier("Base")
+    assert len(explorer.predictNeighbour(playlists[playlists["Playlist ID"] == 7], 10)) == 10
+    explorer.datasetProfile(str(workDir / "profile.json"))
+    assert explorer._playlists is None and explorer._songs is None
+
+
+def testPlaylistNamesFromTheStoreMatchTheRows(workDir, explorerData):
+    playlists = explorerData[0]
+    expected = playlists.drop_duplicates("Playlist ID").set_index("Playlist ID")["Playlist Name"]
+    explorer = SpotifyExplorer(0, retrainNNC=True, storeDir=str(workDir / "store"), cacheSize=0)
+    pd.testing.assert_series_equal(explorer.playlistNames(), expected, check_index_type=False)
+
+    appended, songs = newPlaylists(NUM_PLAYLISTS)
+    explorer.appendPlaylists(appended, songs)
+    names = explorer.playlistNames()
+    assert len(names) == NUM_PLAYLISTS + appended["Playlist ID"].nunique()
+    assert names[NUM_PLAYLISTS] == f"appended {NUM_PLAYLISTS}"
+
+
+def testBaseFromThePlaylistMatrixMatchesTheRowsDataFrame(explorer):
+    rowsBase = BaseClassifier(explorer.songs, explorer.playlists, explorer.catalog, explorer.embeddings, neighbours=100)
+    matrixBase = explorer.baseClassifier
+    assert matrixBase.playlists is None
+    assert set(matrixBase.candidate_uris()) == set(explorer.playlists["Track URI"])
+    for playlistID in (0, 7, 42):
+        assert matrixBase.get_uris_in_playlist(playlistID) == rowsBase.get_uris_in_playlist(playlistID)
+        playlist = playlistRows(explorer, playlistID)
+        assert list(matrixBase.predict(playlist, 20)) == list(rowsBase.predict(playlist, 20))
+
+
+def testBaseSeesAppendedPlaylists(explorer):
+    appended, songs = newPlaylists(NUM_PLAYLISTS)
+    explorer.appendPlaylists(appended, songs)
+    base = explorer.baseClassifier
+    first = appended[appended["Playlist ID"] == NUM_PLAYLISTS]
+    assert base.get_uris_in_playlist(NUM_PLAYLISTS) == set(first["Track URI"])
+    assert set(base.candidate_uris()) == set(explorer.playlists["Track URI"])
+
+
+def testDatasetProfileMatchesTheRowsDataFrame(explorer, workDir):
+    profile = explorer.datasetProfile(str(workDir / "profile.json"), topK=50)
+    expected = analytics.buildProfile(explorer.playlistSparse, explorer.catalog,
+                                      analytics.playlistNames(explorer.playlists), topK=50)
+    assert profile == expected
+    assert profile["numPlaylists"] == NUM_PLAYLISTS
+    assert profile["lengthCounts"] == np.bincount(explorer.playlists.groupby("Playlist ID").size()).tolist()
+
+
+def testPredictStillTakesTheSongsArgument(explorer):
+    playlist = playlistRows(explorer, 7)
+    for name in ("NNC", "Base", "Hybrid"):
+        explorer.setClassifier(name)
+        expected = list(explorer.classifier.predict(playlist, 10))
+        assert list(explorer.classifier.predict(playlist, 10, explorer.songs)) == expected
+        assert list(explorer.predictNeighbour(playlist, 10, explorer.songs)) == expected
+    assert explorer.coldStart.predict(playlist, 10, explorer.songs) == explorer.coldStart.predict(playlist, 10)
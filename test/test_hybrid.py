@@ -0,0 +1,58 @@
+import numpy as np
+
+from conftest import playlistRows
+from models.HybridClassifier import HybridClassifier
+
+PLAYLIST_IDS = [0, 17, 42, 99]
+
+
+def referencePredict(hybrid, playlist, numPredictions):
+    """
+    Blend the NNC votes of the best voted candidates with the cosine of
+    each candidate's lyrics vector to the playlist's mean vector, one
+    candidate at a time
+    """
+    nnc, base, catalog = hybrid.nnc, hybrid.base, hybrid.catalog
+    query = nnc.playlistData[list(playlist["Playlist ID"].unique())]
+    neighbours = nnc.getNeighbors(query, hybrid.numNeighbours)
+    columns, ids, votes = nnc.candidateScores(neighbours, query.indices, playlist["Playlist ID"].unique())
+    candidates = sorted(zip(-votes, columns, ids))[:max(hybrid.numCandidates, numPredictions)]
+
+    vectors = [base.vectors[base.rows[trackID]] for trackID in catalog.toIds(playlist["Track URI"])
+               if trackID >= 0 and base.rows[trackID] >= 0]
+    centroid = np.mean(vectors, axis=0)
+    centroid /= np.linalg.norm(centroid)
+    bestVote = -candidates[0][0]
+    scored = []
+    for negativeVote, column, trackID in candidates:
+        content = float(base.vectors[base.rows[trackID]] @ centroid) if base.rows[trackID] >= 0 else 0.0
+        score = hybrid.voteWeight * -negativeVote / bestVote + hybrid.contentWeight * content
+        scored.append((-score, column, catalog.uris[trackID]))
+    return [uri for _, _, uri in sorted(scored)[:numPredictions]]
+
+
+def testRerankMatchesAReferenceBlend(explorer):
+    hybrid = HybridClassifier(explorer.NNC, explorer.baseClassifier, numCandidates=30, contentWeight=0.5)
+    for playlistID in PLAYLIST_IDS:
+        playlist = playlistRows(explorer, playlistID)
+        predictions = hybrid.predict(playlist, 20)
+        assert len(predictions) == 20 and not set(predictions) & set(playlist["Track URI"])
+        assert predictions == referencePredict(hybrid, playlist, 20)
+
+
+def testVotesAloneGiveTheNNCRanking(explorer):
+    hybrid = HybridClassifier(explorer.NNC, explorer.baseClassifier, numCandidates=50, voteWeight=1,
+                              contentWeight=0)
+    for playlistID in PLAYLIST_IDS:
+        playlist = playlistRows(explorer, playlistID)
+        assert hybrid.predict(playlist, 25) == list(explorer.NNC.predict(playlist, 25))
+
+
+def testBatchAndPrefixes(explorer):
+    hybrid = explorer.hybridClassifier
+    playlists = [playlistRows(explorer, playlistID) for playlistID in PLAYLIST_IDS]
+    assert hybrid.predictBatch(playlists, 8) == [hybrid.predict(playlist, 8) for playlist in playlists]
+    for playlist in playlists:
+        longest = hybrid.predict(playlist, hybrid.prefixLimit)
+        for n in (1, 5, hybrid.prefixLimit):
+            assert hybrid.predict(playlist, n) == longest[:n]
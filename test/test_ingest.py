@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from main import SpotifyExplorer
+from util import ingest
+from util.helpers import pickledFingerprint
+from util.store import DataStore, convertPickles
+
+MPD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "mpd")
+
+
+def testReadSlice():
+    playlists, tracks = ingest.readSlice(os.path.join(MPD_DIR, "mpd.slice.0-2.json"))
+    assert list(playlists.columns) == ["Playlist Name", "Playlist ID", "Track URI"]
+    assert sorted(playlists["Playlist ID"].unique()) == [0, 1, 2]
+    assert playlists["Track URI"].iloc[0] == "6I9VzXrHxO9rA9A5euc8Ak"
+    assert len(tracks) == len(playlists) and tracks["lyrics_embedding"].isna().all()
+
+
+def testInterruptedIngestResumes(tmp_path):
+    outDir = str(tmp_path / "ingest")
+    # A run stopped after the first slice, while the second part was being written
+    first = ingest.ingestSlices(MPD_DIR, outDir, numFiles=1, workers=1)
+    assert len(first) == 1
+    stale = ingest.partPath(outDir, os.path.join(MPD_DIR, "mpd.slice.3-5.json"))
+    with open(stale + ".tmp", "wb") as f:
+        f.write(b"partial")
+    firstWritten = os.stat(first[0]).st_mtime_ns
+
+    parts = ingest.ingestSlices(MPD_DIR, outDir, workers=1)
+    assert parts == [first[0], stale]
+    assert os.stat(first[0]).st_mtime_ns == firstWritten
+
+    playlists, tracks, playlistSparse = ingest.finalize(parts, str(tmp_path / "data"))
+    assert len(playlists) == 22
+    assert playlistSparse.shape == (6, 8) and playlistSparse.nnz == 22
+    assert tracks.index.nunique() == 8
+
+
+def testFinalizeStoreMatchesThePicklePath(tmp_path):
+    parts = ingest.ingestSlices(MPD_DIR, str(tmp_path / "ingest"), workers=1)
+    ingest.finalize(parts, str(tmp_path / "data"))
+    convertPickles(str(tmp_path / "data"), str(tmp_path / "converted"))
+    manifest = ingest.finalizeStore(parts, str(tmp_path / "store"))
+
+    converted, streamed = DataStore(str(tmp_path / "converted")), DataStore(str(tmp_path / "store"))
+    assert manifest == converted.manifest == streamed.manifest
+    assert manifest["playlistSparse"] == {"shape": [6, 8], "nnz": 22,
+                                          "fingerprint": pickledFingerprint(str(tmp_path / "data" / "playlistSparse.pkl"))}
+    assert (converted.playlistSparse() != streamed.playlistSparse()).nnz == 0
+    assert streamed.playlistSparse().indices.dtype == converted.playlistSparse().indices.dtype
+    for column in ["uris", "names", "artists"]:
+        assert list(getattr(streamed.catalog(), column).toArray()) == list(getattr(converted.catalog(), column).toArray())
+    pd.testing.assert_frame_equal(streamed.playlistsFrame(), converted.playlistsFrame())
+    matrix, valid = streamed.embeddings()
+    assert matrix.shape[0] == 8 and not valid.any()
+    assert not os.path.exists(str(tmp_path / "store.ingest"))
+
+
+def testFinalizeStoreLeavesGapsAsEmptyRows(tmp_path):
+    parts = ingest.ingestSlices(MPD_DIR, str(tmp_path / "ingest"), workers=1)
+    playlists, tracks = ingest.loadPart(parts[1])
+    playlists["Playlist ID"] += 4
+    tracks["Playlist ID"] += 4
+    pd.to_pickle((playlists, tracks), parts[1])
+    ingest.finalizeStore(parts, str(tmp_path / "store"))
+    matrix = DataStore(str(tmp_path / "store")).playlistSparse()
+    assert matrix.shape == (10, 8)
+    assert list(np.diff(matrix.indptr)[3:7]) == [0, 0, 0, 0]
+
+
+def testFinalizeStoreRejectsOverlappingParts(tmp_path):
+    parts = ingest.ingestSlices(MPD_DIR, str(tmp_path / "ingest"), workers=1)
+    with pytest.raises(ValueError):
+        ingest.finalizeStore([parts[0], parts[0]], str(tmp_path / "store"))
+
+
+def testExplorerStreamsIngestedSlicesIntoTheStore(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storeDir = str(tmp_path / "store")
+    explorer = SpotifyExplorer(2, retrainNNC=True, mpdDir=MPD_DIR, storeDir=storeDir, cacheSize=0)
+    assert explorer.playlistSparse.shape == (6, 8)
+    assert not os.path.exists(tmp_path / "data" / "playlists.pkl")
+    assert len(explorer.playlists) == 22
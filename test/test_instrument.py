@@ -0,0 +1,105 @@
+import json
+import threading
+import tracemalloc
+
+import pytest
+
+from util import instrument
+
+BLOCK = 4 << 20
+
+
+@pytest.fixture
+def recording():
+    tracing = tracemalloc.is_tracing()
+    instrument.disable()
+    instrument.reset()
+    yield
+    instrument.disable()
+    instrument.reset()
+    if not tracing:
+        tracemalloc.stop()
+
+
+def testNestedStagesHandTheirPeakToTheEnclosingStage(recording):
+    instrument.enable(memory=True)
+
+    @instrument.timed("inner")
+    def allocate():
+        block = bytearray(BLOCK)
+        return len(block)
+
+    with instrument.stage("outer"):
+        allocate()
+        allocate()
+    stages = instrument.snapshot()
+    assert stages["inner"]["calls"] == 2 and stages["outer"]["calls"] == 1
+    assert stages["outer"]["peakBytes"] >= stages["inner"]["peakBytes"] >= BLOCK
+    assert stages["outer"]["seconds"] >= stages["inner"]["seconds"]
+    assert abs(stages["outer"]["allocatedBytes"]) < BLOCK
+
+
+def testJSONAndPrometheusOutput(recording, tmp_path):
+    instrument.enable()
+    for _ in range(3):
+        with instrument.stage('NNC "search"'):
+            pass
+    path = tmp_path / "stages.json"
+    text = instrument.toJSON(str(path))
+    assert json.loads(path.read_text()) == json.loads(text)
+    assert json.loads(text)["memory"] is False
+    assert json.loads(text)["stages"]['NNC "search"']["calls"] == 3
+
+    lines = instrument.toPrometheus("test").splitlines()
+    assert 'test_stage_calls_total{stage="NNC \\"search\\""} 3' in lines
+    assert "# TYPE test_stage_seconds_total counter" in lines
+    assert not any("peak_bytes" in line for line in lines)
+
+    instrument.enable(memory=True)
+    assert "# TYPE test_stage_peak_bytes gauge" in instrument.toPrometheus("test").splitlines()
+
+
+def testThreadsNestOnlyInTheirOwnStages(recording):
+    instrument.enable()
+    barrier = threading.Barrier(2, timeout=10)
+    openStages = {}
+
+    def run(name, leaveFirst):
+        with instrument.stage(name):
+            barrier.wait()
+            if not leaveFirst:
+                barrier.wait()
+            openStages[name] = [stage.name for stage in instrument._stack()]
+        if leaveFirst:
+            barrier.wait()
+
+    threads = [threading.Thread(target=run, args=("first", True)),
+               threading.Thread(target=run, args=("second", False))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert openStages == {"first": ["first"], "second": ["second"]}
+    assert not instrument._stack()
+
+
+def testStageCountsFromManyThreads(recording):
+    instrument.enable()
+
+    def run():
+        for _ in range(500):
+            with instrument.stage("worker"):
+                pass
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert instrument.snapshot()["worker"]["calls"] == 2000
+
+
+def testDisabledStagesRecordNothing(recording):
+    with instrument.stage("off"):
+        pass
+    assert instrument.snapshot() == {}
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from sklearn.neighbors import NearestNeighbors
+
+from models.InvertedIndexNeighbors import InvertedIndexNeighbors
+
+
+def playlistMatrix(seed):
+    """
+    Random 0/1 playlist rows with duplicated rows (tied neighbours) and empty rows
+    """
+    rng = np.random.default_rng(seed)
+    rows = (rng.random((60, 12)) < 0.15).astype(np.float32)
+    rows[[5, 17]] = 0
+    rows[[20, 33]] = rows[3]
+    rows[40] = rows[7]
+    return csr_matrix(rows)
+
+
+def bruteForce(X, queries, k):
+    """
+    sklearn's brute-force cosine distances, ranked with ties broken by row
+    """
+    model = NearestNeighbors(metric="cosine", algorithm="brute").fit(X)
+    distances, rows = model.kneighbors(queries, n_neighbors=X.shape[0])
+    order = np.argsort(rows, axis=1)
+    distances, rows = np.take_along_axis(distances, order, axis=1), np.take_along_axis(rows, order, axis=1)
+    # Distances equal up to float error are ties
+    ranked = np.argsort(np.round(distances, 5), axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, ranked, axis=1), np.take_along_axis(rows, ranked, axis=1)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("k", [1, 5, 10, 60])
+def testMatchesBruteForceWithTiesByRow(seed, k):
+    X = playlistMatrix(seed)
+    expectedDistances, expectedRows = bruteForce(X, X, k)
+    distances, rows = InvertedIndexNeighbors().fit(X).kneighbors(X, n_neighbors=k)
+    np.testing.assert_array_equal(rows, expectedRows)
+    np.testing.assert_allclose(distances, expectedDistances, atol=1e-5)
+
+
+def testEmptyQueriesGetTheFirstRowsAtDistanceOne():
+    X = playlistMatrix(0)
+    distances, rows = InvertedIndexNeighbors().fit(X).kneighbors(X[[5]], n_neighbors=4)
+    assert list(rows[0]) == [0, 1, 2, 3] and np.all(distances == 1)
+
+
+def testTooManyNeighbours():
+    with pytest.raises(ValueError):
+        InvertedIndexNeighbors().fit(playlistMatrix(0)).kneighbors(playlistMatrix(0), n_neighbors=61)
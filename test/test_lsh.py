@@ -0,0 +1,63 @@
+import numpy as np
+
+from bench.lsh_recall import recallAtK
+from models.InvertedIndexNeighbors import InvertedIndexNeighbors
+from models.MinHashLSH import MinHashLSH
+from models.NNeighClassifier import NNeighClassifier
+from util.catalog import TrackCatalog
+
+K = 10
+
+
+def testRecallAgainstExactNeighbours(explorerData):
+    _, _, playlistSparse = explorerData
+    exactIndex = InvertedIndexNeighbors(n_neighbors=K).fit(playlistSparse)
+    index = MinHashLSH(n_neighbors=K, bands=32, rows=1).fit(playlistSparse)
+
+    recalls = []
+    for i in range(0, playlistSparse.shape[0], 3):
+        query = playlistSparse[i]
+        distances, neighbours = index.kneighbors(query, K)
+        # Every playlist collides with itself in every band
+        assert neighbours[0, 0] == i and abs(distances[0, 0]) < 1e-5
+        assert np.all(np.diff(distances[0]) >= -1e-6)
+        recalls.append(recallAtK(exactIndex.kneighbors(query, K), neighbours))
+    assert np.mean(recalls) >= 0.9
+
+
+def testEmptyQueriesGetNoCandidates(explorerData):
+    _, _, playlistSparse = explorerData
+    index = MinHashLSH(n_neighbors=K).fit(playlistSparse)
+    distances = index.kneighbors(playlistSparse[:1] * 0, K)[0]
+    assert np.all(distances[0] >= 1 - 1e-6)
+
+
+def testSavedTablesAreReloadedWithTheMatrix(workDir, explorerData, monkeypatch):
+    _, songs, playlistSparse = explorerData
+    catalog = TrackCatalog.fromSongs(songs)
+    params = {"bands": 16, "rows": 2, "maxCandidates": 50}
+    trained = NNeighClassifier(None, playlistSparse, catalog, reTrain=True, engine="lsh", engineParams=params)
+    assert (workDir / "trained" / "NNClassifier.lsh.npz").exists()
+
+    # Reloading must not refit the index
+    def fail(self, X):
+        raise AssertionError("the LSH index was refitted")
+    monkeypatch.setattr(MinHashLSH, "fit", fail)
+    loaded = NNeighClassifier(None, playlistSparse, catalog, reTrain=False, engine="lsh", engineParams=params)
+    assert isinstance(loaded.model, MinHashLSH) and loaded.model is not trained.model
+    assert (loaded.model.bands, loaded.model.rows, loaded.model.maxCandidates) == (16, 2, 50)
+    for band in range(16):
+        np.testing.assert_array_equal(loaded.model.bucketKeys[band], trained.model.bucketKeys[band])
+        np.testing.assert_array_equal(loaded.model.bucketMembers[band], trained.model.bucketMembers[band])
+
+    queries = playlistSparse[::5]
+    np.testing.assert_array_equal(loaded.getNeighborsBatch(queries, K), trained.getNeighborsBatch(queries, K))
+    direct = MinHashLSH.load(str(workDir / "trained" / "NNClassifier.lsh.npz"), playlistSparse)
+    np.testing.assert_array_equal(direct.kneighbors(queries, K)[1], trained.model.kneighbors(queries, K)[1])
+
+    # Other parameters retrain
+    monkeypatch.undo()
+    monkeypatch.chdir(workDir)
+    retrained = NNeighClassifier(None, playlistSparse, catalog, reTrain=False, engine="lsh",
+                                 engineParams={"bands": 8, "rows": 2})
+    assert retrained.model.bands == 8
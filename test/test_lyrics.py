@@ -0,0 +1,91 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+
+from bench.lyrics import makeLyrics, notebookEmbeddings, writeGlove
+from util import lyrics
+from util.catalog import TrackCatalog
+from util.embeddings import embeddingsFingerprint, loadEmbeddings, matchesCatalog
+
+STOPWORDS = frozenset(["the", "and"] + lyrics.LYRICS_STOPWORDS)
+
+
+def wordVectors(words, dim=4, seed=0):
+    return np.asarray(words, dtype=object), np.random.default_rng(seed).normal(size=(len(words), dim)).astype(np.float32)
+
+
+def testCountMatrixTokenizesLikePreprocessText():
+    texts = ["The Song's chorus, AND the chorus!", "oh yeah... la la", None, "tab\tsep\0arated words", ""]
+    words, _ = wordVectors(["song", "s", "chorus", "tab", "sep", "arated", "words"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        counts = lyrics.countMatrix(texts, words, workers=1, chunkSize=2, stopwordSet=STOPWORDS)
+    vocabulary = dict(zip(words, range(len(words))))
+    for i, text in enumerate(texts):
+        tokens = lyrics.preprocessText(text.replace("\0", " ") if text else "", STOPWORDS)
+        expected = np.bincount([vocabulary[token] for token in tokens if token in vocabulary], minlength=len(words))
+        assert counts[i].toarray().ravel().tolist() == expected.tolist()
+
+
+def testPipelineMatchesTheNotebookLoop(tmp_path):
+    rng = np.random.default_rng(0)
+    vocabulary, texts = makeLyrics(120, 300, 40, rng)
+    path = str(tmp_path / "vectors.txt")
+    writeGlove(path, vocabulary, rng.normal(size=(len(vocabulary), 6)))
+    words, vectors = lyrics.loadWordVectors(path)
+    texts[5] = ""
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        stopwordSet = lyrics.loadStopwords()
+        matrix, valid = lyrics.lyricsEmbeddings(texts, words, vectors, workers=1, chunkSize=16,
+                                                minDocs=1, minDocShare=0, maxDocShare=1)
+        parallel, _ = lyrics.lyricsEmbeddings(texts, words, vectors, workers=2, chunkSize=16,
+                                              minDocs=1, minDocShare=0, maxDocShare=1)
+    expected = notebookEmbeddings(pd.DataFrame({"Lyrics": texts}), stopwordSet, lyrics.loadLemmatizer(),
+                                  dict(zip(words, vectors)))
+    assert not valid[5] and expected[5] is None
+    for i, row in enumerate(expected):
+        if row is not None:
+            assert valid[i]
+            np.testing.assert_allclose(matrix[i], row, atol=1e-5)
+    np.testing.assert_array_equal(parallel, matrix)
+
+
+def testKeptWords():
+    words, _ = wordVectors(["common", "rare", "everywhere"])
+    texts = ["common everywhere", "common everywhere rare", "everywhere", "everywhere common"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        counts = lyrics.countMatrix(texts, words, workers=1, stopwordSet=STOPWORDS)
+    assert list(lyrics.keptWords(counts, minDocs=2, minDocShare=0, maxDocShare=0.9)) == [True, False, False]
+
+
+def testLoadWordVectorsReadsGloveAndWord2vec(tmp_path):
+    glove = tmp_path / "glove.txt"
+    glove.write_text("the 0.1 0.2\nnull 0.3 0.4\nthe 0.5 0.6\n", encoding="utf-8")
+    words, vectors = lyrics.loadWordVectors(str(glove))
+    assert list(words) == ["the", "null"]
+    np.testing.assert_allclose(vectors, [[0.1, 0.2], [0.3, 0.4]])
+
+    word2vec = tmp_path / "word2vec.txt"
+    word2vec.write_text("2 2\nthe 0.1 0.2\nnull 0.3 0.4\n", encoding="utf-8")
+    words, vectors = lyrics.loadWordVectors(str(word2vec))
+    assert list(words) == ["the", "null"] and vectors.dtype == np.float32
+
+
+def testWriteLyricsEmbeddingsAlignsWithTheCatalog(tmp_path):
+    catalog = TrackCatalog(["t0", "t1", "t2"], ["a", "b", "c"], ["x", "y", "z"])
+    words, vectors = wordVectors(["red", "blue"])
+    uris = np.array(["t2", "unknown", "t0", "t2"], dtype=object)
+    texts = np.array(["red red blue", "blue", "blue", "red"], dtype=object)
+    with contextlib.redirect_stdout(io.StringIO()):
+        shape = lyrics.writeLyricsEmbeddings(str(tmp_path), catalog, uris, texts, words, vectors, workers=1,
+                                             minDocs=1, minDocShare=0, maxDocShare=1)
+    assert shape == (3, 4)
+    matrix, valid = loadEmbeddings(str(tmp_path))
+    assert list(valid) == [True, False, True]
+    # The first lyrics of t2 win; loaded rows are unit length
+    expected = (2 * vectors[0] + vectors[1]) / 3
+    np.testing.assert_allclose(matrix[2], expected / np.linalg.norm(expected), atol=1e-6)
+    assert embeddingsFingerprint(str(tmp_path)) == catalog.fingerprint()
+    assert matchesCatalog(str(tmp_path), matrix, catalog)
@@ -0,0 +1,131 @@
+import os
+import pickle
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from conftest import NUM_PLAYLISTS, newPlaylists, playlistRows
+from main import SpotifyExplorer
+from models import NNeighClassifier
+from util.helpers import getPlaylistIDs, matrixFingerprint, pickledFingerprint, playlistsToSparseMatrix
+from util.store import DataStore, convertPickles
+
+
+@pytest.fixture
+def noHashing(monkeypatch):
+    """
+    Fail any matrix hashing done by the NNC while loading
+    """
+    def fail(matrix):
+        raise AssertionError("the playlist matrix was hashed on load")
+    monkeypatch.setattr(NNeighClassifier, "matrixFingerprint", fail)
+
+
+def testChunkedFingerprintIsTheSameAsOneChunk(explorerData):
+    _, _, playlistSparse = explorerData
+    assert matrixFingerprint(playlistSparse, chunkSize=7) == matrixFingerprint(playlistSparse)
+
+
+def testStoreRecordsTheMatrixFingerprint(workDir, explorerData, noHashing):
+    _, _, playlistSparse = explorerData
+    storeDir = str(workDir / "store")
+    convertPickles(str(workDir / "data"), storeDir)
+    store = DataStore(storeDir)
+    assert store.manifest["playlistSparse"]["fingerprint"] == matrixFingerprint(playlistSparse)
+    # The memory-mapped copy hashes the same as the pickled matrix
+    assert matrixFingerprint(store.playlistSparse()) == matrixFingerprint(playlistSparse)
+
+    explorer = SpotifyExplorer(0, retrainNNC=False, storeDir=storeDir, cacheSize=0)
+    assert explorer.NNC.fingerprint == matrixFingerprint(playlistSparse)
+
+
+def testPickleSidecarIsUsedUntilThePickleChanges(workDir, explorerData, noHashing, monkeypatch):
+    _, _, playlistSparse = explorerData
+    path = str(workDir / "data" / "playlistSparse.pkl")
+    assert pickledFingerprint(path) == matrixFingerprint(playlistSparse)
+    explorer = SpotifyExplorer(0, retrainNNC=False, cacheSize=0)
+    assert explorer.NNC.fingerprint == matrixFingerprint(playlistSparse)
+
+    # A pickle rewritten without the sidecar is hashed again
+    changed = playlistSparse[:NUM_PLAYLISTS // 2]
+    with open(path, "wb") as f:
+        pickle.dump(changed, f)
+    os.utime(path, ns=(0, 0))
+    assert pickledFingerprint(path) is None
+    monkeypatch.setattr(NNeighClassifier, "matrixFingerprint", matrixFingerprint)
+    explorer = SpotifyExplorer(0, retrainNNC=False, cacheSize=0)
+    assert explorer.NNC.fingerprint == matrixFingerprint(changed)
+
+
+def testCompactionRecordsTheMergedFingerprint(workDir):
+    storeDir = str(workDir / "store")
+    explorer = SpotifyExplorer(0, retrainNNC=True, storeDir=storeDir, cacheSize=0)
+    explorer.appendPlaylists(*newPlaylists(NUM_PLAYLISTS))
+    explorer.compact()
+
+    merged = matrixFingerprint(DataStore(storeDir).playlistSparse())
+    assert explorer.NNC.fingerprint == merged
+    assert DataStore(storeDir).manifest["playlistSparse"]["fingerprint"] == merged
+    # The saved model is reused for the compacted store
+    reopened = SpotifyExplorer(0, retrainNNC=False, storeDir=storeDir, cacheSize=0)
+    assert reopened.NNC.fingerprint == merged
+
+
+def queryPlaylists(explorer):
+    """
+    Playlists from the data, whose own rows are among their neighbours, plus
+    the same tracks without a Playlist ID and a playlist of unknown tracks
+    """
+    playlists = [playlistRows(explorer, playlistID) for playlistID in (0, 5, 42, 99, 119)]
+    playlists.append(playlists[1][["Track URI"]])
+    playlists.append(playlists[0].assign(**{"Track URI": "spotify:track:unknown"}))
+    return playlists
+
+
+def referenceVotes(nnc, neighbors, queryColumns, playlistIDs):
+    """
+    {matrix column: vote} counted one neighbour row at a time, the way the
+    dict-based vote did: neighbours other than the query playlist give
+    their tracks 1/(rank+1), tracks of the query and outside the catalog
+    get no vote
+    """
+    votes = {}
+    rank = 0
+    for neighbor in neighbors:
+        if neighbor in playlistIDs:
+            continue
+        row = nnc.playlistData[[neighbor]]
+        for column, value in zip(row.indices, row.data):
+            votes[column] = votes.get(column, 0) + Fraction(int(value), rank + 1)
+        rank += 1
+    return {column: vote for column, vote in votes.items()
+            if column not in set(queryColumns) and nnc.catalog.columnIds([column])[0] >= 0}
+
+
+def testPredictBatchMatchesOnePredictPerPlaylist(explorer):
+    nnc = explorer.NNC
+    playlists = queryPlaylists(explorer)
+    sparseX = playlistsToSparseMatrix(playlists[:1], nnc.catalog, nnc.playlistData.shape[1])
+    assert 0 in nnc.getNeighbors(sparseX, 60)
+    for n in (1, 10, 25):
+        assert nnc.predictBatch(playlists, n) == [nnc.predict(X, n) for X in playlists]
+    assert not set(nnc.predict(playlists[0], 25)) & set(playlists[0]["Track URI"])
+
+
+def testVotesMatchADictBasedVote(explorer):
+    nnc = explorer.NNC
+    for X in queryPlaylists(explorer):
+        sparseX = playlistsToSparseMatrix([X], nnc.catalog, nnc.playlistData.shape[1])
+        neighbors = nnc.getNeighbors(sparseX, 60)
+        columns, ids, scores = nnc.candidateScores(neighbors, sparseX.indices, getPlaylistIDs(X))
+        expected = referenceVotes(nnc, neighbors, sparseX.indices, getPlaylistIDs(X))
+        assert sorted(columns) == sorted(expected)
+        np.testing.assert_allclose(scores, [float(expected[column]) for column in columns])
+        assert list(ids) == list(nnc.catalog.columnIds(columns))
+
+        # Best vote first, ties by column, at every cut through the ties
+        ranked = sorted(expected, key=lambda column: (-expected[column], column))
+        for n in (1, 7, 20, len(ranked), len(ranked) + 5):
+            assert list(columns[NNeighClassifier.topOrder(columns, scores, n)]) == ranked[:n]
+        assert nnc.predict(X, 20) == list(nnc.catalog.uris[nnc.catalog.columnIds(ranked[:20])])
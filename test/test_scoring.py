@@ -0,0 +1,89 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import NUM_PLAYLISTS, playlistRows
+from util import scoring
+
+SHARD_SIZE = 7
+
+
+def scoreAll(explorer, outDir, numPredictions=12, **kwargs):
+    return scoring.scorePlaylists(explorer.classifier, explorer.playlists, explorer.catalog, str(outDir),
+                                  numPredictions, shardSize=SHARD_SIZE, workers=1,
+                                  fingerprint=explorer.NNC.fingerprint, **kwargs)
+
+
+def testShardsHoldEachPlaylistsPredictions(explorer, tmp_path):
+    report = scoreAll(explorer, tmp_path)
+    numShards = -(-NUM_PLAYLISTS // SHARD_SIZE)
+    assert report["shards"] == numShards and report["playlists"] == NUM_PLAYLISTS
+    with open(tmp_path / scoring.MANIFEST) as f:
+        assert json.load(f)["numShards"] == numShards
+
+    ids = np.sort(explorer.playlists["Playlist ID"].unique())
+    for shard in range(numShards):
+        frame = pd.read_pickle(scoring.shardPath(str(tmp_path), shard))
+        assert list(frame["Playlist ID"].unique()) == list(ids[shard * SHARD_SIZE:(shard + 1) * SHARD_SIZE])
+
+    scores = scoring.loadScores(str(tmp_path))
+    for playlistID in (0, 6, 7, NUM_PLAYLISTS - 1):
+        rows = scores[scores["Playlist ID"] == playlistID]
+        assert list(rows["Rank"]) == list(range(1, len(rows) + 1))
+        assert list(rows["Track URI"]) == list(explorer.classifier.predict(playlistRows(explorer, playlistID), 12))
+
+
+def testInterruptedRunResumesToTheSameOutput(explorer, tmp_path, monkeypatch):
+    scoreAll(explorer, tmp_path / "whole")
+    expected = scoring.loadScores(str(tmp_path / "whole"))
+
+    scoreShard = scoring._scoreShard
+    calls = []
+
+    def interrupted(task):
+        if calls:
+            raise KeyboardInterrupt
+        calls.append(task)
+        return scoreShard(task)
+
+    monkeypatch.setattr(scoring, "_scoreShard", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        scoreAll(explorer, tmp_path / "resumed")
+    assert sorted(os.listdir(tmp_path / "resumed")) == sorted([scoring.MANIFEST, "shard-00000.pkl"])
+    monkeypatch.setattr(scoring, "_scoreShard", scoreShard)
+
+    report = scoreAll(explorer, tmp_path / "resumed")
+    assert report["skippedShards"] == 1 and report["playlists"] == NUM_PLAYLISTS - SHARD_SIZE
+    resumed = scoring.loadScores(str(tmp_path / "resumed"))
+    pd.testing.assert_frame_equal(resumed, expected)
+    assert scoring.dashboardRecs(resumed, 5) == scoring.dashboardRecs(expected, 5)
+
+    # Other settings start over
+    report = scoreAll(explorer, tmp_path / "resumed", numPredictions=5)
+    assert report["skippedShards"] == 0 and report["playlists"] == NUM_PLAYLISTS
+
+
+def testDashboardRecsKeepTheFirstPlaylistOfEachName(explorer, tmp_path):
+    scoreAll(explorer, tmp_path)
+    recs = scoring.dashboardRecs(scoring.loadScores(str(tmp_path)), 5)
+
+    expected = {}
+    for playlistID in np.sort(explorer.playlists["Playlist ID"].unique()):
+        playlist = playlistRows(explorer, playlistID)
+        name = playlist["Playlist Name"].iloc[0]
+        if name not in expected:
+            uris = explorer.classifier.predict(playlist, 5)
+            expected[name] = [uri if uri.startswith("spotify:track:") else "spotify:track:" + uri for uri in uris]
+    assert list(recs.items()) == list(expected.items())
+
+
+def testDashboardRecsOfARepeatedName():
+    scores = pd.DataFrame({"Playlist ID": [4, 4, 4, 9, 9, 2],
+                           "Playlist Name": ["mix", "mix", "mix", "solo", "solo", "mix"],
+                           "Rank": [1, 2, 3, 1, 2, 1],
+                           "Track URI": ["a", "spotify:track:b", "c", "d", "e", "f"]})
+    assert scoring.dashboardRecs(scores, 2) == {"mix": ["spotify:track:a", "spotify:track:b"],
+                                                "solo": ["spotify:track:d", "spotify:track:e"]}
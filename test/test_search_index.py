@@ -0,0 +1,52 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Dashboard", "dashboard"))
+
+from search_index import TypeaheadIndex, tokenize  # noqa: E402
+
+
+def referenceSearch(labels, query, limit):
+    """
+    Scan every label: those starting with the query in case-insensitive
+    order, then the shortest labels whose tokens the query tokens prefix,
+    ties broken by position
+    """
+    query = query.strip().lower()
+    queryTokens = tokenize(query)
+    if not queryTokens:
+        return []
+    starts = sorted((i for i, label in enumerate(labels) if label.lower().startswith(query)),
+                    key=lambda i: labels[i].lower())[:limit]
+    others = [i for i, label in enumerate(labels) if i not in starts
+              and all(any(token.startswith(q) for token in tokenize(label)) for q in queryTokens)]
+    others.sort(key=lambda i: (len(labels[i]), i))
+    return [labels[i] for i in starts + others[:limit - len(starts)]]
+
+
+def songLabels(numLabels=400, seed=0):
+    rng = np.random.default_rng(seed)
+    words = ["love", "lost", "Lover", "night", "nights", "road", "Rock", "roll", "blue", "blues", "sky", "ska"]
+    labels = []
+    for _ in range(numLabels):
+        title = " ".join(rng.choice(words, rng.integers(1, 4)))
+        labels.append(f"{title} by {rng.choice(words).title()}")
+    return labels
+
+
+@pytest.mark.parametrize("limit", [1, 5, 20, 500])
+def testSearchMatchesAFullScan(limit):
+    labels = songLabels()
+    index = TypeaheadIndex(labels)
+    for query in ["lo", "love", "Love by", "  ROCK ", "ro bl", "by sk", "nights lost", "zzz", "", "!!", "b"]:
+        assert index.search(query, limit) == referenceSearch(labels, query, limit), query
+
+
+def testPrefixMatchesComeFirst():
+    index = TypeaheadIndex(["Rock Lobster by The B-52's", "Jailhouse Rock by Elvis", "rock by x"])
+    assert index.search("rock", 3) == ["rock by x", "Rock Lobster by The B-52's", "Jailhouse Rock by Elvis"]
+    assert index.search("lob b", 3) == ["Rock Lobster by The B-52's"]
+    assert TypeaheadIndex([]).search("rock") == []
@@ -0,0 +1,50 @@
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+from models.NNeighClassifier import NNeighClassifier
+from util.catalog import TrackCatalog
+from util.segments import SegmentedColumn, SegmentedMatrix, matrixBlocks
+from util.store import StringColumn
+
+
+def testSegmentedColumn():
+    column = SegmentedColumn(StringColumn.fromValues(["a", "b"]))
+    column.append(np.array(["c"], dtype=object))
+    column.append(np.array(["d", "e"], dtype=object))
+    assert len(column) == 5
+    assert column[3] == "d"
+    assert list(column[np.array([4, 0, 2])]) == ["e", "a", "c"]
+    assert list(column[1:4]) == ["b", "c", "d"]
+    assert list(column) == list(column.toArray()) == ["a", "b", "c", "d", "e"]
+
+
+def testSegmentedMatrixRowsAndCompaction(explorerData):
+    _, _, playlistSparse = explorerData
+    base, delta = playlistSparse[:100], playlistSparse[100:]
+    # A delta narrower than the base is zero-padded to the full width
+    narrow = csr_matrix(delta[:, :delta.indices.max() + 1])
+    matrix = SegmentedMatrix(base, [narrow[:7], narrow[7:]])
+    assert matrix.shape == playlistSparse.shape and matrix.nnz == playlistSparse.nnz
+    assert [first for first, _ in matrixBlocks(matrix)] == [0, 100, 107]
+
+    rows = np.array([110, 3, 100, 119, 3])
+    assert (matrix[rows] != playlistSparse[rows]).nnz == 0
+    assert (matrix.compact() != playlistSparse).nnz == 0
+    assert (matrix.compact() != vstack([base, delta])).nnz == 0
+
+
+def testNNCSegmentsFindTheNeighboursOfARetrainedModel(workDir, explorerData):
+    _, songs, playlistSparse = explorerData
+    catalog = TrackCatalog.fromSongs(songs)
+    segmented = NNeighClassifier(None, playlistSparse[:90], catalog, reTrain=True, engine="inverted")
+    segmented.addSegment(playlistSparse[90:105])
+    segmented.addSegment(playlistSparse[105:])
+    retrained = NNeighClassifier(None, playlistSparse, catalog, reTrain=True, engine="inverted",
+                                 name="retrained.pkl")
+
+    queries = playlistSparse[::7]
+    np.testing.assert_array_equal(segmented.getNeighborsBatch(queries, 10), retrained.getNeighborsBatch(queries, 10))
+
+    segmented.compact()
+    assert not segmented.segmentModels and segmented.fingerprint == retrained.fingerprint
+    np.testing.assert_array_equal(segmented.getNeighborsBatch(queries, 10), retrained.getNeighborsBatch(queries, 10))
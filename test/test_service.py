@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+from bench.service_load import post
+from conftest import playlistRows
+from util.service import RecommendationService, rankGroups, requestCount, requestPlaylist
+
+
+@pytest.mark.parametrize("classifier", ["NNC", "Base", "Hybrid"])
+def testRankGroupsMatchesOnePredictPerRequest(explorer, classifier):
+    explorer.setClassifier(classifier)
+    playlists = [playlistRows(explorer, i) for i in (3, 7, 11, 7, 20)]
+    counts = [5, 30, 8, 12, 30]
+    ranked = rankGroups(explorer.classifier, playlists, counts)
+    for playlist, n, predictions in zip(playlists, counts, ranked):
+        assert predictions == list(explorer.classifier.predict(playlist, n))
+
+
+def testRequestPlaylist():
+    playlist = requestPlaylist({"tracks": ["a", "b"], "playlistId": 4, "name": "road trip"})
+    assert list(playlist["Track URI"]) == ["a", "b"]
+    assert set(playlist["Playlist ID"]) == {4}
+    assert requestPlaylist({"tracks": [], "name": "road trip"}).attrs["Playlist Name"] == "road trip"
+    for body in [{}, {"tracks": "a"}, {"tracks": [1]}, ["a"]]:
+        with pytest.raises(ValueError):
+            requestPlaylist(body)
+
+
+@pytest.mark.parametrize("n", [-1, 0, 2.5, "10", True, None])
+def testRequestCountRejectsAnythingButAPositiveInteger(n):
+    with pytest.raises(ValueError):
+        requestCount({"n": n})
+
+
+def testRequestCount():
+    assert requestCount({}) == 50
+    assert requestCount({"n": 7}) == 7
+
+
+def testServiceAnswersConcurrentRequestsForMixedCounts(explorer):
+    explorer.setClassifier("Base")
+    tracks = {i: [str(uri) for uri in playlistRows(explorer, i)["Track URI"]] for i in (3, 7, 11)}
+    requests = [(3, 5), (7, 30), (11, 8), (7, 12)]
+
+    async def session():
+        service = RecommendationService(explorer, maxBatch=8, maxDelay=0.05)
+        port = await service.start("127.0.0.1", 0)
+        connections = [await asyncio.open_connection("127.0.0.1", port) for _ in requests]
+        try:
+            responses = await asyncio.gather(*[
+                post(reader, writer, "/recommend", {"tracks": tracks[i], "playlistId": i, "n": n})
+                for (reader, writer), (i, n) in zip(connections, requests)])
+            invalid = await post(*connections[0], "/recommend", {"tracks": tracks[3], "n": -3})
+            stats = service.batcher.stats()
+        finally:
+            for _, writer in connections:
+                writer.close()
+            await service.stop()
+        return responses, invalid, stats
+
+    responses, invalid, stats = asyncio.run(session())
+    for (i, n), (status, response) in zip(requests, responses):
+        assert status == 200
+        expected = explorer.classifier.predict(requestPlaylist({"tracks": tracks[i], "playlistId": i}), n)
+        assert response["predictions"] == [str(uri) for uri in expected]
+    assert invalid[0] == 400 and "positive integer" in invalid[1]["error"]
+    assert stats["maxBatchSize"] > 1
+
+
+def testRouteRejectsBadBodies(explorer):
+    service = RecommendationService(explorer)
+    for body in [b"not json", b"[1, 2]", json.dumps({"tracks": ["a"], "n": "5"}).encode()]:
+        status, _, payload = asyncio.run(service.route("POST", "/recommend", body))
+        assert status == 400, payload
+
+
+def testOnlyTheFailingRequestOfABatchGetsTheError(explorer):
+    explorer.setClassifier("Base")
+    good = [playlistRows(explorer, i) for i in (3, 7)]
+    missingID = requestPlaylist({"tracks": [str(uri) for uri in good[0]["Track URI"]]})
+
+    async def session():
+        service = RecommendationService(explorer, maxBatch=8, maxDelay=0.05)
+        service.batcher.start()
+        try:
+            return await asyncio.gather(*[service.batcher.recommend(playlist, 10)
+                                          for playlist in (good[0], missingID, good[1])],
+                                        return_exceptions=True), service.batcher.stats()
+        finally:
+            await service.batcher.stop()
+
+    (first, failed, second), stats = asyncio.run(session())
+    assert isinstance(failed, ValueError)
+    assert first == list(explorer.classifier.predict(good[0], 10))
+    assert second == list(explorer.classifier.predict(good[1], 10))
+    assert stats["maxBatchSize"] == 3 and stats["errors"] == 1
+
+
+def testRequestsTheClassifierCannotAnswerAreRejectedBeforeBatching(explorer):
+    explorer.setClassifier("Base")
+    service = RecommendationService(explorer)
+    tracks = [str(uri) for uri in playlistRows(explorer, 3)["Track URI"]]
+    status, _, payload = asyncio.run(service.route("POST", "/recommend", json.dumps({"tracks": tracks}).encode()))
+    assert status == 400 and b"playlist ID" in payload
+    assert service.batcher.stats()["requests"] == 0
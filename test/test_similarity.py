@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from util.similarity import normalizeRows, topkNeighbours
+
+
+def testNormalizeRowsLeavesZeroRows():
+    rows = normalizeRows([[3, 4], [0, 0]])
+    np.testing.assert_allclose(rows, [[0.6, 0.8], [0, 0]])
+
+
+@pytest.mark.parametrize("blockSize", [1, 7, 1024])
+def testTopkNeighboursMatchesADenseArgsort(blockSize):
+    vectors = np.random.default_rng(0).normal(size=(50, 6))
+    neighbours, sims, stats = topkNeighbours(vectors, 8, blockSize=blockSize)
+
+    dense = normalizeRows(vectors) @ normalizeRows(vectors).T
+    np.fill_diagonal(dense, -np.inf)
+    expected = np.argsort(-dense, axis=1)[:, :8]
+    np.testing.assert_array_equal(neighbours, expected)
+    np.testing.assert_allclose(sims, np.take_along_axis(dense, expected, axis=1), rtol=1e-5)
+    assert stats["k"] == 8 and stats["peakMB"] is None
+
+
+def testTopkNeighboursIsCappedAtTheOtherRows():
+    neighbours, _, stats = topkNeighbours(np.eye(4), 10, traceMemory=True)
+    assert neighbours.shape == (4, 3) and stats["peakMB"] >= 0
+    assert all(i not in row for i, row in enumerate(neighbours))
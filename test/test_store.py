@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import NUM_PLAYLISTS, newPlaylists
+from main import SpotifyExplorer
+from util.catalog import TrackCatalog
+from util.store import DataStore, StringColumn, convertPickles, listSegments
+
+
+def matrixRows(matrix):
+    return [sorted(matrix[i].indices) for i in range(matrix.shape[0])]
+
+
+def testStringColumnRoundTrip():
+    values = np.array(["a", "", "ünïcode", "longer value"], dtype=object)
+    column = StringColumn.fromValues(values)
+    assert len(column) == 4
+    assert column[2] == "ünïcode"
+    assert list(column.toArray()) == list(values)
+    assert list(column[np.array([3, 0])]) == ["longer value", "a"]
+
+
+def testStoreMatchesThePickles(workDir, explorerData):
+    playlists, songs, playlistSparse = explorerData
+    storeDir = str(workDir / "store")
+    convertPickles(str(workDir / "data"), storeDir)
+    store = DataStore(storeDir)
+
+    assert (store.playlistSparse() != playlistSparse).nnz == 0
+    catalog, expected = store.catalog(), TrackCatalog.fromSongs(songs)
+    assert list(catalog.uris.toArray()) == list(expected.uris)
+    assert list(catalog.sparseIds) == list(expected.sparseIds)
+    frame = store.playlistsFrame(catalog)
+    pd.testing.assert_frame_equal(frame, playlists.reset_index(drop=True)[frame.columns], check_dtype=False)
+    matrix, valid = store.embeddings()
+    assert matrix.shape == (len(catalog), 8) and valid.all()
+
+
+def testAppendReconvertReopen(workDir):
+    storeDir = str(workDir / "store")
+    explorer = SpotifyExplorer(0, retrainNNC=True, storeDir=storeDir, cacheSize=0)
+    base = explorer.playlistSparse.copy()
+    appended, songs = newPlaylists(NUM_PLAYLISTS)
+    explorer.appendPlaylists(appended, songs)
+    assert len(listSegments(storeDir)) == 1
+
+    reopened = DataStore(storeDir)
+    assert reopened.playlistSparse().shape == base.shape
+    assert sum(delta.shape[0] for delta in reopened.deltas()) == appended["Playlist ID"].nunique()
+    assert reopened.playlistsFrame()["Playlist ID"].max() == appended["Playlist ID"].max()
+
+    # Reconverting the pickles starts a fresh base without the old segments
+    convertPickles(str(workDir / "data"), storeDir)
+    assert listSegments(storeDir) == []
+    reopened = SpotifyExplorer(0, retrainNNC=True, storeDir=storeDir, cacheSize=0)
+    assert reopened.playlistSparse.shape == base.shape
+    assert matrixRows(reopened.playlistSparse) == matrixRows(base)
+    assert len(reopened.catalog) == len(DataStore(storeDir).catalog())
+    assert reopened.playlists["Playlist ID"].max() == NUM_PLAYLISTS - 1
+
+
+def testCompactMergesTheSegments(workDir):
+    storeDir = str(workDir / "store")
+    explorer = SpotifyExplorer(0, retrainNNC=True, storeDir=storeDir, cacheSize=0)
+    appended, songs = newPlaylists(NUM_PLAYLISTS)
+    explorer.appendPlaylists(appended, songs)
+    segmented = explorer.playlistSparse
+    rows = matrixRows(segmented[np.arange(segmented.shape[0])])
+    explorer.compact()
+
+    assert listSegments(storeDir) == []
+    assert not os.path.exists(storeDir + ".compact")
+    reopened = SpotifyExplorer(0, retrainNNC=False, storeDir=storeDir, cacheSize=0)
+    assert matrixRows(reopened.playlistSparse) == rows
+    assert len(reopened.catalog) == len(explorer.catalog)
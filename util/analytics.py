@@ -0,0 +1,178 @@
+"""
+One-pass dataset profile behind the util.vis plots.
+
+buildProfile streams over the playlist matrix (the base CSR and any delta
+blocks) in chunks of rows and accumulates, from the CSR arrays alone, the
+playlist-length histogram and the number of playlists holding every
+matrix column. Track popularity and artist frequencies then follow from
+the catalog columns with one bincount each, and title keywords are counted
+in one pass over the playlist names. The profile holds only aggregates
+(the histogram and the topK tracks, artists and keywords), so it is small
+enough to cache as JSON next to the data and the plots never touch the
+raw playlists.
+
+    profile = cachedProfile("data/profile.json", fingerprint,
+                            lambda: buildProfile(playlistSparse, catalog, store.playlistNames()))
+    vis.displayPopularArtists(profile)
+
+    python -m util.analytics --out data/profile.json --figs figs
+"""
+import argparse
+import json
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from util import instrument
+from util.helpers import nameTokens
+from util.segments import matrixBlocks
+
+PROFILE_VERSION = 1
+
+
+def playlistNames(playlists):
+    """
+    One Playlist Name per Playlist ID of a playlist rows DataFrame
+    """
+    return playlists.drop_duplicates("Playlist ID")["Playlist Name"].to_numpy(dtype=object)
+
+
+def columnValues(column):
+    # Store-backed catalog columns are decoded in one go
+    return column.toArray() if hasattr(column, "toArray") else np.asarray(column, dtype=object)
+
+
+def topCounts(counts, topK):
+    """
+    Positions of the topK largest counts, ties broken by position, without zeros
+    """
+    order = np.argsort(-counts, kind="stable")[:topK]
+    return order[counts[order] > 0]
+
+
+@instrument.timed("analytics.buildProfile")
+def buildProfile(playlistSparse, catalog, names, topK=1000, chunkRows=100000):
+    """
+    Aggregates of the playlist matrix, catalog and playlist names.
+    Lengths count a playlist's distinct catalog tracks, and playlist
+    matrix rows without any (gaps in the Playlist IDs) are left out.
+
+    Returns:
+        dict: JSON-ready profile with lengthCounts (playlists per length),
+            tracks, artists and keywords (topK of each by playlist count)
+    """
+    numColumns = playlistSparse.shape[1]
+    columnCounts = np.zeros(numColumns, dtype=np.int64)
+    lengthCounts = np.zeros(1, dtype=np.int64)
+    for _, block in matrixBlocks(playlistSparse):
+        indptr = np.asarray(block.indptr, dtype=np.int64)
+        for lo in range(0, block.shape[0], chunkRows):
+            hi = min(lo + chunkRows, block.shape[0])
+            # Matrix entries are 0/1, so a column's entry count is its playlist count
+            columnCounts += np.bincount(block.indices[indptr[lo]:indptr[hi]], minlength=numColumns)
+            lengths = np.bincount(np.diff(indptr[lo:hi + 1]))
+            if len(lengths) > len(lengthCounts):
+                lengthCounts = np.pad(lengthCounts, (0, len(lengths) - len(lengthCounts)))
+            lengthCounts[:len(lengths)] += lengths
+    lengthCounts[0] = 0
+
+    # Columns to track ids, then tracks to artists
+    ids = catalog.columnIds(np.arange(numColumns))
+    used = ids >= 0
+    trackCounts = np.bincount(ids[used], weights=columnCounts[used], minlength=len(catalog)).astype(np.int64)
+    artistCodes, artistNames = pd.factorize(columnValues(catalog.artists))
+    artistCounts = np.bincount(artistCodes[artistCodes >= 0], weights=trackCounts[artistCodes >= 0],
+                               minlength=len(artistNames)).astype(np.int64)
+
+    keywords = Counter(token for name in names for token in nameTokens(name))
+    keywords = sorted(keywords.items(), key=lambda item: (-item[1], item[0]))[:topK]
+
+    topTracks = topCounts(trackCounts, topK)
+    topArtists = topCounts(artistCounts, topK)
+    return {
+        "version": PROFILE_VERSION,
+        "numPlaylists": int(lengthCounts.sum()),
+        "numTracks": int((trackCounts > 0).sum()),
+        "numEntries": int(columnCounts.sum()),
+        "lengthCounts": lengthCounts.tolist(),
+        "tracks": {
+            "uris": [str(uri) for uri in catalog.uris[topTracks]],
+            "names": [str(name) for name in catalog.names[topTracks]],
+            "artists": [str(artist) for artist in catalog.artists[topTracks]],
+            "counts": trackCounts[topTracks].tolist(),
+        },
+        "artists": {
+            "names": [str(name) for name in artistNames[topArtists]],
+            "counts": artistCounts[topArtists].tolist(),
+        },
+        "keywords": {
+            "words": [word for word, _ in keywords],
+            "counts": [count for _, count in keywords],
+        },
+    }
+
+
+def saveProfile(path, profile, fingerprint=None):
+    """
+    Write a profile and the fingerprint of the data it describes atomically
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"fingerprint": fingerprint, "profile": profile}, f)
+    os.replace(path + ".tmp", path)
+
+
+def loadProfile(path, fingerprint=None):
+    """
+    The profile saved at path, or None when there is none or it was built
+    from other data (another fingerprint) or by another profile version
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        saved = json.load(f)
+    # Round-trip through JSON so tuples and lists compare equal
+    if saved.get("fingerprint") != json.loads(json.dumps(fingerprint)):
+        return None
+    if saved["profile"].get("version") != PROFILE_VERSION:
+        return None
+    return saved["profile"]
+
+
+def cachedProfile(path, fingerprint, build):
+    """
+    The profile cached at path for fingerprint, built with build() and
+    cached when it is missing or stale
+    """
+    profile = loadProfile(path, fingerprint)
+    if profile is None:
+        profile = build()
+        saveProfile(path, profile, fingerprint)
+    return profile
+
+
+def main():
+    from main import SpotifyExplorer
+    from util import vis
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=os.path.join("data", "profile.json"))
+    parser.add_argument("--figs", help="also render the util.vis figures into this directory")
+    parser.add_argument("--top", type=int, default=1000)
+    parser.add_argument("--store-dir")
+    args = parser.parse_args()
+
+    explorer = SpotifyExplorer(0, retrainNNC=False, storeDir=args.store_dir, cacheSize=0)
+    profile = explorer.datasetProfile(args.out, args.top)
+    print(f"{profile['numPlaylists']} playlists, {profile['numTracks']} tracks, "
+          f"{profile['numEntries']} playlist entries, profile in {args.out}")
+    if args.figs:
+        vis.displayAll(profile, args.figs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Bounded LRU cache of recommendation lists.
+
+Entries are keyed by classifier name and a canonical hash of the playlist
+as the classifiers see it: its set of Track URIs plus its Playlist IDs,
+which the classifiers use to leave the playlist itself out, and its name,
+which the cold-start path recommends from. Requests up to the classifier's
+prefix limit (util.helpers.prefixLimit) share one entry: a list cached for
+N predictions also answers any request for fewer, and a list shorter than
+what was asked for (the classifier ran out of candidates) answers any
+request up to the limit. Beyond the limit, and for classifiers whose
+shorter lists are not prefixes of longer ones, every count is cached on
+its own. Empty lists are never cached, and entries go in and come out as
+copies, so callers may modify what they get. The cache is cleared
+whenever the model/data fingerprint it is validated against changes.
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from util.helpers import getPlaylistIDs, playlistName
+
+
+def playlistKey(playlist):
+    """
+    Canonical hash of a playlist's track set, Playlist IDs and name,
+    independent of row order and repeated tracks
+    """
+    uris = np.unique(np.asarray(playlist["Track URI"], dtype=str))
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\n".join(uris).encode("utf-8"))
+    digest.update(getPlaylistIDs(playlist).tobytes())
+    name = playlistName(playlist)
+    if name is not None:
+        digest.update(b"\0" + str(name).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def entryKey(name, key, numPredictions, prefixLimit):
+    # Counts up to the prefix limit share one entry, larger ones get their own
+    return (name, key) if numPredictions <= prefixLimit else (name, key, numPredictions)
+
+
+def copyPredictions(predictions):
+    # Slices of a numpy array are views
+    return predictions.copy() if isinstance(predictions, np.ndarray) else list(predictions)
+
+
+class RecommendationCache:
+    """
+    Args:
+        maxEntries (int): number of recommendation lists kept before the least
+            recently used one is evicted
+
+    Attributes:
+        hits, misses, evictions, invalidations (int): counters since creation
+    """
+
+    def __init__(self, maxEntries=1024):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def validate(self, fingerprint):
+        """
+        Drop every entry if the model/data fingerprint changed since the last call
+        """
+        if fingerprint != self.fingerprint:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.fingerprint = fingerprint
+
+    def get(self, name, key, numPredictions, prefixLimit=0):
+        """
+        The first numPredictions cached predictions, or None on a miss
+        """
+        slot = entryKey(name, key, numPredictions, prefixLimit)
+        entry = self.entries.get(slot)
+        if entry is not None:
+            predictions, requested = entry
+            if requested >= numPredictions or len(predictions) < requested:
+                self.entries.move_to_end(slot)
+                self.hits += 1
+                return copyPredictions(predictions[:numPredictions])
+        self.misses += 1
+        return None
+
+    def put(self, name, key, numPredictions, predictions, prefixLimit=0):
+        """
+        Cache the predictions returned for numPredictions, keeping the longer
+        list if one is already cached. An empty list is not cached.
+        """
+        if len(predictions) == 0:
+            return
+        slot = entryKey(name, key, numPredictions, prefixLimit)
+        entry = self.entries.get(slot)
+        if entry is None or entry[1] < numPredictions:
+            self.entries[slot] = (copyPredictions(predictions), numPredictions)
+        self.entries.move_to_end(slot)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {"entries": len(self.entries), "maxEntries": self.maxEntries, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions, "invalidations": self.invalidations}
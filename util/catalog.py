@@ -0,0 +1,233 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from util.segments import SegmentedColumn
+
+
+def asColumn(values):
+    """
+    Keep lazily decoded columns (anything with toArray, e.g. a store
+    StringColumn) as they are and turn everything else into object arrays
+    """
+    if hasattr(values, "toArray"):
+        return values
+    return np.asarray(values, dtype=object)
+
+
+def encodedStrings(values, lo, hi):
+    """
+    (byte lengths, utf-8 bytes) of values[lo:hi], read straight from the
+    buffers of a store StringColumn
+    """
+    if hasattr(values, "offsets"):
+        offsets = np.asarray(values.offsets[lo:hi + 1], dtype=np.int64)
+        return np.diff(offsets), np.ascontiguousarray(values.data[offsets[0]:offsets[-1]]).tobytes()
+    encoded = [("" if v is None or v != v else str(v)).encode("utf-8") for v in values[lo:hi]]
+    return np.array([len(b) for b in encoded], dtype=np.int64), b"".join(encoded)
+
+
+def uriFingerprint(uris, numTracks=None, chunkSize=1 << 20):
+    """
+    Content hash of the first numTracks values of a URI column (all of them
+    by default). Object arrays, store StringColumns and SegmentedColumns
+    holding the same URIs hash the same, so an artifact aligned with track
+    ids can record which catalog it was built for.
+    """
+    numTracks = len(uris) if numTracks is None else numTracks
+    segments = [uris.segment(i) for i in range(len(uris.deltas) + 1)] if isinstance(uris, SegmentedColumn) else [uris]
+    lengths, data = hashlib.blake2b(digest_size=16), hashlib.blake2b(digest_size=16)
+    for segment in segments:
+        n = min(numTracks, len(segment))
+        for lo in range(0, n, chunkSize):
+            segmentLengths, segmentBytes = encodedStrings(segment, lo, min(lo + chunkSize, n))
+            lengths.update(segmentLengths.tobytes())
+            data.update(segmentBytes)
+        numTracks -= n
+        if numTracks <= 0:
+            break
+    return hashlib.blake2b(lengths.digest() + data.digest(), digest_size=16).hexdigest()
+
+
+class TrackCatalog:
+    """
+    Deduplicated track catalog shared by the models and helpers.
+
+    Each unique Track URI gets an integer track id (its position in the
+    catalog). URI lookups go through a hash index, and per-track metadata
+    is held as column arrays so results can be decorated in bulk.
+
+    Args:
+        uris (array-like): unique Track URIs
+        names (array-like): Track Name per URI
+        artists (array-like): Artist Name per URI
+        sparseIds (array-like): playlist matrix column per URI, defaults to the track id
+        numColumns (int): playlist matrix width, defaults to max(sparseIds) + 1
+
+    Attributes:
+        uris, names, artists (ndarray): metadata columns indexed by track id
+        sparseIds (ndarray int64): playlist matrix column for each track id
+        numColumns (int): number of playlist matrix columns the catalog spans
+
+    Tracks added with append() go into segments with their own small
+    index until compact() merges everything into a new catalog.
+    """
+
+    def __init__(self, uris, names, artists, sparseIds=None, numColumns=None):
+        self.uris = asColumn(uris)
+        self.names = asColumn(names)
+        self.artists = asColumn(artists)
+        if sparseIds is None:
+            sparseIds = np.arange(len(self.uris))
+        self.sparseIds = np.asarray(sparseIds, dtype=np.int64)
+        if numColumns is None:
+            numColumns = int(self.sparseIds.max()) + 1 if len(self.sparseIds) else 0
+        self.numColumns = numColumns
+        self._index = None
+        self._columnIds = None
+        # (first track id, first matrix column, URI index) per appended segment
+        self._segments = []
+
+    @property
+    def index(self):
+        """
+        Hash index from URI to track id, built on first lookup
+        """
+        if self._index is None:
+            uris = self.uris.base if isinstance(self.uris, SegmentedColumn) else self.uris
+            uris = uris.toArray() if hasattr(uris, "toArray") else uris
+            index = pd.Index(uris)
+            if not index.is_unique:
+                raise ValueError("TrackCatalog URIs must be unique")
+            self._index = index
+        return self._index
+
+    def columnIds(self, columns):
+        """
+        Track ids for playlist matrix columns, -1 for unused columns
+        """
+        if self._columnIds is None:
+            sparseIds = self.sparseIds.base if isinstance(self.sparseIds, SegmentedColumn) else self.sparseIds
+            columnIds = np.full(self._segments[0][1] if self._segments else self.numColumns, -1, dtype=np.int64)
+            columnIds[sparseIds] = np.arange(len(sparseIds))
+            self._columnIds = columnIds
+        columns = np.asarray(columns)
+        inRange = columns < len(self._columnIds)
+        ids = np.where(inRange, self._columnIds[np.where(inRange, columns, 0)], -1)
+        # Appended tracks sit on consecutive columns in track id order
+        for firstID, firstColumn, index in self._segments:
+            inSegment = (columns >= firstColumn) & (columns < firstColumn + len(index))
+            ids[inSegment] = firstID + columns[inSegment] - firstColumn
+        return ids
+
+    def append(self, uris, names, artists):
+        """
+        Add the URIs that are not in the catalog yet as a new segment, each
+        on a new playlist matrix column after the last one.
+        Returns the track ids of all given URIs.
+        """
+        uris = np.asarray(uris, dtype=object)
+        new = np.flatnonzero(self.toIds(uris) < 0)
+        _, first = np.unique(uris[new], return_index=True)
+        new = new[np.sort(first)]
+        if len(new):
+            firstID, firstColumn = len(self), self.numColumns
+            columns = {
+                "uris": uris[new],
+                "names": np.asarray(names, dtype=object)[new],
+                "artists": np.asarray(artists, dtype=object)[new],
+                "sparseIds": np.arange(firstColumn, firstColumn + len(new), dtype=np.int64),
+            }
+            for name, values in columns.items():
+                column = getattr(self, name)
+                if not isinstance(column, SegmentedColumn):
+                    column = SegmentedColumn(column)
+                    setattr(self, name, column)
+                column.append(values)
+            self.numColumns += len(new)
+            self._segments.append((firstID, firstColumn, pd.Index(uris[new])))
+        return self.toIds(uris)
+
+    def compact(self):
+        """
+        A single-segment catalog with every appended track merged in
+        """
+        if not self._segments:
+            return self
+        return TrackCatalog(self.uris.toArray(), self.names.toArray(), self.artists.toArray(),
+                            self.sparseIds.toArray(), self.numColumns)
+
+    @classmethod
+    def fromSongs(cls, songs):
+        """
+        Build a catalog from a songs DataFrame indexed by Track URI,
+        keeping the first row of every duplicated URI
+        """
+        unique = songs[~songs.index.duplicated()]
+        sparseIds = unique["sparse_id"].values if "sparse_id" in unique else None
+        return cls(unique.index.values,
+                   unique["Track Name"].values,
+                   unique["Artist Name"].values,
+                   sparseIds)
+
+    def __len__(self):
+        return len(self.uris)
+
+    def fingerprint(self, numTracks=None):
+        """
+        Hash of the URIs of the first numTracks track ids, all by default
+        """
+        return uriFingerprint(self.uris, numTracks)
+
+    def __contains__(self, uri):
+        return self.toId(uri) is not None
+
+    def toId(self, uri):
+        """
+        Track id for a URI, or None if the URI is not in the catalog
+        """
+        for firstID, index in [(0, self.index)] + [(firstID, index) for firstID, _, index in self._segments]:
+            try:
+                return firstID + index.get_loc(uri)
+            except KeyError:
+                pass
+        return None
+
+    def toIds(self, uris):
+        """
+        Vectorized toId, with -1 for URIs not in the catalog
+        """
+        uris = pd.Index(np.asarray(uris, dtype=object))
+        ids = self.index.get_indexer(uris)
+        for firstID, _, index in self._segments:
+            missing = np.flatnonzero(ids < 0)
+            if not len(missing):
+                break
+            found = index.get_indexer(uris[missing])
+            ids[missing[found >= 0]] = firstID + found[found >= 0]
+        return ids
+
+    def toUri(self, trackID):
+        return self.uris[trackID]
+
+    def trackAndArtist(self, uri):
+        trackID = self.toId(uri)
+        if trackID is None:
+            return None
+        return (self.names[trackID], self.artists[trackID])
+
+    def decorate(self, ids, scores=None):
+        """
+        Result metadata for an array of track ids as a DataFrame,
+        optionally with a Recommendation Score column
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        result = pd.DataFrame({
+            "Track URI": self.uris[ids],
+            "Track Name": self.names[ids],
+            "Artist Name": self.artists[ids],
+        })
+        if scores is not None:
+            result["Recommendation Score"] = np.asarray(scores)
+        return result
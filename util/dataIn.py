@@ -1,48 +1,55 @@
-import pickle
 import pandas as pd
 import numpy as np
-from tqdm import tqdm
-from scipy.sparse import dok_matrix
+from scipy.sparse import coo_matrix
 import os
 
+from util.embeddings import writeSongEmbeddings
+from util.helpers import pickleMatrix
+
 
 def parseTrackURI(uri):
     return uri.split(":")[2]
 
 
+def parseTrackURIs(uris):
+    """
+    Vectorized parseTrackURI over a Series of spotify:track:<id> URIs
+    """
+    return uris.str.split(":", n=2).str[2]
+
+
 def processPlaylistForClustering(playlists, tracks):
     """
     Create sparse matrix mapping playlists to track
     lists that are consumable by most clustering algos
-    """
-
-    # List of all track IDs in db
-    trackIDs = list(tracks["Track URI"])
 
-    # Map track id to matrix index
-    IDtoIDX = {k: v for k, v in zip(trackIDs, range(len(trackIDs)))}
+    Rows are indexed by Playlist ID and columns by the IDtoIDX track index.
+    Ids are factorized in bulk and the CSR is built straight from
+    coordinate arrays.
+    """
 
-    playlistIDs = list(playlists["Playlist ID"])
+    # Unique track IDs in db, in first-seen order, map to matrix columns
+    trackIDs = pd.unique(tracks["Track URI"])
+    IDtoIDX = dict(zip(trackIDs, range(len(trackIDs))))
 
     print("Create sparse matrix mapping playlists to tracks")
-    playlistSongSparse = dok_matrix((len(playlistIDs), len(trackIDs)), dtype=np.float32)
+    playlistIDX = playlists["Playlist ID"].to_numpy(dtype=np.int64)
+    trackIDX = pd.Index(trackIDs).get_indexer(playlists["Track URI"])
 
-    for i in tqdm(range(len(playlistIDs))):
-        # Get playlist and track ids from DF
-        playlistID = playlistIDs[i]
-        trackID = playlists.loc[playlistID]["Track URI"]
-        playlistIDX = playlistID
+    # Drop tracks that are not in the track table
+    found = trackIDX >= 0
+    playlistIDX, trackIDX = playlistIDX[found], trackIDX[found]
 
-        # Get matrix index for track id
-        trackIDX = [IDtoIDX.get(i) for i in trackID]
+    # One row per Playlist ID up to the largest id seen
+    numRows = int(playlistIDX.max()) + 1 if len(playlistIDX) else 0
+    playlistSongSparse = coo_matrix((np.ones(len(playlistIDX), dtype=np.float32), (playlistIDX, trackIDX)),
+                                    shape=(numRows, len(trackIDs))).tocsr()
 
-        # Remove None values from trackIDX
-        trackIDX = [idx for idx in trackIDX if idx is not None]
+    # Set index to 1 if playlist has song, however often it is listed
+    playlistSongSparse.sum_duplicates()
+    playlistSongSparse.data[:] = 1
 
-        # Set index to 1 if playlist has song
-        playlistSongSparse[playlistIDX, trackIDX] = 1
-
-    return playlistSongSparse.tocsr(), IDtoIDX
+    return playlistSongSparse, IDtoIDX
 
 
 def createDFs(path, idx, num_files):
@@ -67,15 +74,14 @@ def createDFs(path, idx, num_files):
     # Split id from spotifyURI for brevity
     tracks_df = tracks_df.sample(frac=1).reset_index(drop=True)
     playlist_df = playlist_df.sample(frac=1).reset_index(drop=True)
-    tracks_df["Track URI"] = tracks_df.apply(lambda row: parseTrackURI(row["Track URI"]), axis=1)
-    playlist_df["Track URI"] = playlist_df.apply(lambda row: parseTrackURI(row["Track URI"]), axis=1)
+    tracks_df["Track URI"] = parseTrackURIs(tracks_df["Track URI"])
+    playlist_df["Track URI"] = parseTrackURIs(playlist_df["Track URI"])
 
     playlistClusteredDF, IDtoIDXMap = processPlaylistForClustering(playlists=playlist_df,
                                                                    tracks=tracks_df)
 
     # Add sparseID for easy coercision to sparse matrix for training data
-    tracks_df["sparse_id"] = 0
-    tracks_df["sparse_id"] = tracks_df.apply(lambda row: IDtoIDXMap[row["Track URI"]], axis=1)
+    tracks_df["sparse_id"] = tracks_df["Track URI"].map(IDtoIDXMap)
     tracks_df = tracks_df.set_index("Track URI")
 
     # Check for duplicate indices
@@ -116,10 +122,13 @@ def createDFs(path, idx, num_files):
     try:
         playlistSparse_path = os.path.join(current_directory, "data", "playlistSparse.pkl")
 
-        with open(playlistSparse_path, "wb") as f:
-            pickle.dump(playlistClusteredDF, f)
+        pickleMatrix(playlistSparse_path, playlistClusteredDF)
         print(f"File {playlistSparse_path} saved successfully.")
     except Exception as e:
         print(f"Failed to save file at {playlistSparse_path}: {e}")
 
+    # Parse lyrics embeddings once into the binary store the models load
+    print(f"Writing lyrics embeddings")
+    writeSongEmbeddings(os.path.join(current_directory, "data"), tracks_df)
+
 
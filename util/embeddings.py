@@ -0,0 +1,121 @@
+"""
+Binary lyrics-embedding store.
+
+Embeddings are kept as one contiguous, L2-normalized float32 matrix whose
+rows line up with TrackCatalog track ids, plus a packed validity bitmap
+for tracks without lyrics. Both are .npy files opened with mmap, so cosine
+similarity between stored rows is a plain dot product and no text is parsed
+at model start. A small JSON manifest records the shape and the
+fingerprint of the catalog URIs the rows were aligned with, so embeddings
+written for another catalog are not silently paired with the wrong tracks.
+"""
+import json
+import os
+
+import numpy as np
+
+from util.catalog import TrackCatalog
+from util.similarity import normalizeRows
+
+MATRIX_FILE = "embeddings.npy"
+VALID_FILE = "embeddings.valid.npy"
+MANIFEST_FILE = "embeddings.json"
+
+
+def parseEmbeddings(values, dim=None):
+    """
+    Parse bracketed embedding strings (or lists/arrays) into a float32
+    matrix and a validity mask. Rows that are missing or malformed are left
+    at zero and marked invalid.
+    """
+    values = list(values)
+    parsed = []
+    for value in values:
+        if isinstance(value, str):
+            try:
+                row = np.fromstring(value.strip("[] \n\t"), sep=" ")
+            except ValueError:
+                row = None
+        elif isinstance(value, (list, np.ndarray)):
+            row = np.asarray(value, dtype=np.float64)
+        else:
+            row = None
+        parsed.append(row if row is not None and row.size else None)
+
+    if dim is None:
+        dim = next((row.size for row in parsed if row is not None), 0)
+    matrix = np.zeros((len(values), dim), dtype=np.float32)
+    valid = np.zeros(len(values), dtype=bool)
+    for i, row in enumerate(parsed):
+        if row is not None and row.size == dim:
+            matrix[i] = row
+            valid[i] = True
+    return matrix, valid
+
+
+def writeEmbeddings(directory, matrix, valid, catalogFingerprint=None):
+    """
+    L2-normalize and write an embedding matrix and its validity bitmap,
+    with the fingerprint of the catalog URIs its rows are aligned with
+    (TrackCatalog.fingerprint(len(matrix)))
+    """
+    os.makedirs(directory, exist_ok=True)
+    matrix = normalizeRows(matrix)
+    matrix[~valid] = 0
+    np.save(os.path.join(directory, MATRIX_FILE), matrix)
+    np.save(os.path.join(directory, VALID_FILE), np.packbits(valid))
+    with open(os.path.join(directory, MANIFEST_FILE), "w") as f:
+        json.dump({"rows": len(matrix), "dim": matrix.shape[1], "catalogFingerprint": catalogFingerprint}, f)
+    return matrix.shape
+
+
+def writeSongEmbeddings(directory, songs, catalog=None):
+    """
+    Write the lyrics_embedding column of a songs DataFrame aligned with
+    the catalog built from it
+    """
+    catalog = catalog if catalog is not None else TrackCatalog.fromSongs(songs)
+    unique = songs[~songs.index.duplicated()]
+    embeddings = unique["lyrics_embedding"].reindex(catalog.index)
+    return writeEmbeddings(directory, *parseEmbeddings(embeddings.values), catalog.fingerprint())
+
+
+def hasEmbeddings(directory):
+    return os.path.exists(os.path.join(directory, MATRIX_FILE))
+
+
+def embeddingsFingerprint(directory):
+    """
+    Catalog fingerprint the stored embeddings were written for, None when
+    they were written without one
+    """
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get("catalogFingerprint")
+
+
+def matchesCatalog(directory, matrix, catalog, catalogFingerprint=None):
+    """
+    Whether stored embeddings line up with the catalog: no more rows than
+    tracks (tracks appended later have none) and, when a fingerprint was
+    recorded, written for the same first URIs. catalogFingerprint saves
+    hashing the catalog when it is already known.
+    """
+    if len(matrix) > len(catalog):
+        return False
+    stored = embeddingsFingerprint(directory)
+    if stored is None:
+        print("Stored embeddings have no catalog fingerprint, only their length was checked")
+        return True
+    return stored == (catalogFingerprint or catalog.fingerprint(len(matrix)))
+
+
+def loadEmbeddings(directory):
+    """
+    Memory-map an embedding matrix and unpack its validity bitmap
+    """
+    matrix = np.load(os.path.join(directory, MATRIX_FILE), mmap_mode="r")
+    valid = np.unpackbits(np.load(os.path.join(directory, VALID_FILE)), count=len(matrix)).astype(bool)
+    return matrix, valid
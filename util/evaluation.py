@@ -0,0 +1,192 @@
+"""
+Held-out evaluation of a classifier for every cutoff k, from as few ranking
+passes as the classifier allows.
+
+A held-out set is drawn once with a fixed seed (helpers.obscurePlaylist on
+randomly chosen playlists) and pickled, so every classifier and every run is
+scored on the same obscured tracks. When a classifier's top k is the prefix
+of its longer lists (its prefixLimit, see helpers.prefixLimit), each held-out
+playlist is ranked once at the largest such k and precision, recall,
+R-precision, NDCG and clicks for all of them are prefix sums over the
+resulting hit matrix. Every larger k is ranked on its own, so classifiers
+whose top k is not a prefix (Base, Hybrid past its candidate pool) are
+scored on the lists predict(playlist, k) returns. Ranking is split into
+chunks across a process pool, with the classifier inherited by the forked
+workers.
+
+    holdout = buildHoldout(playlists, 100, 0.25, seed=0, path="data/holdout.pkl")
+    results = evaluate(classifier, holdout, maxK=100, workers=4)
+    results = evaluate(baseClassifier, holdout, ks=[10, 50, 100])
+"""
+import os
+import random
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from util.helpers import obscurePlaylist, prefixLimit
+
+METRICS = ["precision", "recall", "r_precision", "ndcg", "clicks"]
+
+# Classifier shared with pool workers, set by the pool initializer
+_classifier = None
+
+
+def buildHoldout(playlists, numPlaylists, percentToObscure=0.25, seed=0, path=None):
+    """
+    Seeded held-out set: the rows of numPlaylists random playlists with an
+    "Obscured" column marking the tracks hidden from the classifier.
+    Playlists too short to obscure a single track are never drawn.
+    Loaded from path when it exists, written there otherwise.
+    """
+    if path is not None and os.path.exists(path):
+        return pd.read_pickle(path)
+
+    rng = random.Random(seed)
+    lengths = playlists.groupby("Playlist ID").size()
+    candidates = sorted(lengths.index[(lengths * percentToObscure).astype(int) >= 1].tolist())
+    chosen = rng.sample(candidates, min(numPlaylists, len(candidates)))
+
+    groups = playlists.groupby("Playlist ID")
+    holdout = []
+    for playlistID in chosen:
+        playlist = groups.get_group(playlistID).reset_index(drop=True)
+        _, obscured = obscurePlaylist(playlist, percentToObscure, rng)
+        holdout.append(playlist.assign(Obscured=playlist.index.isin(obscured.index)))
+    holdout = pd.concat(holdout, ignore_index=True) if holdout else \
+        playlists.iloc[:0].assign(Obscured=pd.Series(dtype=bool))
+
+    if path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        holdout.to_pickle(path)
+    return holdout
+
+
+def splitHoldout(holdout):
+    """
+    (kept playlist rows, obscured Track URIs) per held-out playlist, in the
+    order the playlists were drawn
+    """
+    split = []
+    for _, playlist in holdout.groupby("Playlist ID", sort=False):
+        obscured = playlist["Obscured"].values
+        split.append((playlist[~obscured].drop(columns="Obscured"),
+                      set(playlist["Track URI"].values[obscured])))
+    return split
+
+
+def rankPlaylists(classifier, playlists, maxK):
+    """
+    Top maxK Track URIs per playlist, through predictBatch when the
+    classifier has one
+    """
+    if hasattr(classifier, "predictBatch"):
+        return classifier.predictBatch(playlists, maxK)
+    return [classifier.predict(playlist, maxK) for playlist in playlists]
+
+
+def hitMatrix(ranked, obscured, maxK):
+    """
+    Boolean (playlists x maxK) matrix, True where the track at that rank
+    was obscured. Rankings shorter than maxK are padded with misses.
+    """
+    hits = np.zeros((len(ranked), maxK), dtype=bool)
+    for i, (predictions, hidden) in enumerate(zip(ranked, obscured)):
+        predictions = list(predictions)[:maxK]
+        hits[i, :len(predictions)] = [uri in hidden for uri in predictions]
+    return hits
+
+
+def rankingPasses(classifier, ks):
+    """
+    (count, cutoffs) of every ranking pass needed to score the cutoffs ks:
+    cutoffs up to the classifier's prefix limit share one pass at the
+    largest of them, every larger cutoff gets a pass of its own
+    """
+    limit = prefixLimit(classifier)
+    shared = [k for k in ks if k <= limit]
+    return ([(max(shared), shared)] if shared else []) + [(k, [k]) for k in ks if k > limit]
+
+
+def _initWorker(classifier):
+    global _classifier
+    _classifier = classifier
+
+
+def _rankChunk(args):
+    """
+    Worker: rank a chunk of held-out playlists and return its hit matrix
+    """
+    chunk, maxK = args
+    playlists, obscured = zip(*chunk) if chunk else ((), ())
+    return hitMatrix(rankPlaylists(_classifier, list(playlists), maxK), obscured, maxK)
+
+
+def metricsAtK(hits, numObscured):
+    """
+    Mean metric curves for every k = 1..maxK from a hit matrix and the
+    number of obscured tracks per playlist, as a DataFrame indexed by k.
+    Clicks follow the RecSys Challenge 2018 definition: pages of 10 before
+    the first hit, or k // 10 + 1 when nothing in the top k was a hit.
+    """
+    numPlaylists, maxK = hits.shape
+    ks = np.arange(1, maxK + 1)
+    numObscured = np.asarray(numObscured, dtype=np.int64)
+    cumHits = np.cumsum(hits, axis=1)
+
+    precision = cumHits / ks
+    recall = cumHits / numObscured[:, None]
+
+    # R-precision: hits within the first min(k, R) ranks, over R
+    cutoff = np.minimum(ks[None, :], numObscured[:, None]) - 1
+    rPrecision = np.take_along_axis(cumHits, cutoff, axis=1) / numObscured[:, None]
+
+    discounts = 1 / np.log2(ks + 1)
+    dcg = np.cumsum(hits * discounts, axis=1)
+    idcg = np.cumsum(discounts)[cutoff]
+    ndcg = dcg / idcg
+
+    firstHit = np.where(hits.any(axis=1), hits.argmax(axis=1), maxK)
+    clicks = np.where(firstHit[:, None] < ks[None, :], firstHit[:, None] // 10, ks[None, :] // 10 + 1)
+
+    curves = [precision, recall, rPrecision, ndcg, clicks]
+    return pd.DataFrame({name: curve.mean(axis=0) if numPlaylists else np.nan
+                         for name, curve in zip(METRICS, curves)},
+                        index=pd.Index(ks, name="k"))
+
+
+def evaluate(classifier, holdout, maxK=100, workers=None, chunkSize=64, ks=None):
+    """
+    Rank every held-out playlist in the passes rankingPasses needs, in
+    chunks over a process pool when workers > 1, and return metricsAtK for
+    the cutoffs ks, all k up to maxK by default. Classifiers without a
+    prefix limit take one pass per cutoff, so a few ks keep them cheap.
+    """
+    ks = range(1, maxK + 1) if ks is None else ks
+    ks = sorted(set(int(k) for k in ks))
+    if ks and ks[0] < 1:
+        raise ValueError(f"Cutoffs must be at least 1, got {ks[0]}")
+    split = splitHoldout(holdout)
+    passes = rankingPasses(classifier, ks)
+    starts = range(0, len(split), chunkSize)
+    chunks = [(split[lo:lo + chunkSize], count) for count, _ in passes for lo in starts]
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(chunks))
+
+    if workers > 1:
+        with Pool(workers, initializer=_initWorker, initargs=(classifier,)) as pool:
+            parts = pool.map(_rankChunk, chunks)
+    else:
+        _initWorker(classifier)
+        parts = [_rankChunk(chunk) for chunk in chunks]
+
+    numObscured = [len(obscured) for _, obscured in split]
+    curves = []
+    for i, (count, cutoffs) in enumerate(passes):
+        passParts = parts[i * len(starts):(i + 1) * len(starts)]
+        hits = np.concatenate(passParts) if passParts else np.zeros((0, count), dtype=bool)
+        curves.append(metricsAtK(hits, numObscured).loc[cutoffs])
+    if not curves:
+        return pd.DataFrame(columns=METRICS, index=pd.Index([], name="k"), dtype=float)
+    return pd.concat(curves).sort_index()
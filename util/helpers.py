@@ -1,59 +1,141 @@
+import hashlib
+import json
+import os
+import pickle
 import random
-from scipy.sparse import dok_matrix
+import re
 
+import numpy as np
+from scipy.sparse import csr_matrix
 
-def playlistToSparseMatrixEntry(playlist, songs):
+
+def playlistToSparseMatrixEntry(playlist, catalog, numColumns=None):
     """
     Converts a playlist with a list of songs into a sparse matrix with just one row.
+    Tracks missing from the catalog are skipped.
     """
     if 'Track URI' not in playlist:
         print("Track_id column missing in playlist.")
         return None
+    return playlistsToSparseMatrix([playlist], catalog, numColumns)
 
-    # Create a sparse matrix with dimensions 1 x (max index of sparse_id + 1)
-    max_sparse_id = songs['sparse_id'].max()
-    playlistMtrx = dok_matrix((1, max_sparse_id + 1), dtype=int)
 
-    for track_id in playlist['Track URI']:
-        if track_id in songs.index:
-            sparse_id = songs.at[track_id, 'sparse_id']
-            playlistMtrx[0, sparse_id] = 1
-        else:
-            print(f"Track ID {track_id} not found in songs DataFrame.")
+def playlistsToSparseMatrix(playlists, catalog, numColumns=None):
+    """
+    Converts a list of playlists into one sparse query matrix, one row per playlist,
+    with a single catalog lookup for all of their tracks.
+    """
+    # Create a sparse matrix with dimensions len(playlists) x (max index of sparse_id + 1)
+    if numColumns is None:
+        numColumns = catalog.numColumns
+    lengths = [len(playlist['Track URI']) for playlist in playlists]
+    uris = np.concatenate([np.asarray(playlist['Track URI'], dtype=object) for playlist in playlists]) \
+        if playlists else np.empty(0, dtype=object)
+    rows = np.repeat(np.arange(len(playlists)), lengths)
+    ids = catalog.toIds(uris)
+    rows, columns = rows[ids >= 0], catalog.sparseIds[ids[ids >= 0]]
+    matrix = csr_matrix((np.ones(len(columns), dtype=int), (rows, columns)),
+                        shape=(len(playlists), numColumns))
+    # A track listed twice still counts once
+    matrix.data[:] = 1
+    return matrix
+
+
+def matrixFingerprint(matrix, chunkSize=1 << 20):
+    """
+    Content hash of a sparse matrix's shape and CSR arrays, to tell whether
+    an artifact was built from the same data. The arrays are hashed
+    chunkSize items at a time, so memory-mapped matrices are not copied whole.
+    """
+    matrix = csr_matrix(matrix)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.asarray(matrix.shape, dtype=np.int64).tobytes())
+    # Fixed dtypes, so the pickled and memory-mapped copies of a matrix agree
+    for array, dtype in ((matrix.indptr, np.int64), (matrix.indices, np.int64), (matrix.data, np.float32)):
+        for lo in range(0, len(array), chunkSize):
+            digest.update(np.ascontiguousarray(array[lo:lo + chunkSize], dtype=dtype).tobytes())
+    return digest.hexdigest()
 
-    return playlistMtrx.tocsr()
 
+def pickleMatrix(path, matrix):
+    """
+    Pickle a playlist matrix with its matrixFingerprint in a sidecar file,
+    so loading it again does not hash the whole matrix
+    """
+    with open(path, "wb") as f:
+        pickle.dump(matrix, f)
+    stat = os.stat(path)
+    with open(path + ".fingerprint", "w") as f:
+        json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "fingerprint": matrixFingerprint(matrix)}, f)
 
-def getPlaylistTracks(playlist, songs):
-    tracks = []
-    songs['Track URI'] = songs.index
 
-    for x in playlist:
-        try:
-            track = songs.loc[x['Track URI']]
-            tracks.append(track)
-        except KeyError:
-            print(f"Track ID {x} not found in the songs DataFrame.")
-    return tracks
+def pickledFingerprint(path):
+    """
+    matrixFingerprint recorded by pickleMatrix for the matrix pickled at
+    path, None when there is no sidecar or the pickle was rewritten since
+    """
+    if not os.path.exists(path + ".fingerprint"):
+        return None
+    with open(path + ".fingerprint") as f:
+        sidecar = json.load(f)
+    stat = os.stat(path)
+    if sidecar.get("size") != stat.st_size or sidecar.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+    return sidecar.get("fingerprint")
 
 
-def getTrackandArtist(trackURI, songs):
-    try:
-        song = songs.loc[str(trackURI)]
-        return (song["Track Name"], song["Artist Name"])
-    except KeyError:
-        print(f"Track URI {trackURI} not found in songs DataFrame")
-        return None
+def prefixLimit(classifier):
+    """
+    Largest prediction count up to which a classifier's list for N
+    predictions is the first N of its list for any larger count up to the
+    limit, so shorter lists can be cut from a longer one; 0 when they cannot
+    """
+    return getattr(classifier, "prefixLimit", 0)
+
+
+def getPlaylistIDs(playlist):
+    """
+    Playlist IDs a playlist's rows belong to, empty for playlists from outside the data
+    """
+    if 'Playlist ID' not in playlist:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.asarray(playlist['Playlist ID'], dtype=np.int64))
+
+
+def playlistName(playlist):
+    """
+    A playlist's name, None for playlists without one. Playlists without
+    any rows can carry it in DataFrame.attrs['Playlist Name'].
+    """
+    if isinstance(playlist, dict):
+        return playlist.get('Playlist Name')
+    if 'Playlist Name' in playlist and len(playlist):
+        return playlist['Playlist Name'].iloc[0]
+    return playlist.attrs.get('Playlist Name')
+
+
+def nameTokens(name):
+    """
+    Normalized playlist-name tokens: lowercase word runs, deduplicated in order
+    """
+    if not isinstance(name, str):
+        return []
+    return list(dict.fromkeys(re.findall(r"\w+", name.lower())))
+
+
+def getTrackandArtist(trackURI, catalog):
+    return catalog.trackAndArtist(str(trackURI))
 
 
-def obscurePlaylist(playlist, percentToObscure):
+def obscurePlaylist(playlist, percentToObscure, rng=random):
     """
-    Obscure a portion of a playlist's songs for testing
+    Obscure a portion of a playlist's songs for testing,
+    pass a seeded random.Random as rng for a reproducible split
     """
     total_tracks = len(playlist['Track URI'])
     k = int(total_tracks * percentToObscure)  # Number of tracks to obscure
 
-    indices = random.sample(playlist.index.tolist(), k)  # Randomly pick indices to obscure
+    indices = rng.sample(playlist.index.tolist(), k)  # Randomly pick indices to obscure
 
 
     # Now create a list of tracks that are not obscured
@@ -0,0 +1,251 @@
+"""
+Streaming ingestion of raw MPD slice files (mpd.slice.<start>-<end>.json).
+
+Each slice is parsed by a worker process and written to its own part file
+as soon as it is done, so memory is bounded by a slice per worker however
+many slices are requested. Finished parts are skipped on the next run,
+which makes an interrupted ingestion resumable. finalizeStore() then
+streams the parts one at a time into a memory-mapped data store
+(util.store), so merging is bounded by a part as well. finalize() instead
+merges the parts into the playlists/tracks/playlistSparse pickles read by
+SpotifyExplorer.readData, which needs all of them in memory at once.
+
+    python -m util.ingest path/to/mpd/data --num-files 10 --workers 4 --store data/store
+"""
+import argparse
+import json
+import os
+import pickle
+import re
+import shutil
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+
+from util.dataIn import parseTrackURIs, processPlaylistForClustering
+from util.embeddings import parseEmbeddings, writeEmbeddings, writeSongEmbeddings
+from util.catalog import uriFingerprint
+from util.helpers import pickleMatrix
+from util.store import ColumnWriter, StringColumnWriter, loadStrings, replaceStore, saveArray, writeManifest
+
+SLICE_PATTERN = re.compile(r"mpd\.slice\.(\d+)-(\d+)\.json$")
+
+
+def listSlices(mpdDir, numFiles=None):
+    """
+    MPD slice paths in mpdDir ordered by their first playlist id
+    """
+    slices = []
+    for fileName in os.listdir(mpdDir):
+        match = SLICE_PATTERN.search(fileName)
+        if match:
+            slices.append((int(match.group(1)), os.path.join(mpdDir, fileName)))
+    slices = [path for _, path in sorted(slices)]
+    return slices if numFiles is None else slices[:numFiles]
+
+
+def readSlice(path):
+    """
+    Parse one MPD slice into playlist and track DataFrames in the
+    format createDFs produces, one row per (playlist, track) pair
+    """
+    with open(path) as f:
+        playlists = json.load(f)["playlists"]
+
+    lengths = [len(playlist["tracks"]) for playlist in playlists]
+    tracks = [track for playlist in playlists for track in playlist["tracks"]]
+    playlistIDs = np.repeat([playlist["pid"] for playlist in playlists], lengths)
+    trackURIs = parseTrackURIs(pd.Series([track["track_uri"] for track in tracks], dtype=object))
+
+    playlist_df = pd.DataFrame({
+        "Playlist Name": np.repeat(np.array([playlist["name"] for playlist in playlists], dtype=object), lengths),
+        "Playlist ID": playlistIDs,
+        "Track URI": trackURIs,
+    })
+    tracks_df = pd.DataFrame({
+        "Track Name": [track["track_name"] for track in tracks],
+        "Track URI": trackURIs,
+        "Artist Name": [track["artist_name"] for track in tracks],
+        "Playlist ID": playlistIDs,
+        "lyrics_embedding": np.nan,
+    })
+    return playlist_df, tracks_df
+
+
+def partPath(outDir, slicePath):
+    return os.path.join(outDir, "parts", os.path.basename(slicePath).replace(".json", ".pkl"))
+
+
+def ingestSlice(args):
+    """
+    Worker: parse a slice and write its part file atomically
+    """
+    slicePath, outDir = args
+    playlist_df, tracks_df = readSlice(slicePath)
+    path = partPath(outDir, slicePath)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump((playlist_df, tracks_df), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+    return slicePath, len(playlist_df)
+
+
+def ingestSlices(mpdDir, outDir, numFiles=None, workers=None):
+    """
+    Parse up to numFiles slices from mpdDir into part files under outDir,
+    skipping slices whose part already exists.
+    Returns the paths of all parts covering the requested slices.
+    """
+    os.makedirs(os.path.join(outDir, "parts"), exist_ok=True)
+    slices = listSlices(mpdDir, numFiles)
+    todo = [path for path in slices if not os.path.exists(partPath(outDir, path))]
+    print(f"Ingesting {len(todo)} of {len(slices)} MPD slices ({len(slices) - len(todo)} already done)")
+
+    if todo:
+        with Pool(workers) as pool:
+            for slicePath, numRows in pool.imap_unordered(ingestSlice, [(path, outDir) for path in todo]):
+                print(f"{os.path.basename(slicePath)}: {numRows} playlist tracks")
+    return [partPath(outDir, path) for path in slices]
+
+
+def loadPart(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def finalize(parts, dataDir):
+    """
+    Merge part files into playlists.pkl, tracks.pkl and playlistSparse.pkl,
+    plus the binary embedding matrix aligned with the track catalog.
+    Every part is concatenated in memory, so peak memory grows with the
+    number of slices; finalizeStore() merges any number of them.
+    """
+    playlistParts, trackParts = [], []
+    for path in parts:
+        playlist_df, tracks_df = loadPart(path)
+        playlistParts.append(playlist_df)
+        trackParts.append(tracks_df)
+    playlist_df = pd.concat(playlistParts, ignore_index=True)
+    tracks_df = pd.concat(trackParts, ignore_index=True)
+
+    playlistSparse, IDtoIDXMap = processPlaylistForClustering(playlists=playlist_df, tracks=tracks_df)
+    tracks_df["sparse_id"] = tracks_df["Track URI"].map(IDtoIDXMap)
+    tracks_df = tracks_df.set_index("Track URI")
+
+    os.makedirs(dataDir, exist_ok=True)
+    print(f"Pickling {len(playlist_df)} playlists and {len(tracks_df)} tracks")
+    playlist_df.to_pickle(os.path.join(dataDir, "playlists.pkl"))
+    tracks_df.to_pickle(os.path.join(dataDir, "tracks.pkl"))
+    pickleMatrix(os.path.join(dataDir, "playlistSparse.pkl"), playlistSparse)
+    writeSongEmbeddings(dataDir, tracks_df)
+    return playlist_df, tracks_df, playlistSparse
+
+
+def finalizeStore(parts, storeDir):
+    """
+    Stream part files into a data store with the same contents as
+    convertPickles over finalize()'s pickles, holding one part in memory at
+    a time: matrix rows and playlist columns are appended to the store files
+    as each part is read, and only the URI to track id map and the
+    embeddings of the tracks seen so far are kept across parts. Parts must
+    hold increasing, non-overlapping Playlist IDs, as MPD slices do. The
+    store is built next to storeDir and swapped in when complete.
+    Returns the store manifest.
+    """
+    newDir = storeDir.rstrip(os.sep) + ".ingest"
+    shutil.rmtree(newDir, ignore_errors=True)
+    os.makedirs(newDir)
+
+    # Tracks get ids, which are also their matrix columns, in first-seen order
+    trackIDs = {}
+    embeddingParts, dim = [], None
+    trackColumns = {name: StringColumnWriter(newDir, f"tracks.{name}") for name in ("uri", "name", "artist")}
+    indptr = ColumnWriter(newDir, "playlistSparse.indptr", np.int64)
+    indices = ColumnWriter(newDir, "playlistSparse.indices", np.int64)
+    data = ColumnWriter(newDir, "playlistSparse.data", np.float32)
+    playlistIDs = ColumnWriter(newDir, "playlists.playlist_id", np.int64)
+    playlistTracks = ColumnWriter(newDir, "playlists.track_id", np.int32)
+    playlistNames = StringColumnWriter(newDir, "playlists.name")
+    indptr.append([0])
+    numRows = nnz = 0
+
+    for path in parts:
+        playlist_df, tracks_df = loadPart(path)
+        unique = tracks_df[~tracks_df["Track URI"].duplicated()]
+        new = unique[[uri not in trackIDs for uri in unique["Track URI"]]]
+        firstID = len(trackIDs)
+        trackIDs.update(zip(new["Track URI"], range(firstID, firstID + len(new))))
+        trackColumns["uri"].append(new["Track URI"].values)
+        trackColumns["name"].append(new["Track Name"].values)
+        trackColumns["artist"].append(new["Artist Name"].values)
+        if "lyrics_embedding" in new:
+            matrix, valid = parseEmbeddings(new["lyrics_embedding"].values, dim)
+            if valid.any():
+                dim = matrix.shape[1]
+                embeddingParts.append((firstID, matrix, valid))
+
+        pids = playlist_df["Playlist ID"].to_numpy(dtype=np.int64)
+        ids = playlist_df["Track URI"].map(trackIDs).fillna(-1).to_numpy(dtype=np.int64)
+        if len(pids):
+            if pids.min() < numRows:
+                raise ValueError(f"{path} holds Playlist IDs below {numRows}, already written by an earlier part")
+            found = ids >= 0
+            block = coo_matrix((np.ones(found.sum(), dtype=np.float32), (pids[found] - pids.min(), ids[found])),
+                               shape=(int(pids.max() - pids.min()) + 1, len(trackIDs))).tocsr()
+            # A track listed twice still counts once
+            block.sum_duplicates()
+            block.sort_indices()
+            # Empty rows for Playlist IDs missing between the parts
+            indptr.append(np.full(int(pids.min()) - numRows, nnz))
+            indptr.append(block.indptr[1:].astype(np.int64) + nnz)
+            indices.append(block.indices)
+            data.append(np.ones(block.nnz, dtype=np.float32))
+            numRows, nnz = int(pids.max()) + 1, nnz + block.nnz
+        playlistIDs.append(pids)
+        playlistTracks.append(ids)
+        playlistNames.append(playlist_df["Playlist Name"].values)
+        print(f"{os.path.basename(path)}: {len(playlist_df)} playlist tracks, {len(trackIDs)} tracks so far")
+
+    # int32 CSR indices whenever they fit, as scipy builds them
+    indexDtype = np.int32 if max(nnz, len(trackIDs)) < np.iinfo(np.int32).max else np.int64
+    indptr.close(indexDtype)
+    indices.close(indexDtype)
+    for writer in [data, playlistIDs, playlistTracks, playlistNames, *trackColumns.values()]:
+        writer.close()
+    saveArray(newDir, "tracks.sparse_id", np.arange(len(trackIDs), dtype=np.int64))
+    tracksFingerprint = uriFingerprint(loadStrings(newDir, "tracks.uri"))
+
+    embeddings = np.zeros((len(trackIDs), dim or 0), dtype=np.float32)
+    embeddingValid = np.zeros(len(trackIDs), dtype=bool)
+    for firstID, matrix, valid in embeddingParts:
+        embeddings[firstID:firstID + len(matrix)] = matrix
+        embeddingValid[firstID:firstID + len(matrix)] = valid
+    embeddingShape = writeEmbeddings(newDir, embeddings, embeddingValid, tracksFingerprint)
+
+    manifest = writeManifest(newDir, (numRows, len(trackIDs)), nnz, len(trackIDs), len(trackIDs), embeddingShape,
+                             playlistIDs.length, tracksFingerprint)
+    replaceStore(storeDir, newDir)
+    print(f"Wrote {numRows} playlists, {len(trackIDs)} tracks and {nnz} playlist entries to {storeDir}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mpdDir")
+    parser.add_argument("--out", default=os.path.join("data", "ingest"))
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--store", help="stream the parts into a data store here instead of pickling them")
+    parser.add_argument("--num-files", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    parts = ingestSlices(args.mpdDir, args.out, args.num_files, args.workers)
+    if args.store:
+        finalizeStore(parts, args.store)
+    else:
+        finalize(parts, args.data)
+
+
+if __name__ == "__main__":
+    main()
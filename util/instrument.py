@@ -0,0 +1,195 @@
+"""
+Opt-in stage instrumentation.
+
+Named stages record call counts, wall time and, when memory tracing is on,
+the net allocation and peak-memory delta measured with tracemalloc. Stages
+nest: a stage's peak includes the peaks of the stages run inside it.
+Each thread keeps its own stack of open stages, so stages run on executor
+threads nest inside their own thread only (tracemalloc's peak is still
+process-wide).
+Instrumentation is off unless enable() is called or SPOTIFY_INSTRUMENT is
+set (SPOTIFY_INSTRUMENT=memory also traces allocations); while off, stage()
+hands back a shared no-op context and timed() functions cost one flag check.
+
+    instrument.enable(memory=True)
+    explorer.predictNeighbour(playlist, 50)
+    print(instrument.toPrometheus())
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+_enabled = False
+_memory = False
+_stats = {}
+_statsLock = threading.Lock()
+_local = threading.local()
+_noop = contextlib.nullcontext()
+
+
+class StageStats:
+    """
+    Accumulated measurements for one named stage
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.maxSeconds = 0.0
+        self.allocatedBytes = 0
+        self.peakBytes = 0
+
+    def asDict(self):
+        return {"calls": self.calls, "seconds": self.seconds, "maxSeconds": self.maxSeconds,
+                "allocatedBytes": self.allocatedBytes, "peakBytes": self.peakBytes}
+
+
+def _stack():
+    """
+    Open stages of the calling thread, innermost last
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.peak = 0
+
+    def __enter__(self):
+        stack = _stack()
+        if _memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # Hand the peak so far to the enclosing stages before restarting it
+            for outer in stack:
+                outer.peak = max(outer.peak, peak)
+            tracemalloc.reset_peak()
+            self.startBytes = current
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = _stack()
+        stack.pop()
+        if _memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        with _statsLock:
+            stats = _stats.setdefault(self.name, StageStats())
+            stats.calls += 1
+            stats.seconds += elapsed
+            stats.maxSeconds = max(stats.maxSeconds, elapsed)
+            if _memory:
+                stats.allocatedBytes += current - self.startBytes
+                stats.peakBytes = max(stats.peakBytes, self.peak - self.startBytes)
+        return False
+
+
+def enable(memory=False):
+    """
+    Start recording stages, with tracemalloc memory deltas if memory is set
+    """
+    global _enabled, _memory
+    _enabled = True
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global _enabled, _memory
+    _enabled = _memory = False
+
+
+def isEnabled():
+    return _enabled
+
+
+def reset():
+    """
+    Drop everything recorded so far
+    """
+    with _statsLock:
+        _stats.clear()
+
+
+def stage(name):
+    """
+    Context manager measuring the enclosed block as stage name
+    """
+    return _Stage(name) if _enabled else _noop
+
+
+def timed(name):
+    """
+    Decorator measuring every call of a function as stage name
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    Recorded stages as {name: {calls, seconds, maxSeconds, allocatedBytes, peakBytes}}
+    """
+    with _statsLock:
+        return {name: stats.asDict() for name, stats in sorted(_stats.items())}
+
+
+def toJSON(path=None):
+    """
+    Snapshot as a JSON string, also written to path if given
+    """
+    text = json.dumps({"memory": _memory, "stages": snapshot()}, indent=2)
+    if path is not None:
+        with open(path, "w") as f:
+            f.write(text)
+    return text
+
+
+def toPrometheus(prefix="spotify_explorer"):
+    """
+    Snapshot in the Prometheus text exposition format
+    """
+    metrics = [
+        ("stage_calls_total", "counter", "Calls of the stage", "calls"),
+        ("stage_seconds_total", "counter", "Wall time spent in the stage", "seconds"),
+        ("stage_max_seconds", "gauge", "Slowest single call of the stage", "maxSeconds"),
+    ]
+    if _memory:
+        metrics += [
+            ("stage_allocated_bytes", "gauge", "Net bytes left allocated by the stage, summed over calls", "allocatedBytes"),
+            ("stage_peak_bytes", "gauge", "Largest traced memory peak above the stage's start", "peakBytes"),
+        ]
+    stages = snapshot()
+    lines = []
+    for metric, kind, description, key in metrics:
+        lines.append(f"# HELP {prefix}_{metric} {description}")
+        lines.append(f"# TYPE {prefix}_{metric} {kind}")
+        for name, stats in stages.items():
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'{prefix}_{metric}{{stage="{label}"}} {stats[key]}')
+    return "\n".join(lines) + "\n"
+
+
+_setting = os.environ.get("SPOTIFY_INSTRUMENT", "")
+if _setting not in ("", "0"):
+    enable(memory=_setting == "memory")
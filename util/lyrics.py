@@ -0,0 +1,281 @@
+"""
+Lyrics-embedding pipeline, the batch version of text_processing.ipynb.
+
+Lyrics are preprocessed as in the notebook (wordpunct tokens, lowercased,
+alphanumeric only, WordNet-lemmatized, stopwords removed) by forked pool
+workers, each handed a range of rows to tokenize with one regex pass.
+A worker keeps a token cache from raw token to word-vector vocabulary id,
+so every distinct word is lowercased, lemmatized and looked up once per
+worker instead of once per occurrence, and returns its rows as CSR arrays
+of vocabulary ids. The chunks stack into one tracks x vocabulary count
+matrix. After the notebook's document-frequency filter, every track's
+mean word vector is one sparse product with the word-vector table,
+divided by its token count, and the result is written with
+util.embeddings in the binary format the models memory-map.
+
+Word vectors are read from a local GloVe or word2vec text file and the
+NLTK stopwords and WordNet corpora are used when installed locally, so
+nothing is downloaded.
+
+    python -m util.lyrics playlist_dataset.csv glove.6B.50d.txt --out data --workers 4
+"""
+import argparse
+import csv
+import os
+import re
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+from nltk.corpus import stopwords
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import wordpunct_tokenize
+from scipy.sparse import csr_matrix, diags
+from tqdm import tqdm
+
+from util import instrument
+from util.catalog import TrackCatalog
+from util.embeddings import writeEmbeddings
+
+# Filler words picked from the lyrics in the notebook
+LYRICS_STOPWORDS = ['oh', 'ooh', 'ohh', 'ah', 'eh', 'ehh', 'uh', 'la', 'wa', 'u', 'mmm', 'yeah', 'ya', 'woah',
+                    'gonna', 'finna', 'cause', 'em', 'ay', 'da']
+
+# nltk's WordPunctTokenizer pattern, run with the stdlib re module
+WORDPUNCT = re.compile(r"\w+|[^\w\s]+")
+# Joins the rows of a chunk; a token of its own that is never alphanumeric
+SEPARATOR = "\0"
+
+# Shared with pool workers, set by the pool initializer
+_texts = None
+_vocabulary = None
+_stopwords = None
+_lemmatize = None
+_cache = None
+
+
+def loadStopwords():
+    """
+    NLTK's English stopwords plus the lyrics fillers. Without a local copy
+    of the NLTK stopwords corpus only the fillers are removed.
+    """
+    try:
+        words = stopwords.words("english")
+    except LookupError:
+        print("NLTK stopwords corpus is not installed, removing the lyrics fillers only")
+        words = []
+    return frozenset(words + LYRICS_STOPWORDS)
+
+
+def loadLemmatizer():
+    """
+    WordNet lemmatize function, None when the WordNet corpus is not installed
+    """
+    lemmatizer = WordNetLemmatizer()
+    try:
+        lemmatizer.lemmatize("songs")
+    except LookupError:
+        print("WordNet corpus is not installed, tokens are not lemmatized")
+        return None
+    return lemmatizer.lemmatize
+
+
+def loadWordVectors(path):
+    """
+    (words, float32 vectors) from a GloVe text file ("word v1 v2 ...") or a
+    word2vec text file, whose first line is "<count> <dim>". A repeated word
+    keeps its first vector.
+    """
+    with open(path, encoding="utf-8") as f:
+        header = f.readline().split()
+    skipRows = 1 if len(header) == 2 and all(field.isdigit() for field in header) else 0
+    table = pd.read_csv(path, sep=" ", header=None, skiprows=skipRows, quoting=csv.QUOTE_NONE,
+                        na_filter=False, encoding="utf-8", dtype={0: object})
+    table = table[~table[0].duplicated()]
+    return table[0].to_numpy(dtype=object), table.iloc[:, 1:].to_numpy(dtype=np.float32)
+
+
+def preprocessText(text, stopwordSet, lemmatize=None):
+    """
+    The notebook's preprocess_text: lowercase alphanumeric wordpunct tokens,
+    lemmatized, without stopwords
+    """
+    tokens = [token.lower() for token in wordpunct_tokenize(text)]
+    tokens = [token for token in tokens if token.isalnum()]
+    if lemmatize is not None:
+        tokens = [lemmatize(token) for token in tokens]
+    return [token for token in tokens if token not in stopwordSet]
+
+
+def _initWorker(texts, vocabulary, stopwordSet, lemmatize):
+    global _texts, _vocabulary, _stopwords, _lemmatize, _cache
+    _texts, _vocabulary, _stopwords, _lemmatize = texts, vocabulary, stopwordSet, lemmatize
+    _cache = {}
+
+
+def _tokenId(token):
+    """
+    Vocabulary id of a raw token, -1 when it is dropped or has no vector
+    """
+    token = token.lower()
+    if not token.isalnum():
+        return -1
+    if _lemmatize is not None:
+        token = _lemmatize(token)
+    if token in _stopwords:
+        return -1
+    return _vocabulary.get(token, -1)
+
+
+def _encodeChunk(bounds):
+    """
+    Worker: (token counts, vocabulary ids) of rows lo:hi. The chunk is
+    tokenized in one pass with the rows joined by a separator token, its
+    raw tokens are factorized and only the distinct ones are resolved,
+    through the worker's token cache.
+    """
+    lo, hi = bounds
+    texts = [text.replace(SEPARATOR, " ") if isinstance(text, str) else "" for text in _texts[lo:hi]]
+    tokens = WORDPUNCT.findall(f" {SEPARATOR} ".join(texts))
+    codes, distinct = pd.factorize(np.array(tokens, dtype=object))
+    resolved = np.empty(len(distinct), dtype=np.int64)
+    separator = -1
+    for i, token in enumerate(distinct):
+        if token == SEPARATOR:
+            separator = i
+        tokenId = _cache.get(token)
+        if tokenId is None:
+            tokenId = _cache[token] = _tokenId(token)
+        resolved[i] = tokenId
+    # Row of every token: the number of separators before it
+    rows = np.cumsum(codes == separator)
+    ids = resolved[codes]
+    kept = ids >= 0
+    counts = np.bincount(rows[kept], minlength=hi - lo)
+    return lo, counts, ids[kept].astype(np.int32)
+
+
+@instrument.timed("lyrics.countMatrix")
+def countMatrix(texts, words, workers=None, chunkSize=500, stopwordSet=None, lemmatize=None):
+    """
+    Sparse (texts x words) matrix counting every preprocessed token of each
+    text that has a word vector
+    """
+    texts = list(texts)
+    vocabulary = dict(zip(words, range(len(words))))
+    stopwordSet = loadStopwords() if stopwordSet is None else stopwordSet
+    chunks = [(lo, min(lo + chunkSize, len(texts))) for lo in range(0, len(texts), chunkSize)]
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(chunks))
+
+    results = {}
+    progress = tqdm(total=len(texts), unit="track")
+    initargs = (texts, vocabulary, stopwordSet, lemmatize)
+    if workers > 1:
+        with Pool(workers, initializer=_initWorker, initargs=initargs) as pool:
+            for lo, counts, ids in pool.imap_unordered(_encodeChunk, chunks):
+                results[lo] = (counts, ids)
+                progress.update(len(counts))
+    else:
+        _initWorker(*initargs)
+        for chunk in chunks:
+            lo, counts, ids = _encodeChunk(chunk)
+            results[lo] = (counts, ids)
+            progress.update(len(counts))
+    progress.close()
+
+    ordered = [results[lo] for lo, _ in chunks]
+    counts = np.concatenate([counts for counts, _ in ordered]) if ordered else np.zeros(0, dtype=np.int64)
+    indices = np.concatenate([ids for _, ids in ordered]) if ordered else np.zeros(0, dtype=np.int32)
+    indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    matrix = csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr), shape=(len(texts), len(words)))
+    matrix.sum_duplicates()
+    return matrix
+
+
+def keptWords(counts, minDocs=2, minDocShare=0.005, maxDocShare=0.9):
+    """
+    Mask of the words kept by the notebook's filters: in at least minDocs
+    texts and minDocShare of them, and in at most maxDocShare of them
+    """
+    numDocs = counts.shape[0]
+    documents = np.bincount(counts.indices, minlength=counts.shape[1])
+    return (documents >= max(minDocs, minDocShare * numDocs)) & (documents <= maxDocShare * numDocs)
+
+
+@instrument.timed("lyrics.meanEmbeddings")
+def meanEmbeddings(counts, vectors, keep=None):
+    """
+    (matrix, valid): each row's mean word vector over its kept tokens,
+    zero and invalid for rows without any
+    """
+    if keep is not None:
+        counts = counts @ diags(keep.astype(np.float32))
+    totals = np.asarray(counts.sum(axis=1)).ravel()
+    valid = totals > 0
+    matrix = np.asarray(counts @ vectors, dtype=np.float32)
+    matrix[valid] /= totals[valid, None]
+    return matrix, valid
+
+
+def lyricsEmbeddings(texts, words, vectors, workers=None, chunkSize=500, minDocs=2, minDocShare=0.005,
+                     maxDocShare=0.9):
+    """
+    (matrix, valid) mean word-vector embeddings of a list of lyrics
+    """
+    counts = countMatrix(texts, words, workers, chunkSize, loadStopwords(), loadLemmatizer())
+    keep = keptWords(counts, minDocs, minDocShare, maxDocShare)
+    print(f"Keeping {keep.sum()} of {len(words)} words with vectors after the document-frequency filter")
+    return meanEmbeddings(counts, vectors, keep)
+
+
+def writeLyricsEmbeddings(directory, catalog, uris, texts, words, vectors, **options):
+    """
+    Embed the lyrics of the catalog's tracks and write them, aligned with the
+    catalog's track ids, in the binary format of util.embeddings. Tracks
+    without lyrics are marked invalid; the first lyrics of a repeated URI win.
+    Returns the written (rows, dim) shape.
+    """
+    ids = catalog.toIds(np.asarray(uris, dtype=object))
+    _, first = np.unique(ids, return_index=True)
+    rows = np.sort(first[ids[first] >= 0])
+    embedded, embeddedValid = lyricsEmbeddings([texts[row] for row in rows], words, vectors, **options)
+
+    matrix = np.zeros((len(catalog), vectors.shape[1]), dtype=np.float32)
+    valid = np.zeros(len(catalog), dtype=bool)
+    matrix[ids[rows]] = embedded
+    valid[ids[rows]] = embeddedValid
+    print(f"Embedded the lyrics of {valid.sum()} of {len(catalog)} tracks")
+    return writeEmbeddings(directory, matrix, valid, catalog.fingerprint())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("lyrics", help="CSV with Track URI and lyrics columns, e.g. the notebook's playlist_dataset.csv")
+    parser.add_argument("wordVectors", help="local GloVe or word2vec text file, e.g. glove.6B.50d.txt")
+    parser.add_argument("--tracks", default=os.path.join("data", "tracks.pkl"), help="songs the catalog is built from")
+    parser.add_argument("--out", default="data")
+    parser.add_argument("--column", default="Lyrics")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--min-docs", type=int, default=2)
+    parser.add_argument("--min-doc-share", type=float, default=0.005)
+    parser.add_argument("--max-doc-share", type=float, default=0.9)
+    args = parser.parse_args()
+
+    catalog = TrackCatalog.fromSongs(pd.read_pickle(args.tracks))
+    lyrics = pd.read_csv(args.lyrics, usecols=["Track URI", args.column])
+    # The catalog holds bare track ids
+    uris = lyrics["Track URI"].astype(str).str.replace("spotify:track:", "", regex=False)
+    words, vectors = loadWordVectors(args.wordVectors)
+    print(f"Loaded {len(words)} word vectors of dimension {vectors.shape[1]}")
+    shape = writeLyricsEmbeddings(args.out, catalog, uris.to_numpy(dtype=object),
+                                  lyrics[args.column].to_numpy(dtype=object), words, vectors,
+                                  workers=args.workers, chunkSize=args.chunk_size, minDocs=args.min_docs,
+                                  minDocShare=args.min_doc_share, maxDocShare=args.max_doc_share)
+    print(f"Wrote {shape[0]} x {shape[1]} lyrics embeddings to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
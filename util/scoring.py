@@ -0,0 +1,205 @@
+"""
+Offline bulk scoring of every playlist, or a chosen subset, into shards.
+
+The Playlist IDs are split into shards of shardSize playlists. Forked pool
+workers rank a whole shard with one predictBatch call, decorate the
+recommendations with track metadata in one catalog.decorate join, and write
+the shard atomically as shard-NNNNN.pkl. Finished shards are the checkpoint:
+rerunning into the same directory with the same classifier, model
+fingerprint, numPredictions and selection skips them, so an interrupted job
+resumes where it stopped, while any other settings start over.
+
+    python -m util.scoring --out data/scores --classifier NNC --predictions 50 --workers 4
+    python -m util.scoring --out data/scores --predictions 10 \\
+        --dashboard Dashboard/dashboard/all_playlist_recs.pkl
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import pickle
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from util.evaluation import rankPlaylists
+
+MANIFEST = "manifest.json"
+SCORES_VERSION = 1
+
+# Shared with pool workers, set by the pool initializer
+_classifier = None
+_catalog = None
+_playlists = None
+_groups = None
+
+
+def _initWorker(classifier, catalog, playlists, groups):
+    global _classifier, _catalog, _playlists, _groups
+    _classifier, _catalog, _playlists, _groups = classifier, catalog, playlists, groups
+
+
+def shardPath(outDir, shard):
+    return os.path.join(outDir, f"shard-{shard:05d}.pkl")
+
+
+def selectionHash(playlistIDs):
+    return hashlib.blake2b(np.asarray(playlistIDs, dtype=np.int64).tobytes(), digest_size=16).hexdigest()
+
+
+def decorateRecommendations(catalog, playlistIDs, playlistNames, ranked):
+    """
+    One row per (playlist, rank) with the track's URI, name and artist,
+    joined from the catalog columns in one pass
+    """
+    counts = np.array([len(predictions) for predictions in ranked], dtype=np.int64)
+    uris = np.concatenate([np.asarray(predictions, dtype=object) for predictions in ranked]) \
+        if len(ranked) else np.empty(0, dtype=object)
+    frame = catalog.decorate(catalog.toIds(uris))
+    frame.insert(0, "Playlist ID", np.repeat(np.asarray(playlistIDs, dtype=np.int64), counts))
+    frame.insert(1, "Playlist Name", np.repeat(np.asarray(playlistNames, dtype=object), counts))
+    frame.insert(2, "Rank", np.arange(len(uris)) - np.repeat(np.cumsum(counts) - counts, counts) + 1)
+    return frame
+
+
+def _scoreShard(args):
+    """
+    Worker: rank one shard of playlists and write its decorated recommendations
+    """
+    shard, playlistIDs, numPredictions, path = args
+    playlists = [_playlists.iloc[_groups[playlistID]] for playlistID in playlistIDs]
+    ranked = rankPlaylists(_classifier, playlists, numPredictions)
+    names = [playlist["Playlist Name"].iloc[0] if "Playlist Name" in playlist else None for playlist in playlists]
+    frame = decorateRecommendations(_catalog, playlistIDs, names, ranked)
+    frame.to_pickle(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return shard, len(playlistIDs)
+
+
+def scorePlaylists(classifier, playlists, catalog, outDir, numPredictions=50, playlistIDs=None,
+                   shardSize=1000, workers=None, fingerprint=None):
+    """
+    Score the selected playlists (all by default) into shards under outDir,
+    skipping shards already written by an identical earlier run. fingerprint
+    identifies the model and data across processes, e.g. the NNC's matrix fingerprint.
+
+    Returns:
+        dict: playlists and shards scored and skipped, seconds, playlists per second
+    """
+    groups = playlists.groupby("Playlist ID", sort=True).indices
+    if playlistIDs is None:
+        playlistIDs = np.fromiter(groups.keys(), dtype=np.int64, count=len(groups))
+    else:
+        playlistIDs = np.asarray([playlistID for playlistID in playlistIDs if playlistID in groups], dtype=np.int64)
+    shards = [playlistIDs[lo:lo + shardSize] for lo in range(0, len(playlistIDs), shardSize)]
+
+    manifest = {"version": SCORES_VERSION, "classifier": classifier.name, "fingerprint": fingerprint,
+                "numPredictions": numPredictions, "shardSize": shardSize,
+                "selection": selectionHash(playlistIDs), "numShards": len(shards)}
+    manifest = json.loads(json.dumps(manifest))
+    os.makedirs(outDir, exist_ok=True)
+    manifestPath = os.path.join(outDir, MANIFEST)
+    previous = None
+    if os.path.exists(manifestPath):
+        with open(manifestPath) as f:
+            previous = json.load(f)
+    if previous != manifest:
+        # Different settings: earlier shards are not part of this run
+        for path in glob.glob(os.path.join(outDir, "shard-*.pkl")):
+            os.remove(path)
+        with open(manifestPath + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifestPath + ".tmp", manifestPath)
+
+    tasks = [(shard, ids, numPredictions, shardPath(outDir, shard))
+             for shard, ids in enumerate(shards) if not os.path.exists(shardPath(outDir, shard))]
+    skipped = len(shards) - len(tasks)
+    if skipped:
+        print(f"Resuming: {skipped} of {len(shards)} shards already scored")
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(tasks))
+
+    start = time.perf_counter()
+    scored = 0
+    progress = tqdm(total=sum(len(ids) for _, ids, _, _ in tasks), unit="playlist")
+    initargs = (classifier, catalog, playlists, groups)
+    if workers > 1:
+        with Pool(workers, initializer=_initWorker, initargs=initargs) as pool:
+            for _, count in pool.imap_unordered(_scoreShard, tasks):
+                scored += count
+                progress.update(count)
+    else:
+        _initWorker(*initargs)
+        for task in tasks:
+            _, count = _scoreShard(task)
+            scored += count
+            progress.update(count)
+    progress.close()
+    seconds = time.perf_counter() - start
+
+    return {"playlists": scored, "shards": len(tasks), "skippedShards": skipped,
+            "skippedPlaylists": len(playlistIDs) - scored, "seconds": seconds,
+            "playlistsPerSecond": scored / seconds if seconds > 0 else 0.0}
+
+
+def loadScores(outDir):
+    """
+    All written shards of outDir concatenated in shard order
+    """
+    paths = sorted(glob.glob(os.path.join(outDir, "shard-*.pkl")))
+    if not paths:
+        return pd.DataFrame(columns=["Playlist ID", "Playlist Name", "Rank", "Track URI", "Track Name", "Artist Name"])
+    return pd.concat([pd.read_pickle(path) for path in paths], ignore_index=True)
+
+
+def dashboardRecs(scores, numRecs=10):
+    """
+    {Playlist Name: [spotify:track:... URIs]} as the dashboard's
+    all_playlist_recs.pkl holds them; the first playlist of a repeated name wins
+    """
+    top = scores[scores["Rank"] <= numRecs]
+    top = top[top["Playlist ID"].isin(top.drop_duplicates("Playlist Name")["Playlist ID"])]
+    uris = top["Track URI"].astype(str)
+    uris = uris.where(uris.str.startswith("spotify:track:"), "spotify:track:" + uris)
+    return {name: list(group) for name, group in uris.groupby(top["Playlist Name"], sort=False)}
+
+
+def main():
+    from main import SpotifyExplorer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=os.path.join("data", "scores"))
+    parser.add_argument("--classifier", default="NNC", choices=["NNC", "Base", "Hybrid"])
+    parser.add_argument("--predictions", type=int, default=50)
+    parser.add_argument("--playlist-ids", type=int, nargs="+", help="score only these playlists")
+    parser.add_argument("--shard-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--store-dir")
+    parser.add_argument("--engine", default="brute")
+    parser.add_argument("--dashboard", help="also write the dashboard's all_playlist_recs.pkl here")
+    parser.add_argument("--dashboard-recs", type=int, default=10)
+    args = parser.parse_args()
+
+    explorer = SpotifyExplorer(0, retrainNNC=False, storeDir=args.store_dir, nncEngine=args.engine, cacheSize=0)
+    explorer.setClassifier(args.classifier)
+    report = scorePlaylists(explorer.classifier, explorer.playlists, explorer.catalog, args.out,
+                            args.predictions, args.playlist_ids, args.shard_size, args.workers,
+                            fingerprint=[explorer.NNC.fingerprint, list(explorer.playlistSparse.shape),
+                                         len(explorer.NNC.segmentModels), len(explorer.catalog)])
+    print(f"Scored {report['playlists']} playlists in {report['shards']} shards "
+          f"({report['skippedShards']} shards resumed) in {report['seconds']:.1f}s, "
+          f"{report['playlistsPerSecond']:.1f} playlists/s")
+
+    if args.dashboard:
+        recs = dashboardRecs(loadScores(args.out), args.dashboard_recs)
+        with open(args.dashboard, "wb") as f:
+            pickle.dump(recs, f)
+        print(f"Wrote recommendations for {len(recs)} playlists to {args.dashboard}")
+
+
+if __name__ == "__main__":
+    main()
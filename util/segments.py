@@ -0,0 +1,146 @@
+"""
+Append-only segments over the catalog columns and the playlist matrix.
+
+New playlists and tracks are kept as small delta segments next to the
+unchanged base arrays, so an append costs time proportional to the delta
+and the segments are readable straight away. compact() folds them back
+into a single array or CSR matrix.
+"""
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+
+class SegmentedColumn:
+    """
+    A base column (array or store StringColumn) followed by appended arrays,
+    indexed by position as if it were one array
+    """
+
+    def __init__(self, base, deltas=()):
+        self.base = base
+        self.deltas = list(deltas)
+        self.offsets = np.cumsum([0, len(base)] + [len(delta) for delta in self.deltas])
+
+    def append(self, values):
+        self.deltas.append(np.asarray(values))
+        self.offsets = np.append(self.offsets, self.offsets[-1] + len(values))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __iter__(self):
+        for i in range(len(self.deltas) + 1):
+            segment = self.segment(i)
+            yield from (segment.toArray() if hasattr(segment, "toArray") else segment)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            segment = np.searchsorted(self.offsets, key, side="right") - 1
+            return self.segment(segment)[key - self.offsets[segment]]
+        positions = np.arange(len(self))[key] if isinstance(key, slice) else np.asarray(key, dtype=np.int64)
+        segments = np.searchsorted(self.offsets, positions, side="right") - 1
+        result = None
+        for segment in np.unique(segments):
+            mask = segments == segment
+            values = np.asarray(self.segment(segment)[positions[mask] - self.offsets[segment]])
+            if result is None:
+                result = np.empty(len(positions), dtype=values.dtype)
+            result[mask] = values
+        return result if result is not None else np.empty(0, dtype=self.dtype)
+
+    @property
+    def dtype(self):
+        return self.deltas[0].dtype if self.deltas else np.asarray(self.base[:0]).dtype
+
+    def segment(self, i):
+        return self.base if i == 0 else self.deltas[i - 1]
+
+    def toArray(self):
+        base = self.base.toArray() if hasattr(self.base, "toArray") else np.asarray(self.base)
+        return np.concatenate([base] + [delta.astype(base.dtype) for delta in self.deltas])
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.toArray()
+        return values if dtype is None else values.astype(dtype)
+
+
+class SegmentedMatrix:
+    """
+    A base CSR playlist matrix followed by delta CSR blocks of new rows.
+    Deltas may be wider than the base when they bring new track columns;
+    narrower blocks are treated as zero-padded to the full width.
+    """
+
+    def __init__(self, base, deltas=()):
+        self.base = csr_matrix(base)
+        self.deltas = []
+        self.rowOffsets = [0, self.base.shape[0]]
+        self.numColumns = self.base.shape[1]
+        for delta in deltas:
+            self.append(delta)
+
+    def append(self, delta):
+        """
+        Add a block of rows that directly follow the current last row
+        """
+        delta = csr_matrix(delta)
+        self.deltas.append(delta)
+        self.rowOffsets.append(self.rowOffsets[-1] + delta.shape[0])
+        self.numColumns = max(self.numColumns, delta.shape[1])
+
+    @property
+    def shape(self):
+        return (self.rowOffsets[-1], self.numColumns)
+
+    @property
+    def nnz(self):
+        return self.base.nnz + sum(delta.nnz for delta in self.deltas)
+
+    def blocks(self):
+        """
+        (first row, block) for the base and every delta
+        """
+        return list(zip(self.rowOffsets, [self.base] + self.deltas))
+
+    def widen(self, block):
+        if block.shape[1] == self.numColumns:
+            return block
+        return csr_matrix((block.data, block.indices, block.indptr), shape=(block.shape[0], self.numColumns))
+
+    def __getitem__(self, rows):
+        """
+        CSR of the given rows, in the given order, at the full width
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not self.deltas:
+            return self.base[rows]
+        segments = np.searchsorted(self.rowOffsets, rows, side="right") - 1
+        parts, positions = [], []
+        for segment in np.unique(segments):
+            mask = np.flatnonzero(segments == segment)
+            offset, block = self.blocks()[segment]
+            parts.append(self.widen(block[rows[mask] - offset]))
+            positions.append(mask)
+        if not parts:
+            return csr_matrix((0, self.numColumns), dtype=self.base.dtype)
+        stacked = vstack(parts, format="csr")
+        order = np.empty(len(rows), dtype=np.int64)
+        order[np.concatenate(positions)] = np.arange(len(rows))
+        return stacked[order]
+
+    def compact(self):
+        """
+        Merge the base and every delta into one CSR matrix
+        """
+        if not self.deltas:
+            return self.base
+        return vstack([self.widen(block) for _, block in self.blocks()], format="csr")
+
+
+def matrixBlocks(playlistSparse):
+    """
+    (first row, CSR block) for a plain CSR matrix or a SegmentedMatrix
+    """
+    if isinstance(playlistSparse, SegmentedMatrix):
+        return playlistSparse.blocks()
+    return [(0, playlistSparse)]
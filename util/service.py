@@ -0,0 +1,387 @@
+"""
+Local HTTP/JSON recommendation service with request micro-batching.
+
+The explorer is loaded once. Requests that arrive within maxDelay of the
+first queued one (up to maxBatch of them) are answered by a single
+predictBatch call, so concurrent clients share one neighbour search and
+scoring pass. Requests for different counts only share a call up to the
+classifier's prefix limit; beyond it each count is ranked in its own call.
+Cache hits are answered without queueing.
+
+    POST /recommend   {"tracks": ["<track id>", ...], "n": 50, "playlistId": 12, "name": "road trip"}
+                      -> {"predictions": ["<track id>", ...]}
+    GET  /metrics     Prometheus text: queue depth, batch sizes, latencies
+    GET  /stats       the same as JSON
+    GET  /health
+
+    python -m util.service --port 8080 --max-batch 64 --max-delay-ms 5
+
+Plain asyncio streams, no web framework needed.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import pandas as pd
+
+from util.evaluation import rankPlaylists
+from util.cache import playlistKey
+from util.helpers import prefixLimit
+
+BATCH_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class BatchMetrics:
+    """
+    Counters for the batcher: requests, batches, batch size histogram,
+    time spent queued and in the batched prediction
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.cacheHits = 0
+        self.batches = 0
+        self.batchedRequests = 0
+        self.maxBatchSeen = 0
+        self.batchSizeBuckets = [0] * len(BATCH_BUCKETS)
+        self.queueSeconds = 0.0
+        self.predictSeconds = 0.0
+        self.errors = 0
+
+    def recordBatch(self, size, queueSeconds, predictSeconds):
+        self.batches += 1
+        self.batchedRequests += size
+        self.maxBatchSeen = max(self.maxBatchSeen, size)
+        for i, bound in enumerate(BATCH_BUCKETS):
+            if size <= bound:
+                self.batchSizeBuckets[i] += 1
+        self.queueSeconds += queueSeconds
+        self.predictSeconds += predictSeconds
+
+
+def rankGroups(classifier, playlists, counts):
+    """
+    Top counts[i] Track URIs for every playlist. Counts up to the
+    classifier's prefix limit are ranked in one call at the largest of them
+    and cut to length; larger counts get one call per distinct count.
+    """
+    limit = prefixLimit(classifier)
+    groups = {}
+    for i, n in enumerate(counts):
+        groups.setdefault(None if n <= limit else n, []).append(i)
+    results = [None] * len(playlists)
+    for members in groups.values():
+        ranked = rankPlaylists(classifier, [playlists[i] for i in members], max(counts[i] for i in members))
+        for i, predictions in zip(members, ranked):
+            results[i] = list(predictions)[:counts[i]]
+    return results
+
+
+def rankEach(classifier, playlists, counts):
+    """
+    rankGroups one request at a time, with the exception in place of the
+    predictions of every request that failed
+    """
+    results = []
+    for playlist, n in zip(playlists, counts):
+        try:
+            results.append(rankGroups(classifier, [playlist], [n])[0])
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def validatePlaylist(classifier, playlist):
+    """
+    Raise ValueError for a playlist the classifier cannot answer, so it is
+    turned away before it joins a batch
+    """
+    validate = getattr(classifier, "validate", None)
+    if validate is not None:
+        validate(playlist)
+
+
+class MicroBatcher:
+    """
+    Queue of pending requests drained in batches of up to maxBatch, each
+    batch closing maxDelay seconds after its first request arrived
+    """
+
+    def __init__(self, explorer, maxBatch=64, maxDelay=0.005):
+        self.explorer = explorer
+        self.maxBatch = maxBatch
+        self.maxDelay = maxDelay
+        self.metrics = BatchMetrics()
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+    def start(self):
+        self.worker = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def queueDepth(self):
+        return self.queue.qsize()
+
+    async def recommend(self, playlist, numPredictions):
+        """
+        Predictions for one playlist, from the cache or the next batch
+        """
+        self.metrics.requests += 1
+        cache = self.explorer.cache
+        if cache is not None:
+            cache.validate(self.explorer.modelFingerprint())
+            classifier = self.explorer.classifier
+            name, key, limit = classifier.name, playlistKey(playlist), prefixLimit(classifier)
+            predictions = cache.get(name, key, numPredictions, limit)
+            if predictions is not None:
+                self.metrics.cacheHits += 1
+                return list(predictions)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((playlist, numPredictions, future, time.perf_counter()))
+        predictions = await future
+        if cache is not None:
+            cache.put(name, key, numPredictions, predictions, limit)
+        return list(predictions)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = batch[0][3] + self.maxDelay
+            while len(batch) < self.maxBatch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    # Past the deadline, still take whatever is already waiting
+                    if self.queue.empty():
+                        break
+                    batch.append(self.queue.get_nowait())
+                    continue
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            start = time.perf_counter()
+            playlists = [playlist for playlist, _, _, _ in batch]
+            counts = [n for _, n, _, _ in batch]
+            classifier = self.explorer.classifier
+            try:
+                # Score in a worker thread so the loop keeps accepting requests
+                results = await loop.run_in_executor(None, rankGroups, classifier, playlists, counts)
+            except Exception:
+                # Rank the batch again one request at a time so only the failing ones get the error
+                results = await loop.run_in_executor(None, rankEach, classifier, playlists, counts)
+            end = time.perf_counter()
+            self.metrics.recordBatch(len(batch), sum(start - queued for _, _, _, queued in batch), end - start)
+            for (_, _, future, _), predictions in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(predictions, Exception):
+                    self.metrics.errors += 1
+                    future.set_exception(predictions)
+                else:
+                    future.set_result(predictions)
+
+    def stats(self):
+        metrics = self.metrics
+        return {
+            "queueDepth": self.queueDepth,
+            "maxBatch": self.maxBatch,
+            "maxDelayMs": self.maxDelay * 1000,
+            "requests": metrics.requests,
+            "cacheHits": metrics.cacheHits,
+            "batches": metrics.batches,
+            "meanBatchSize": metrics.batchedRequests / metrics.batches if metrics.batches else 0.0,
+            "maxBatchSize": metrics.maxBatchSeen,
+            "batchSizeBuckets": dict(zip(map(str, BATCH_BUCKETS), metrics.batchSizeBuckets)),
+            "queueSeconds": metrics.queueSeconds,
+            "predictSeconds": metrics.predictSeconds,
+            "errors": metrics.errors,
+        }
+
+    def prometheus(self, prefix="spotify_service"):
+        metrics = self.metrics
+        lines = [
+            f"# TYPE {prefix}_queue_depth gauge",
+            f"{prefix}_queue_depth {self.queueDepth}",
+            f"# TYPE {prefix}_requests_total counter",
+            f"{prefix}_requests_total {metrics.requests}",
+            f"# TYPE {prefix}_cache_hits_total counter",
+            f"{prefix}_cache_hits_total {metrics.cacheHits}",
+            f"# TYPE {prefix}_errors_total counter",
+            f"{prefix}_errors_total {metrics.errors}",
+            f"# TYPE {prefix}_batch_size histogram",
+        ]
+        for bound, count in zip(BATCH_BUCKETS, metrics.batchSizeBuckets):
+            lines.append(f'{prefix}_batch_size_bucket{{le="{bound}"}} {count}')
+        lines += [
+            f'{prefix}_batch_size_bucket{{le="+Inf"}} {metrics.batches}',
+            f"{prefix}_batch_size_sum {metrics.batchedRequests}",
+            f"{prefix}_batch_size_count {metrics.batches}",
+            f"# TYPE {prefix}_queue_seconds_total counter",
+            f"{prefix}_queue_seconds_total {metrics.queueSeconds}",
+            f"# TYPE {prefix}_predict_seconds_total counter",
+            f"{prefix}_predict_seconds_total {metrics.predictSeconds}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def requestPlaylist(body):
+    """
+    Playlist DataFrame for a /recommend body, as SpotifyExplorer.predictNeighbour takes it
+    """
+    if not isinstance(body, dict):
+        raise ValueError("the request body must be a JSON object")
+    tracks = body.get("tracks")
+    if not isinstance(tracks, list) or not all(isinstance(track, str) for track in tracks):
+        raise ValueError('"tracks" must be a list of track ids')
+    playlist = pd.DataFrame({"Track URI": pd.Series(tracks, dtype=object)})
+    if body.get("playlistId") is not None:
+        playlist["Playlist ID"] = int(body["playlistId"])
+    if body.get("name") is not None:
+        # Title-only playlists have no rows to hold the name column
+        playlist["Playlist Name"] = str(body["name"])
+        playlist.attrs["Playlist Name"] = str(body["name"])
+    return playlist
+
+
+def requestCount(body):
+    """
+    Number of predictions a /recommend body asks for, 50 by default
+    """
+    numPredictions = body.get("n", 50)
+    # JSON true is a Python bool, which is an int
+    if isinstance(numPredictions, bool) or not isinstance(numPredictions, int) or numPredictions < 1:
+        raise ValueError('"n" must be a positive integer')
+    return numPredictions
+
+
+class RecommendationService:
+    """
+    Args:
+        explorer (SpotifyExplorer): loaded explorer, its current classifier serves requests
+        maxBatch (int): most requests answered by one predictBatch call
+        maxDelay (float): seconds a batch stays open after its first request
+    """
+
+    def __init__(self, explorer, maxBatch=64, maxDelay=0.005):
+        self.explorer = explorer
+        self.batcher = MicroBatcher(explorer, maxBatch, maxDelay)
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self.handleConnection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def handleConnection(self, reader, writer):
+        """
+        Serve HTTP/1.1 requests on one connection until the client closes it
+        """
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                method, path, _ = requestLine.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, contentType, payload = await self.route(method, path, body)
+                keepAlive = headers.get("connection", "").lower() != "close"
+                writer.write((f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                              f"Content-Type: {contentType}\r\n"
+                              f"Content-Length: {len(payload)}\r\n"
+                              f"Connection: {'keep-alive' if keepAlive else 'close'}\r\n\r\n").encode("latin-1")
+                             + payload)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        """
+        (status, content type, payload bytes) for one request
+        """
+        if path == "/recommend":
+            if method != "POST":
+                return jsonResponse(405, {"error": "use POST"})
+            try:
+                request = json.loads(body or b"{}")
+                playlist = requestPlaylist(request)
+                numPredictions = requestCount(request)
+                validatePlaylist(self.explorer.classifier, playlist)
+            except (ValueError, TypeError) as e:
+                return jsonResponse(400, {"error": str(e)})
+            try:
+                predictions = await self.batcher.recommend(playlist, numPredictions)
+            except Exception as e:
+                return jsonResponse(500, {"error": str(e)})
+            return jsonResponse(200, {"predictions": [str(uri) for uri in predictions]})
+        if path == "/metrics":
+            return 200, "text/plain; version=0.0.4", self.batcher.prometheus().encode()
+        if path == "/stats":
+            stats = self.batcher.stats()
+            if self.explorer.cache is not None:
+                stats["cache"] = self.explorer.cache.stats()
+            return jsonResponse(200, stats)
+        if path == "/health":
+            return jsonResponse(200, {"status": "ok"})
+        return jsonResponse(404, {"error": f"no route {path}"})
+
+
+def jsonResponse(status, payload):
+    return status, "application/json", json.dumps(payload).encode()
+
+
+async def serve(explorer, host, port, maxBatch, maxDelay):
+    service = RecommendationService(explorer, maxBatch, maxDelay)
+    port = await service.start(host, port)
+    print(f"Serving recommendations on http://{host}:{port}")
+    async with service.server:
+        await service.server.serve_forever()
+
+
+def main():
+    from main import SpotifyExplorer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-delay-ms", type=float, default=5.0)
+    parser.add_argument("--store-dir")
+    parser.add_argument("--engine", default="brute")
+    parser.add_argument("--retrain", action="store_true")
+    args = parser.parse_args()
+
+    explorer = SpotifyExplorer(0, retrainNNC=args.retrain, storeDir=args.store_dir, nncEngine=args.engine)
+    asyncio.run(serve(explorer, args.host, args.port, args.max_batch, args.max_delay_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def normalizeRows(vectors):
+    """
+    L2-normalize rows as float32, leaving all-zero rows at zero
+    (same convention as sklearn's cosine_similarity)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def topkNeighbours(vectors, k, blockSize=1024, normalized=False, traceMemory=False):
+    """
+    Compute the k most cosine-similar rows for every row without
+    materializing the full NxN similarity matrix.
+
+    Rows are processed in blocks of blockSize, so the working set is
+    blockSize x N float32 instead of N x N float64. A row is never
+    returned as its own neighbour. traceMemory measures the peak memory of
+    the build with tracemalloc, which slows every allocation down, so it is
+    meant for benchmarks.
+
+    Returns:
+        neighbours (ndarray int32, N x k): row indices sorted by similarity
+        sims (ndarray float32, N x k): matching cosine similarities
+        stats (dict): seconds, rows/sec and, with traceMemory, peak traced memory in MB
+    """
+    if not normalized:
+        vectors = normalizeRows(vectors)
+    n = len(vectors)
+    k = max(0, min(k, n - 1))
+
+    neighbours = np.empty((n, k), dtype=np.int32)
+    sims = np.empty((n, k), dtype=np.float32)
+
+    startedTracing = traceMemory and not tracemalloc.is_tracing()
+    if startedTracing:
+        tracemalloc.start()
+    if traceMemory:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+
+    for lo in range(0, n, blockSize):
+        hi = min(lo + blockSize, n)
+        block = vectors[lo:hi] @ vectors.T
+        # Exclude self matches before selecting the top k
+        block[np.arange(hi - lo), np.arange(lo, hi)] = -np.inf
+        if k == 0:
+            continue
+        part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        partSims = np.take_along_axis(block, part, axis=1)
+        order = np.argsort(-partSims, axis=1, kind="stable")
+        neighbours[lo:hi] = np.take_along_axis(part, order, axis=1)
+        sims[lo:hi] = np.take_along_axis(partSims, order, axis=1)
+
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - baseline if traceMemory else None
+    if startedTracing:
+        tracemalloc.stop()
+
+    stats = {
+        "rows": n,
+        "k": k,
+        "blockSize": blockSize,
+        "seconds": elapsed,
+        "rowsPerSec": n / elapsed if elapsed > 0 else float("inf"),
+        "peakMB": peak / 2 ** 20 if peak is not None else None,
+    }
+    return neighbours, sims, stats
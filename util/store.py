@@ -0,0 +1,457 @@
+"""
+Memory-mapped columnar storage for the playlist matrix, track catalog and
+playlist rows.
+
+Every column is a raw .npy file that is opened with mmap, so loading a
+store costs a few file opens and concurrent processes share the same
+pages. Strings are stored Arrow-style as one utf-8 byte buffer plus int64
+offsets, and lyrics embeddings use the binary format of util.embeddings.
+A manifest.json records shapes, the column layout and the matrix fingerprint.
+
+Playlists appended later are written as delta segments under segments/,
+each holding its block of new matrix rows, the tracks it introduced and
+its playlist rows, until compactStore() rewrites the store with them merged.
+
+    python -m util.store data data/store
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from util.embeddings import loadEmbeddings, matchesCatalog, writeEmbeddings, writeSongEmbeddings
+from util.catalog import TrackCatalog
+from util.helpers import matrixFingerprint
+
+VERSION = 2
+
+
+class StringColumn:
+    """
+    Arrow-style string column: utf-8 bytes plus offsets, decoded on access
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def fromValues(cls, values):
+        encoded = [("" if v is None or v != v else str(v)).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def decode(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.decode(key)
+        ids = np.arange(len(self))[key] if isinstance(key, slice) else np.asarray(key)
+        return np.array([self.decode(i) for i in ids], dtype=object)
+
+    def toArray(self):
+        """
+        Decode every value into an object array, in one vectorized step
+        when all values have the same byte length
+        """
+        lengths = np.diff(self.offsets)
+        if len(lengths) and (lengths == lengths[0]).all() and lengths[0] > 0:
+            fixed = np.asarray(self.data[:self.offsets[-1]]).view(f"S{lengths[0]}")
+            return np.char.decode(fixed, "utf-8").astype(object)
+        return self[np.arange(len(self))]
+
+
+def saveArray(storeDir, name, values):
+    np.save(os.path.join(storeDir, name + ".npy"), np.ascontiguousarray(values))
+
+
+def loadArray(storeDir, name):
+    return np.load(os.path.join(storeDir, name + ".npy"), mmap_mode="r")
+
+
+def saveStrings(storeDir, name, values):
+    column = values if isinstance(values, StringColumn) else StringColumn.fromValues(values)
+    saveArray(storeDir, name + ".offsets", column.offsets)
+    saveArray(storeDir, name + ".bytes", column.data)
+
+
+def loadStrings(storeDir, name):
+    return StringColumn(loadArray(storeDir, name + ".offsets"), loadArray(storeDir, name + ".bytes"))
+
+
+class ColumnWriter:
+    """
+    Column written part by part to a raw file and turned into a .npy
+    column, optionally of another dtype, once its length is known
+    """
+
+    def __init__(self, storeDir, name, dtype):
+        self.storeDir = storeDir
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.path = os.path.join(storeDir, name + ".raw")
+        self.file = open(self.path, "wb")
+        self.length = 0
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.file.write(values.tobytes())
+        self.length += len(values)
+
+    def close(self, dtype=None, chunkItems=1 << 22):
+        self.file.close()
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        if self.length == 0:
+            saveArray(self.storeDir, self.name, np.zeros(0, dtype=dtype))
+        else:
+            raw = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(self.length,))
+            out = np.lib.format.open_memmap(os.path.join(self.storeDir, self.name + ".npy"), mode="w+",
+                                            dtype=dtype, shape=(self.length,))
+            for lo in range(0, self.length, chunkItems):
+                out[lo:lo + chunkItems] = raw[lo:lo + chunkItems]
+            out.flush()
+            del raw, out
+        os.remove(self.path)
+
+
+class StringColumnWriter:
+    """
+    StringColumn written part by part, see ColumnWriter
+    """
+
+    def __init__(self, storeDir, name):
+        self.offsets = ColumnWriter(storeDir, name + ".offsets", np.int64)
+        self.bytes = ColumnWriter(storeDir, name + ".bytes", np.uint8)
+        self.offsets.append([0])
+
+    def append(self, values):
+        column = values if isinstance(values, StringColumn) else StringColumn.fromValues(values)
+        self.offsets.append(column.offsets[1:] + self.bytes.length)
+        self.bytes.append(column.data[:column.offsets[-1]])
+
+    def close(self):
+        self.offsets.close()
+        self.bytes.close()
+
+
+def writeStore(storeDir, playlists, songs, playlistSparse):
+    """
+    Write the DataFrames and playlist matrix read by SpotifyExplorer as
+    memory-mappable columns
+    """
+    os.makedirs(storeDir, exist_ok=True)
+    # Segments appended to a previous store would otherwise be replayed on top of the new base
+    shutil.rmtree(os.path.join(storeDir, "segments"), ignore_errors=True)
+    catalog = TrackCatalog.fromSongs(songs)
+    embeddingShape = writeSongEmbeddings(storeDir, songs, catalog)
+    return writeTables(storeDir, playlists, catalog, playlistSparse, embeddingShape)
+
+
+def writeMatrix(storeDir, playlistSparse):
+    playlistSparse = csr_matrix(playlistSparse)
+    playlistSparse.sort_indices()
+    saveArray(storeDir, "playlistSparse.indptr", playlistSparse.indptr)
+    saveArray(storeDir, "playlistSparse.indices", playlistSparse.indices)
+    saveArray(storeDir, "playlistSparse.data", playlistSparse.data.astype(np.float32))
+    return playlistSparse
+
+
+def loadMatrix(storeDir, shape):
+    return csr_matrix((loadArray(storeDir, "playlistSparse.data"),
+                       loadArray(storeDir, "playlistSparse.indices"),
+                       loadArray(storeDir, "playlistSparse.indptr")),
+                      shape=tuple(shape), copy=False)
+
+
+def writeTracks(storeDir, uris, names, artists, sparseIds):
+    saveStrings(storeDir, "tracks.uri", uris)
+    saveStrings(storeDir, "tracks.name", names)
+    saveStrings(storeDir, "tracks.artist", artists)
+    saveArray(storeDir, "tracks.sparse_id", np.asarray(sparseIds))
+
+
+def writePlaylists(storeDir, playlists, catalog):
+    saveArray(storeDir, "playlists.playlist_id", playlists["Playlist ID"].to_numpy(dtype=np.int64))
+    saveArray(storeDir, "playlists.track_id", catalog.toIds(playlists["Track URI"]).astype(np.int32))
+    saveStrings(storeDir, "playlists.name", playlists["Playlist Name"].values)
+
+
+def writeTables(storeDir, playlists, catalog, playlistSparse, embeddingShape, fingerprint=None):
+    """
+    Write the matrix, catalog and playlist columns and the manifest, next
+    to embeddings already written with embeddingShape = (rows, dim).
+    fingerprint is the matrix's matrixFingerprint when already known.
+    """
+    playlistSparse = writeMatrix(storeDir, playlistSparse)
+    writeTracks(storeDir, catalog.uris, catalog.names, catalog.artists, catalog.sparseIds)
+    if isinstance(playlists, DataStore):
+        numPlaylistRows = copyPlaylists(playlists, storeDir)
+    else:
+        writePlaylists(storeDir, playlists, catalog)
+        numPlaylistRows = len(playlists)
+
+    return writeManifest(storeDir, playlistSparse.shape, playlistSparse.nnz, len(catalog),
+                         max(catalog.numColumns, playlistSparse.shape[1]), embeddingShape, numPlaylistRows,
+                         catalog.fingerprint(), fingerprint or matrixFingerprint(playlistSparse))
+
+
+def copyPlaylists(store, storeDir):
+    """
+    Write the playlist columns of a store and its segments as one set of
+    columns, streamed a segment at a time. Returns the number of rows.
+    """
+    playlistIDs = ColumnWriter(storeDir, "playlists.playlist_id", np.int64)
+    trackIDs = ColumnWriter(storeDir, "playlists.track_id", np.int32)
+    names = StringColumnWriter(storeDir, "playlists.name")
+    for directory in store.directories():
+        playlistIDs.append(loadArray(directory, "playlists.playlist_id"))
+        trackIDs.append(loadArray(directory, "playlists.track_id"))
+        names.append(loadStrings(directory, "playlists.name"))
+    for writer in (playlistIDs, trackIDs, names):
+        writer.close()
+    return playlistIDs.length
+
+
+def writeManifest(storeDir, shape, nnz, numTracks, numColumns, embeddingShape, numPlaylistRows, tracksFingerprint,
+                  fingerprint=None):
+    """
+    Write manifest.json. The matrix fingerprint is recorded so loading the
+    store does not rehash the matrix; without one it is computed from the
+    matrix files already written.
+    """
+    numEmbeddings, dim = embeddingShape
+    if fingerprint is None:
+        fingerprint = matrixFingerprint(loadMatrix(storeDir, shape))
+    manifest = {
+        "version": VERSION,
+        "playlistSparse": {"shape": [int(n) for n in shape], "nnz": int(nnz), "fingerprint": fingerprint},
+        "tracks": {"rows": int(numTracks), "numColumns": int(numColumns), "fingerprint": tracksFingerprint},
+        "embeddings": {"rows": int(numEmbeddings), "dim": int(dim)},
+        "playlists": {"rows": int(numPlaylistRows)},
+    }
+    with open(os.path.join(storeDir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def writeSegment(storeDir, rows, rowOffset, playlists, catalog, firstTrackID):
+    """
+    Write one delta segment: the matrix rows starting at rowOffset, the
+    catalog tracks from firstTrackID on and the new playlist rows.
+    The segment directory only appears once it is complete.
+    """
+    segmentsDir = os.path.join(storeDir, "segments")
+    os.makedirs(segmentsDir, exist_ok=True)
+    segmentDir = os.path.join(segmentsDir, f"{len(listSegments(storeDir)):06d}")
+    tmpDir = segmentDir + ".tmp"
+    shutil.rmtree(tmpDir, ignore_errors=True)
+    os.makedirs(tmpDir)
+
+    rows = writeMatrix(tmpDir, rows)
+    ids = np.arange(firstTrackID, len(catalog))
+    writeTracks(tmpDir, catalog.uris[ids], catalog.names[ids], catalog.artists[ids], catalog.sparseIds[ids])
+    writePlaylists(tmpDir, playlists, catalog)
+    manifest = {
+        "rowOffset": rowOffset,
+        "playlistSparse": {"shape": list(rows.shape), "nnz": int(rows.nnz)},
+        "tracks": {"rows": len(catalog) - firstTrackID, "firstID": firstTrackID},
+        "playlists": {"rows": len(playlists)},
+    }
+    with open(os.path.join(tmpDir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmpDir, segmentDir)
+    return manifest
+
+
+def listSegments(storeDir):
+    """
+    Complete segment directories of a store, oldest first
+    """
+    segmentsDir = os.path.join(storeDir, "segments")
+    if not os.path.isdir(segmentsDir):
+        return []
+    return [os.path.join(segmentsDir, name) for name in sorted(os.listdir(segmentsDir)) if name.isdigit()]
+
+
+def compactStore(storeDir, playlists, catalog, playlistSparse, embeddings=None, fingerprint=None):
+    """
+    Rewrite a store from the merged playlists, catalog and matrix, dropping
+    its segments. playlists is a DataFrame or the DataStore being compacted,
+    whose playlist columns are then copied over. Tracks appended since the embeddings were written get
+    empty, invalid embedding rows. The new store is built next to the old
+    one and swapped in when complete. fingerprint is the merged matrix's
+    matrixFingerprint when already known.
+    """
+    newDir = storeDir.rstrip(os.sep) + ".compact"
+    shutil.rmtree(newDir, ignore_errors=True)
+    os.makedirs(newDir)
+
+    matrix, valid = embeddings if embeddings is not None else (np.zeros((0, 0), dtype=np.float32), np.zeros(0, bool))
+    missing = len(catalog) - len(matrix)
+    matrix = np.vstack([matrix, np.zeros((missing, matrix.shape[1]), dtype=np.float32)])
+    valid = np.concatenate([valid, np.zeros(missing, dtype=bool)])
+    embeddingShape = writeEmbeddings(newDir, matrix, valid, catalog.fingerprint())
+    manifest = writeTables(newDir, playlists, catalog, playlistSparse, embeddingShape, fingerprint)
+    replaceStore(storeDir, newDir)
+    return manifest
+
+
+def replaceStore(storeDir, newDir):
+    """
+    Swap a completely written store directory in for storeDir
+    """
+    oldDir = storeDir.rstrip(os.sep) + ".old"
+    shutil.rmtree(oldDir, ignore_errors=True)
+    if os.path.exists(storeDir):
+        os.replace(storeDir, oldDir)
+    os.replace(newDir, storeDir)
+    shutil.rmtree(oldDir, ignore_errors=True)
+
+
+class DataStore:
+    """
+    Read-only view over a store directory written by writeStore.
+    Nothing beyond the manifest is read until a column is touched.
+    """
+
+    def __init__(self, storeDir):
+        self.storeDir = storeDir
+        with open(os.path.join(storeDir, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != VERSION:
+            raise ValueError(f"Unsupported store version {self.manifest['version']}")
+
+    @staticmethod
+    def exists(storeDir):
+        return os.path.exists(os.path.join(storeDir, "manifest.json"))
+
+    def playlistSparse(self):
+        """
+        The base playlist matrix, without the delta segments
+        """
+        return loadMatrix(self.storeDir, self.manifest["playlistSparse"]["shape"])
+
+    def segments(self):
+        """
+        (manifest, directory) of every delta segment, oldest first
+        """
+        segments = []
+        for segmentDir in listSegments(self.storeDir):
+            with open(os.path.join(segmentDir, "manifest.json")) as f:
+                segments.append((json.load(f), segmentDir))
+        return segments
+
+    def directories(self):
+        """
+        The store directory followed by every segment directory
+        """
+        return [self.storeDir] + [segmentDir for _, segmentDir in self.segments()]
+
+    def deltas(self):
+        """
+        Matrix rows of every delta segment, in order
+        """
+        return [loadMatrix(segmentDir, manifest["playlistSparse"]["shape"]) for manifest, segmentDir in self.segments()]
+
+    def catalog(self):
+        """
+        Track catalog with the tracks of every delta segment appended
+        """
+        catalog = TrackCatalog(loadStrings(self.storeDir, "tracks.uri"),
+                               loadStrings(self.storeDir, "tracks.name"),
+                               loadStrings(self.storeDir, "tracks.artist"),
+                               loadArray(self.storeDir, "tracks.sparse_id"),
+                               numColumns=self.manifest["tracks"]["numColumns"])
+        for manifest, segmentDir in self.segments():
+            if manifest["tracks"]["firstID"] != len(catalog):
+                raise ValueError(f"Segment {segmentDir} does not follow the catalog")
+            catalog.append(loadStrings(segmentDir, "tracks.uri").toArray(),
+                           loadStrings(segmentDir, "tracks.name").toArray(),
+                           loadStrings(segmentDir, "tracks.artist").toArray())
+        return catalog
+
+    def songsFrame(self, catalog=None):
+        """
+        Deduplicated songs DataFrame indexed by Track URI, without the
+        lyrics embeddings, which are read through embeddings()
+        """
+        catalog = catalog if catalog is not None else self.catalog()
+        songs = pd.DataFrame({
+            "Track Name": catalog.names.toArray(),
+            "Artist Name": catalog.artists.toArray(),
+            "sparse_id": np.asarray(catalog.sparseIds),
+        }, index=pd.Index(catalog.uris.toArray(), name="Track URI"))
+        return songs
+
+    def embeddings(self, catalog=None):
+        """
+        Memory-mapped (matrix, valid) lyrics embeddings aligned with the
+        catalog. Raises ValueError when they were written for another catalog.
+        """
+        matrix, valid = loadEmbeddings(self.storeDir)
+        tracks = self.manifest["tracks"]
+        # The manifest's fingerprint covers the base tracks, which the embeddings normally do too
+        known = tracks.get("fingerprint") if len(matrix) == tracks["rows"] else None
+        catalog = catalog if catalog is not None else self.catalog()
+        if not matchesCatalog(self.storeDir, matrix, catalog, known):
+            raise ValueError(f"The embeddings in {self.storeDir} were written for another track catalog, "
+                             f"rewrite them for this store")
+        return matrix, valid
+
+    def playlistNames(self):
+        """
+        Playlist Name per Playlist ID, decoding only the first row of every playlist
+        """
+        ids, names = [], []
+        for directory in self.directories():
+            playlistIDs, first = np.unique(np.asarray(loadArray(directory, "playlists.playlist_id")),
+                                           return_index=True)
+            ids.append(playlistIDs)
+            names.append(loadStrings(directory, "playlists.name")[first])
+        return pd.Series(np.concatenate(names), index=pd.Index(np.concatenate(ids), name="Playlist ID"),
+                         name="Playlist Name")
+
+    def playlistsFrame(self, catalog=None):
+        catalog = catalog if catalog is not None else self.catalog()
+        uris = catalog.uris.toArray() if hasattr(catalog.uris, "toArray") else np.asarray(catalog.uris, dtype=object)
+        frames = []
+        for directory in self.directories():
+            trackIDs = np.asarray(loadArray(directory, "playlists.track_id"))
+            frames.append(pd.DataFrame({
+                "Playlist Name": loadStrings(directory, "playlists.name").toArray(),
+                "Playlist ID": np.asarray(loadArray(directory, "playlists.playlist_id")),
+                "Track URI": np.where(trackIDs >= 0, uris[trackIDs], None),
+            }))
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def convertPickles(dataDir, storeDir):
+    """
+    Convert playlists.pkl, tracks.pkl and playlistSparse.pkl into a store
+    """
+    playlists = pd.read_pickle(os.path.join(dataDir, "playlists.pkl"))
+    songs = pd.read_pickle(os.path.join(dataDir, "tracks.pkl"))
+    playlistSparse = pd.read_pickle(os.path.join(dataDir, "playlistSparse.pkl"))
+    return writeStore(storeDir, playlists, songs, playlistSparse)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataDir")
+    parser.add_argument("storeDir")
+    args = parser.parse_args()
+    manifest = convertPickles(args.dataDir, args.storeDir)
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
+import os
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-def plot_histogram(ax, title, xlabel, ylabel, data):
+def plot_histogram(ax, title, xlabel, ylabel, data, bins=10, weights=None):
     try:
-        ax.hist(data, density=True)
+        ax.hist(data, bins=bins, weights=weights, density=True)
         ax.set_title(title)
         ax.set_xlabel(xlabel)
         ax.set_ylabel(ylabel)
@@ -22,49 +24,65 @@ def plot_bar_chart(ax, title, xlabel, ylabel, x_positions, heights, labels):
     except Exception as e:
         print(f"Error plotting bar chart: {e}")
 
-def displayPopularArtists(df, limit=100):
+# The display functions render a precomputed util.analytics profile
+
+def displayPopularArtists(profile, limit=100, figsDir="figs"):
     try:
-        artist_counts = {}
-        for playlist in df['Track URI']:
-            for song in playlist:
-                artist_name = song["Artist Name"]
-                if artist_name in artist_counts:
-                    artist_counts[artist_name] += 1
-                else: 
-                    artist_counts[artist_name] = 1
-        
-        sorted_artists = sorted(artist_counts.items(), key=lambda x: x[1], reverse=True)[:limit]
-        artists, counts = zip(*sorted_artists)
-        
+        artists = profile["artists"]["names"][:limit]
+        counts = profile["artists"]["counts"][:limit]
+
         fig, ax = plt.subplots(figsize=(12, 5))
         plot_bar_chart(ax, "Number of Playlist Appearances by Top Artists",
-                       "Artist", "Number of Appearances", np.arange(limit), counts, artists)
-        plt.savefig("figs/popular_artists.png")
+                       "Artist", "Number of Appearances", np.arange(len(counts)), counts, artists)
+        plt.savefig(os.path.join(figsDir, "popular_artists.png"))
+        plt.close(fig)
     except Exception as e:
         print(f"Error in display_popular_artists: {e}")
 
-def displayMostCommonKeyWord(df):
+def displayPopularTracks(profile, limit=100, figsDir="figs"):
     try:
-        playlist_names = df['Playlist Name'].tolist()
-        keywords = [word for name in playlist_names for word in name.split() if word]
-        keyword_counts = {word: keywords.count(word) for word in set(keywords)}
-        sorted_keywords = sorted(keyword_counts.items(), key=lambda x: x[1], reverse=True)[:20]
-        words, counts = zip(*sorted_keywords)
-        
+        tracks = profile["tracks"]
+        labels = [f"{name} - {artist}" for name, artist in zip(tracks["names"][:limit], tracks["artists"][:limit])]
+        counts = tracks["counts"][:limit]
+
+        fig, ax = plt.subplots(figsize=(12, 5))
+        plot_bar_chart(ax, "Number of Playlist Appearances by Top Tracks",
+                       "Track", "Number of Appearances", np.arange(len(counts)), counts, labels)
+        plt.savefig(os.path.join(figsDir, "popular_tracks.png"))
+        plt.close(fig)
+    except Exception as e:
+        print(f"Error in display_popular_tracks: {e}")
+
+def displayMostCommonKeyWord(profile, limit=20, figsDir="figs"):
+    try:
+        words = profile["keywords"]["words"][:limit]
+        counts = profile["keywords"]["counts"][:limit]
+
         fig, ax = plt.subplots(figsize=(12, 5))
         plot_bar_chart(ax, "Most Common Words in Playlist Titles",
                        "Keyword", "Frequency", np.arange(len(words)), counts, words)
-        plt.savefig("figs/keyword_frequency.png")
+        plt.savefig(os.path.join(figsDir, "keyword_frequency.png"))
+        plt.close(fig)
     except Exception as e:
         print(f"Error in display_most_common_keywords: {e}")
 
-def displayPlaylistLengthDistribution(df):
+def displayPlaylistLengthDistribution(profile, bins=50, figsDir="figs"):
     try:
-        playlist_lengths = [len(playlist) for playlist in df['Track URI']]
-        
+        # Histogram of the per-length playlist counts, weighted instead of expanded
+        counts = np.asarray(profile["lengthCounts"])
+        lengths = np.arange(len(counts))
+
         fig, ax = plt.subplots(figsize=(10, 5))
         plot_histogram(ax, "Distribution of Number of Tracks per Playlist",
-                       "Number of Tracks", "Distribution", playlist_lengths)
-        plt.savefig("figs/playlist_length_distribution.png")
+                       "Number of Tracks", "Distribution", lengths, bins=bins, weights=counts)
+        plt.savefig(os.path.join(figsDir, "playlist_length_distribution.png"))
+        plt.close(fig)
     except Exception as e:
         print(f"Error in display_playlist_length_distribution: {e}")
+
+def displayAll(profile, figsDir="figs"):
+    os.makedirs(figsDir, exist_ok=True)
+    displayPopularArtists(profile, figsDir=figsDir)
+    displayPopularTracks(profile, figsDir=figsDir)
+    displayMostCommonKeyWord(profile, figsDir=figsDir)
+    displayPlaylistLengthDistribution(profile, figsDir=figsDir)